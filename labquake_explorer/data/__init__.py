@@ -2,5 +2,22 @@
 from labquake_explorer.data.data_manager import DataManager
 from labquake_explorer.data.file_handler import FileHandler
 from labquake_explorer.data.event_processor import EventProcessor
+from labquake_explorer.data.czm_fitter import CZMFitter
+from labquake_explorer.data.arrival_picker import ArrivalPicker
+from labquake_explorer.data.time_delay import TimeDelayEstimator
+from labquake_explorer.data.rupture_speed import RuptureSpeedEstimator
+from labquake_explorer.data.event_detector import EventDetector
+from labquake_explorer.data.stream_detector import StreamingDetector
+from labquake_explorer.data.template_matcher import TemplateMatcher
+from labquake_explorer.data.event_analyzer import EventAnalyzer
+from labquake_explorer.data.event_catalog import EventCatalog
+from labquake_explorer.data.event_tensor import EventRecord, EventTensor
+from labquake_explorer.data.event_stacker import EventStacker
+from labquake_explorer.data.event_similarity import EventSimilarity
+from labquake_explorer.data.raw_strain_array import RawStrainArray
+from labquake_explorer.data.uniform_time_axis import UniformTimeAxis
 
-__all__ = ['DataManager', 'FileHandler', 'EventProcessor']
\ No newline at end of file
+__all__ = ['DataManager', 'FileHandler', 'EventProcessor', 'CZMFitter', 'ArrivalPicker', 'TimeDelayEstimator', 'RuptureSpeedEstimator',
+           'EventDetector', 'StreamingDetector', 'TemplateMatcher',
+           'EventAnalyzer', 'EventCatalog', 'EventRecord', 'EventTensor',
+           'EventStacker', 'EventSimilarity', 'RawStrainArray', 'UniformTimeAxis']
\ No newline at end of file
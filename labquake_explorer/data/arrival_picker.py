@@ -0,0 +1,200 @@
+"""Automatic rupture arrival picking for Labquake Explorer"""
+import numpy as np
+from typing import Dict, Any, List, Optional, Sequence
+from labquake_explorer.data.rupture_speed import RuptureSpeedEstimator
+
+
+class ArrivalPicker:
+    """Picks sub-sample arrivals on all channels of an event at once.
+
+    All pickers work on an (n_channels, n_samples) array and return fractional
+    sample indices, NaN where a channel has no pick.
+
+    Methods:
+        'aic': Minimum of the Akaike information criterion (Maeda, 1985), refined by
+            parabolic interpolation.
+        'sta_lta': First crossing of the short-term/long-term average ratio of the
+            squared signal above a threshold, linearly interpolated.
+        'derivative': First crossing of the absolute derivative above a multiple of
+            its pre-event noise level, linearly interpolated.
+        'peak': Maximum of the signal (or minimum for polarity=-1), refined by
+            parabolic interpolation.
+    """
+
+    methods = ('aic', 'sta_lta', 'derivative', 'peak')
+
+    def __init__(self, method: str = 'aic', n_sta: int = 20, n_lta: int = 200, threshold: float = 3.0,
+                 noise_fraction: float = 0.1, polarity: int = 1):
+        if method not in self.methods:
+            raise ValueError(f"Unknown picking method: {method}")
+        self.method = method
+        self.n_sta = n_sta                    # STA window (samples)
+        self.n_lta = n_lta                    # LTA window (samples)
+        self.threshold = threshold            # STA/LTA ratio, or multiple of derivative noise
+        self.noise_fraction = noise_fraction  # Leading fraction of the window used as noise
+        self.polarity = polarity              # Sign of the 'peak' extremum
+
+    def pick(self, y: np.ndarray, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Pick arrivals on every channel within y[:, start:stop].
+
+        Args:
+            y: Signals of shape (n_channels, n_samples)
+            start: First sample of the search window
+            stop: End of the search window (exclusive); end of the record if None
+
+        Returns:
+            Fractional sample indices into y, shape (n_channels,)
+        """
+        y = np.atleast_2d(np.asarray(y, dtype=float))
+        stop = y.shape[1] if stop is None else min(stop, y.shape[1])
+        start = max(0, start)
+        if stop - start < 3:
+            return np.full(y.shape[0], np.nan)
+        window = y[:, start:stop]
+
+        if self.method == 'aic':
+            picks = self.parabolic_extremum(self.aic(window), minimum=True)
+        elif self.method == 'sta_lta':
+            picks = self.first_crossing(self.sta_lta(window), self.threshold)
+        elif self.method == 'derivative':
+            cf = np.abs(np.gradient(window, axis=-1))
+            n_noise = max(2, int(window.shape[1] * self.noise_fraction))
+            noise = cf[:, :n_noise].std(axis=-1) + cf[:, :n_noise].mean(axis=-1)
+            picks = self.first_crossing(cf / np.where(noise > 0, noise, np.inf)[:, np.newaxis], self.threshold)
+        else:
+            picks = self.parabolic_extremum(self.polarity * window, minimum=False)
+        return picks + start
+
+    @staticmethod
+    def aic(y: np.ndarray) -> np.ndarray:
+        """AIC(k) = k log var(y[:k]) + (n - k - 1) log var(y[k:]) for every k, from cumulative sums."""
+        n = y.shape[-1]
+        y = y - y.mean(axis=-1, keepdims=True)
+        c1 = np.cumsum(y, axis=-1)
+        c2 = np.cumsum(y ** 2, axis=-1)
+        k = np.arange(1, n + 1, dtype=float)
+        var_before = c2 / k - (c1 / k) ** 2
+        n_after = n - k
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s1 = c1[..., -1:] - c1
+            s2 = c2[..., -1:] - c2
+            var_after = s2 / n_after - (s1 / n_after) ** 2
+            result = k * np.log(var_before) + (n_after - 1) * np.log(var_after)
+        # The variance of one or two samples is meaningless
+        result[..., :2] = np.inf
+        result[..., -2:] = np.inf
+        return np.where(np.isfinite(result), result, np.inf)
+
+    def sta_lta(self, y: np.ndarray) -> np.ndarray:
+        """Ratio of trailing short- and long-term averages of the squared, demeaned signal."""
+        n_noise = max(2, int(y.shape[-1] * self.noise_fraction))
+        energy = (y - y[..., :n_noise].mean(axis=-1, keepdims=True)) ** 2
+        c = np.concatenate([np.zeros(energy.shape[:-1] + (1,)), np.cumsum(energy, axis=-1)], axis=-1)
+        idx = np.arange(energy.shape[-1])
+        sta = (c[..., idx + 1] - c[..., np.maximum(idx + 1 - self.n_sta, 0)]) / np.minimum(idx + 1, self.n_sta)
+        lta = (c[..., idx + 1] - c[..., np.maximum(idx + 1 - self.n_lta, 0)]) / np.minimum(idx + 1, self.n_lta)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(lta > 0, sta / lta, 0.0)
+        ratio[..., :self.n_lta] = 0.0  # LTA not yet established
+        return ratio
+
+    @staticmethod
+    def parabolic_extremum(cf: np.ndarray, minimum: bool) -> np.ndarray:
+        """Extremum of each row, refined with a parabola through its neighbors."""
+        idx = np.argmin(cf, axis=-1) if minimum else np.argmax(cf, axis=-1)
+        rows = np.arange(cf.shape[0])
+        inner = (idx > 0) & (idx < cf.shape[-1] - 1)
+        i = np.clip(idx, 1, cf.shape[-1] - 2)
+        left, center, right = cf[rows, i - 1], cf[rows, i], cf[rows, i + 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            denom = left - 2 * center + right
+            shift = np.where(inner & np.isfinite(denom) & (denom != 0), 0.5 * (left - right) / denom, 0.0)
+        shift = np.where(np.isfinite(shift), np.clip(shift, -0.5, 0.5), 0.0)
+        picks = idx + shift
+        return np.where(np.all(~np.isfinite(cf), axis=-1), np.nan, picks)
+
+    @staticmethod
+    def first_crossing(cf: np.ndarray, threshold: float) -> np.ndarray:
+        """First sample where each row exceeds threshold, linearly interpolated."""
+        above = cf > threshold
+        found = above.any(axis=-1)
+        idx = np.argmax(above, axis=-1)
+        rows = np.arange(cf.shape[0])
+        prev = cf[rows, np.maximum(idx - 1, 0)]
+        curr = cf[rows, idx]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frac = np.where((idx > 0) & (curr != prev), (threshold - prev) / (curr - prev), 1.0)
+        picks = idx - 1 + np.clip(frac, 0.0, 1.0)
+        picks = np.where(idx == 0, 0.0, picks)
+        return np.where(found, picks, np.nan)
+
+    @staticmethod
+    def index_to_time(time: np.ndarray, picks: np.ndarray) -> np.ndarray:
+        """Interpolate a time vector at fractional sample indices."""
+        return np.interp(picks, np.arange(len(time)), time, left=np.nan, right=np.nan)
+
+    def pick_run(self, events: List[Dict[str, Any]], enabled_channels: Optional[Sequence[bool]] = None,
+                 fitting_channels: Optional[Sequence[bool]] = None, locations: Optional[Sequence[float]] = None,
+                 pipeline=None, search_window: Optional[tuple] = None) -> np.ndarray:
+        """Pick every event of a run and store picked_idx, rupture_arrival_time and rupture_speed.
+
+        Channel selections and locations saved in an event take precedence over the
+        defaults given here. Rupture speeds are fitted robustly with RuptureSpeedEstimator,
+        which also stores rupture_speed_uncertainty.
+
+        Args:
+            events: Events of a run, as extracted by EventProcessor
+            enabled_channels: Default channels to pick
+            fitting_channels: Default channels used for the rupture speed
+            locations: Default gauge locations along the fault (mm)
+            pipeline: Optional FilterPipeline applied before picking
+            search_window: Optional (start, end) times relative to event_time
+
+        Returns:
+            Rupture speeds of all events (m/s)
+        """
+        n_events = len(events)
+        if n_events == 0:
+            return np.array([])
+        n_channels = max(len(event["strain"]["original"]["raw"]) for event in events)
+        arrival_times = np.full((n_events, n_channels), np.nan)
+        all_locations = np.full((n_events, n_channels), np.nan)
+        fit_mask = np.zeros((n_events, n_channels), dtype=bool)
+
+        for k, event in enumerate(events):
+            strain = event["strain"]
+            original = strain["original"]
+            y = np.asarray(original["raw"], dtype=float)
+            if pipeline:
+                y = pipeline.apply(y)
+            t = np.asarray(original["time"], dtype=float)
+            start, stop = 0, None
+            if search_window is not None:
+                start, stop = np.searchsorted(t - event["event_time"], search_window)
+
+            picks = self.pick(y, start, stop)
+            enabled = np.asarray(strain.get("enabled_channels", enabled_channels if enabled_channels is not None
+                                            else [True] * len(y)), dtype=bool)
+            picks = np.where(enabled[:len(picks)], picks, np.nan)
+
+            picked_idx = list(original.get("picked_idx", [len(t) // 2] * len(y)))
+            for j in np.flatnonzero(np.isfinite(picks)):
+                picked_idx[j] = int(round(picks[j]))
+            original["picked_idx"] = picked_idx
+            arrival = self.index_to_time(t, np.where(np.isfinite(picks), picks, picked_idx))
+            original["rupture_arrival_time"] = arrival
+
+            fitting = strain.get("fitting_channels", fitting_channels)
+            loc = strain.get("locations", locations)
+            if fitting is not None and loc is not None:
+                n = min(len(y), len(fitting), len(loc))
+                arrival_times[k, :n] = np.where(np.isfinite(picks[:n]), arrival[:n], np.nan)
+                all_locations[k, :n] = np.asarray(loc[:n], dtype=float)
+                fit_mask[k, :n] = np.asarray(fitting[:n], dtype=bool)
+
+        speeds, uncertainties, _ = RuptureSpeedEstimator().speeds(arrival_times, all_locations, fit_mask)
+        for event, speed, uncertainty in zip(events, speeds, uncertainties):
+            if np.isfinite(speed):
+                event["rupture_speed"] = float(speed)
+                event["rupture_speed_uncertainty"] = float(uncertainty)
+        return speeds
@@ -0,0 +1,185 @@
+"""Cohesive zone model fitting for Labquake Explorer"""
+import numpy as np
+from scipy import optimize
+from typing import Dict, Any, List, Sequence, Union
+from labquake_explorer.utils.cohesive_crack import CohesiveCrack
+from labquake_explorer.data.data_processor import DataProcessor
+
+
+class CZMFitter:
+    """Fits the cohesive zone model to shear strain records of one or more gauges."""
+
+    def __init__(self, E: float = 51e9, nu: float = 0.25, C_s: float = 2760, C_d: float = 4790):
+        self.E = E          # Young's modulus (Pa)
+        self.nu = nu        # Poisson's ratio
+        self.C_s = C_s      # Shear wave speed (m/s)
+        self.C_d = C_d      # Longitudinal wave speed (m/s)
+
+    def model_strain(self, t: np.ndarray, t_tip: Union[float, np.ndarray], y: Union[float, np.ndarray],
+                     Cf: float, Xc: float, Gc: float) -> np.ndarray:
+        """Shear strain predicted by the model at times t for a tip passing at t_tip.
+
+        t_tip and y may be arrays of the same shape as t, so several gauges can be
+        evaluated in one call.
+        """
+        x = -(t - t_tip) * Cf
+        delta_sigma_xx, delta_sigma_xy, delta_sigma_yy = CohesiveCrack.delta_sigmas(
+            x, y, Xc, Cf, self.C_s, self.C_d, self.nu, Gc, self.E
+        )
+        _, delta_e_xy, _ = DataProcessor.stress_to_strain(
+            self.E, self.nu, delta_sigma_xx, delta_sigma_xy, delta_sigma_yy
+        )
+        return delta_e_xy
+
+    def fit_single(self, t: np.ndarray, exy: np.ndarray, t_tip: float, t_end: float, Cf: float, y: float,
+                   Gc: float, Xc: float) -> Dict[str, Any]:
+        """Fit Gc and Xc to one gauge between the tip arrival and the window end.
+
+        Model and data are both zeroed at t_end. The fitter holds no state besides its
+        material properties, so this can run in a worker process.
+
+        Args:
+            t: Time of the gauge record relative to the event time (s)
+            exy: Shear strain of the gauge
+            t_tip: Tip arrival time, start of the fitting window (s)
+            t_end: End of the fitting window (s)
+            Cf: Rupture speed (m/s), held fixed
+            y: Distance of the gauge from the fault (m), held fixed
+            Gc: Initial fracture energy
+            Xc: Initial cohesive zone size
+
+        Returns:
+            Dictionary with the fitted 'Gc', 'Xc' and the optimizer status
+        """
+        mask = (t >= t_tip) & (t <= t_end)
+        t_fit = t[mask]
+        exy_fit = np.array(exy[mask], dtype=float)
+        if len(t_fit) < 2:
+            raise ValueError("Fitting window is outside the data")
+        idx_zero = np.argmin(np.abs(t_fit - t_end))
+        exy_fit -= exy_fit[idx_zero]
+
+        def objective(params):
+            model = self.model_strain(t_fit, t_tip, y, Cf, params[1], params[0])
+            return np.sum(((exy_fit - (model - model[idx_zero])) * 1e9) ** 2)
+
+        result = optimize.minimize(objective, [Gc, Xc], bounds=((1e-6, None), (1e-6, None)), method='L-BFGS-B')
+        return {
+            'Gc': float(result.x[0]),
+            'Xc': float(result.x[1]),
+            'success': bool(result.success),
+            'message': str(result.message)
+        }
+
+    def fit_joint(self, t: np.ndarray, exy: np.ndarray, t_tips: Sequence[float], ys: Sequence[float],
+                  window: tuple, Cf: float, Gc: float, Xc: float, fit_Xc: bool = True,
+                  fit_offsets: bool = True, fit_y: bool = True) -> Dict[str, Any]:
+        """Fit a shared fracture energy to several gauges at once.
+
+        Each gauge keeps its own rupture tip arrival time and distance from the fault,
+        while Gc (and optionally Xc) is shared. All gauges are stacked into a single
+        residual vector so the model is evaluated in one kernel call per iteration.
+
+        Args:
+            t: Time vector shared by all gauges (s)
+            exy: Shear strain of the fitted gauges, shape (n_gauges, len(t))
+            t_tips: Initial tip arrival time of each gauge (s)
+            ys: Initial distance of each gauge from the fault (m)
+            window: (before, after) extent of each gauge's fitting window relative
+                to its tip arrival (s); the data are zeroed at the window end
+            Cf: Rupture speed (m/s), held fixed
+            Gc: Initial fracture energy
+            Xc: Initial cohesive zone size
+            fit_Xc: Fit Xc as a shared parameter, otherwise hold it fixed
+            fit_offsets: Fit per-gauge tip arrival times
+            fit_y: Fit per-gauge distances from the fault
+
+        Returns:
+            Dictionary with the fitted 'Gc', 'Xc', 't_tips', 'ys' and the optimizer status
+        """
+        exy = np.atleast_2d(np.asarray(exy, dtype=float))
+        t_tips = np.asarray(t_tips, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        n_gauges = exy.shape[0]
+        if len(t_tips) != n_gauges or len(ys) != n_gauges:
+            raise ValueError("t_tips and ys must have one entry per gauge")
+
+        # Stack the fitting window of every gauge into one vector
+        segments = []
+        for i in range(n_gauges):
+            idx = np.flatnonzero((t >= t_tips[i] + window[0]) & (t <= t_tips[i] + window[1]))
+            if len(idx) < 2:
+                raise ValueError(f"Fitting window of gauge {i} is outside the data")
+            segments.append(idx)
+        lengths = np.array([len(idx) for idx in segments])
+        gauge_of_sample = np.repeat(np.arange(n_gauges), lengths)
+        zero_idx = np.cumsum(lengths) - 1
+        t_stack = np.concatenate([t[idx] for idx in segments])
+        exy_stack = np.concatenate([exy[i, idx] for i, idx in enumerate(segments)])
+        exy_stack -= exy_stack[zero_idx][gauge_of_sample]
+
+        # Parameter vector: [Gc, (Xc), (t_tips...), (ys...)]
+        x0 = [Gc] + ([Xc] if fit_Xc else [])
+        lower = [1e-6] + ([1e-6] if fit_Xc else [])
+        upper = [np.inf] + ([np.inf] if fit_Xc else [])
+        if fit_offsets:
+            span = window[1] - window[0]
+            x0 += list(t_tips)
+            lower += list(t_tips - span)
+            upper += list(t_tips + span)
+        if fit_y:
+            x0 += list(ys)
+            lower += [1e-5] * n_gauges
+            upper += [np.inf] * n_gauges
+
+        def unpack(params):
+            Gc_value = params[0]
+            i = 1
+            Xc_value = Xc
+            if fit_Xc:
+                Xc_value = params[i]
+                i += 1
+            tips = t_tips
+            if fit_offsets:
+                tips = params[i:i + n_gauges]
+                i += n_gauges
+            distances = ys
+            if fit_y:
+                distances = params[i:i + n_gauges]
+            return Gc_value, Xc_value, tips, distances
+
+        def residuals(params):
+            Gc_value, Xc_value, tips, distances = unpack(params)
+            model = self.model_strain(t_stack, tips[gauge_of_sample], distances[gauge_of_sample],
+                                      Cf, Xc_value, Gc_value)
+            model -= model[zero_idx][gauge_of_sample]
+            return (exy_stack - model) * 1e9
+
+        result = optimize.least_squares(
+            residuals,
+            np.asarray(x0, dtype=float),
+            bounds=(np.asarray(lower, dtype=float), np.asarray(upper, dtype=float)),
+            x_scale='jac'
+        )
+
+        Gc_fit, Xc_fit, tips_fit, ys_fit = unpack(result.x)
+        return {
+            'Gc': float(Gc_fit),
+            'Xc': float(Xc_fit),
+            't_tips': [float(v) for v in tips_fit],
+            'ys': [float(v) for v in ys_fit],
+            'cost': float(result.cost),
+            'success': bool(result.success),
+            'message': result.message
+        }
+
+    @staticmethod
+    def arrival_offsets(event: Dict[str, Any], gauges: List[int], reference: int) -> np.ndarray:
+        """Picked arrival times of gauges relative to a reference gauge, zero if not picked."""
+        original = event["strain"]["original"]
+        if "rupture_arrival_time" not in original:
+            return np.zeros(len(gauges))
+        arrivals = np.asarray(original["rupture_arrival_time"], dtype=float)
+        if len(arrivals) <= max(max(gauges), reference):
+            return np.zeros(len(gauges))
+        return arrivals[gauges] - arrivals[reference]
@@ -1,9 +1,48 @@
 """Data management and processing for Labquake Explorer"""
+import copy
+import re
+import threading
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable
 import numpy as np
 import h5py
 from labquake_explorer.data.event_processor import EventProcessor
+from labquake_explorer.data.filter_cache import FilterCache
+from labquake_explorer.data.event_catalog import EventCatalog
+from labquake_explorer.data.raw_strain_array import RawStrainArray
+from labquake_explorer.data.uniform_time_axis import UniformTimeAxis
+from labquake_explorer.utils.instrumentation import instrumentation
+
+
+# Array-like classes saved to HDF5 as a group tagged with their 'class' attribute
+COMPACT_ARRAY_CLASSES = {cls.hdf5_class: cls for cls in (RawStrainArray, UniformTimeAxis)}
+
+
+class LoadCancelled(Exception):
+    """Raised when reading a data file is cancelled"""
+
+
+class _ProgressReader:
+    """Binary file wrapper reporting bytes read and checking for cancellation"""
+
+    def __init__(self, file, total_bytes: int, progress=None, cancel=None):
+        self.file = file
+        self.total_bytes = total_bytes
+        self.progress = progress
+        self.cancel = cancel
+        self.reads = 0
+
+    def read(self, size=-1):
+        if self.cancel is not None and self.cancel.is_set():
+            raise LoadCancelled("Loading was cancelled")
+        data = self.file.read(size)
+        self.reads += 1
+        if self.progress is not None:
+            self.progress(self.reads, self.file.tell(), self.total_bytes)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
 
 
 class DataManager:
@@ -12,29 +51,70 @@ class DataManager:
         self.data_path: Optional[Path] = None
         self.data: Optional[Dict[str, Any]] = None
         self.event_processor = EventProcessor()
+        self.filter_cache = FilterCache()
+        self.catalog = EventCatalog()
 
-    def load_file(self, path: Path) -> None:
+    def load_file(self, path: Path, progress: Optional[Callable[[int, int, int], None]] = None,
+                  cancel: Optional[threading.Event] = None) -> None:
         """Load data from a file"""
+        self.use_data(path, self.read_file(path, progress, cancel))
+
+    def use_data(self, path: Path, data: Dict[str, Any]) -> None:
+        """Make data read from path (e.g. by read_file on a worker thread) the current data"""
         self.data_path = path
         self.event_processor.set_data_path(path)  # Set the data path in EventProcessor
+        self.filter_cache.clear()
+        self.data = data
+        self.catalog.set_data(self.data)
+
+    @instrumentation.timed('load_file')
+    def read_file(self, path: Path, progress: Optional[Callable[[int, int, int], None]] = None,
+                  cancel: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """Read a data file without changing the current data, so it can run on a worker thread
 
+        Args:
+            path: NPZ or HDF5 file
+            progress: Called as progress(items, bytes_read, total_bytes) while reading;
+                items counts HDF5 groups and datasets read
+            cancel: Reading stops with LoadCancelled soon after this event is set
+
+        Returns:
+            The experiment data
+        """
+        instrumentation.count_bytes('load_file', path.stat().st_size)
         if path.suffix.lower() == '.npz':
-            self._load_npz(path)
+            return self._load_npz(path, progress, cancel)
         elif path.suffix.lower() in ['.h5', '.hdf5']:
-            self._load_hdf5(path)
+            return self._load_hdf5(path, progress, cancel)
         else:
             raise ValueError(f"Unsupported file type: {path.suffix}")
 
-    def _load_npz(self, path: Path) -> None:
+    def _load_npz(self, path: Path, progress=None, cancel=None) -> Dict[str, Any]:
         """Load data from NPZ file"""
-        with np.load(path, allow_pickle=True) as data:
-            self.data = data["experiment"][()]
+        with open(path, 'rb') as raw_file:
+            with np.load(_ProgressReader(raw_file, path.stat().st_size, progress, cancel), allow_pickle=True) as data:
+                return data["experiment"][()]
 
-    def _load_hdf5(self, path: Path) -> None:
+    def _load_hdf5(self, path: Path, progress=None, cancel=None) -> Dict[str, Any]:
         with h5py.File(path, 'r') as h5data:
+            # Metadata-only walk for the total amount to read
+            sizes = []
+            h5data.visititems(lambda name, item: sizes.append(item.nbytes) if isinstance(item, h5py.Dataset) else None)
+            total_bytes = int(sum(sizes))
+            state = {'items': 0, 'bytes': 0}
+
+            def advance(n_bytes=0):
+                if cancel is not None and cancel.is_set():
+                    raise LoadCancelled(f"Loading {path.name} was cancelled")
+                state['items'] += 1
+                state['bytes'] += n_bytes
+                if progress is not None:
+                    progress(state['items'], state['bytes'], total_bytes)
+
             def load_dataset(item):
                 try:
                     data = np.array(item)
+                    advance(item.nbytes)
                     if data.dtype.kind == 'S' or data.dtype.kind == 'O':
                         if isinstance(data.flat[0], bytes):
                             if data.size == 1:
@@ -43,18 +123,25 @@ class DataManager:
                     if data.size == 1:  # Convert length-1 arrays to numbers
                         return data.item()
                     return data
+                except LoadCancelled:
+                    raise
                 except Exception as exc:
                     print(f"Dataset loading error: {str(exc)}")
                     return None
                 
             def load_group(group):
                 result = {}
+                advance()
+                if group.attrs.get('class') in COMPACT_ARRAY_CLASSES:
+                    return COMPACT_ARRAY_CLASSES[group.attrs['class']].load_hdf5(group)
                 
                 keys = list(group.keys())
                 if all(k.isdigit() for k in keys):  # Check if all keys are integers
                     try:
                         num_keys = max(int(k) for k in keys) + 1
-                        return np.array([load_group(group[str(i)]) for i in range(num_keys)])
+                        items = [group[str(i)] for i in range(num_keys)]
+                        return np.array([load_group(item) if isinstance(item, h5py.Group) else load_dataset(item)
+                                         for item in items])
                     except ValueError:
                         pass  # Fall back to dictionary if an error occurs
                     
@@ -65,23 +152,34 @@ class DataManager:
                             result[key] = load_group(item)
                         else:
                             result[key] = load_dataset(item)
+                    except LoadCancelled:
+                        raise
                     except Exception as exc:
                         print(f"Error loading {key}: {str(exc)}")
                 
                 return result
             
-            self.data = load_group(h5data)
+            return load_group(h5data)
 
-    def save_file(self, path: Path) -> None:
-        if not self.data:
+    def snapshot(self) -> Dict[str, Any]:
+        """Independent copy of the data, e.g. to save it on another thread while it is being edited"""
+        return copy.deepcopy(self.data)
+
+    @instrumentation.timed('save_file')
+    def save_file(self, path: Path, data: Optional[Dict[str, Any]] = None) -> None:
+        """Save data, or the current data if None, to an NPZ or HDF5 file"""
+        data = self.data if data is None else data
+        if not data:
             raise ValueError("No data to save")
     
         if path.suffix.lower() == '.npz':
-            np.savez(path, experiment=self.data)
+            np.savez(path, experiment=data)
         elif path.suffix.lower() in ['.h5', '.hdf5']:
             with h5py.File(path, 'w') as f:
                 def save_item(group, key, value):
-                    if isinstance(value, dict):
+                    if isinstance(value, tuple(COMPACT_ARRAY_CLASSES.values())):
+                        value.save_hdf5(group.create_group(key))
+                    elif isinstance(value, dict):
                         subgroup = group.create_group(key)
                         for k, v in value.items():
                             save_item(subgroup, k, v)
@@ -123,8 +221,9 @@ class DataManager:
                         except (ValueError, TypeError) as e:
                             print(f"Warning: Could not save {key}: {e}")
     
-                for k, v in self.data.items():
+                for k, v in data.items():
                     save_item(f, k, v)
+        instrumentation.count_bytes('save_file', path.stat().st_size)
 
     def extract_events(self, indices: List[int], window_size: float) -> List[Dict]:
         """Extract events using provided indices"""
@@ -193,6 +292,28 @@ class DataManager:
         if last_key[0] == '[' and last_key[-1] == ']':
             last_key = int(last_key[1:-1])
         current[last_key] = value
+        self._invalidate_filtered(path)
+        self.catalog.invalidate_path(path)
+
+    def mark_changed(self, path: str) -> None:
+        """Note results written in place below path, e.g. by batch tools working on a run's events"""
+        self.catalog.invalidate_path(path)
+
+    def _invalidate_filtered(self, path: str) -> None:
+        """Drop cached filtered strain for events whose strain data may have changed"""
+        match = re.match(r'^runs(?:/\[(\d+)\](?:/events(?:/\[(\d+)\](?:/(.*))?)?)?)?$', path.strip('/'))
+        if not match:
+            if path.strip('/') in ('', 'runs'):
+                self.filter_cache.clear()
+            return
+        run_idx, event_idx, rest = match.groups()
+        if rest is not None and not rest.startswith('strain'):
+            return  # e.g. saved analysis results
+        self.filter_cache.invalidate(
+            file=self.data_path,
+            run_idx=int(run_idx) if run_idx is not None else None,
+            event_idx=int(event_idx) if event_idx is not None else None
+        )
 
     def delete_data(self, path: str) -> None:
         """Delete data at specified path
@@ -210,7 +331,12 @@ class DataManager:
         # Handle root deletion
         if path == "":
             self.data = None
+            self.filter_cache.clear()
+            self.catalog.set_data(None)
             return
+        # Deleting a list element shifts the indices of the elements after it
+        self._invalidate_filtered(path.rsplit('/', 1)[0] if path.endswith(']') else path)
+        self.catalog.invalidate_path(path.rsplit('/', 1)[0] if path.endswith(']') else path)
             
         parts = path.split('/')
         current = self.data
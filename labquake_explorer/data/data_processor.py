@@ -2,7 +2,10 @@
 
 import numpy as np
 import pandas as pd
+from scipy import signal
 from labquake_explorer.utils import cohesive_crack as CohesiveCrack
+from labquake_explorer.utils import tpc5
+from labquake_explorer.data.raw_strain_array import RawStrainArray
 
 class DataProcessor:
     """
@@ -92,13 +95,16 @@ class DataProcessor:
             Gain (float): Amplification factor of the signal (dimensionless). Default is 1000.
         
         Returns:
-            float: Calculated strain (dimensionless).
+            float: Calculated strain (dimensionless). A RawStrainArray gives a RawStrainArray
+            of strain on the same counts.
         """
         Vex = 4.98    # Excitation voltage in volts
         GF = 2.12     # Gauge factor
         Rg = 350      # Resistance of strain gauge in ohms (not directly used)
         Gain = 1000   # Amplification factor
         
+        if isinstance(raw_voltage, RawStrainArray):
+            return raw_voltage.scaled(1 / Vex / Gain * 2 / GF)
         strain = raw_voltage / Vex / Gain * 2 / GF
         return strain
 
@@ -137,25 +143,21 @@ class DataProcessor:
         epsilon_xy = (1 + poisson_ratio) / E * sigma_xy
         return epsilon_xx, epsilon_xy, epsilon_yy
 
-    # @staticmethod
-    # def highpass_filter(data, cutoff, fs, order=4):
-    #     """
-    #     Apply a highpass Butterworth filter to the data.
+    @staticmethod
+    def highpass_filter(data, cutoff, fs, order=4):
+        """
+        Apply a zero-phase highpass Butterworth filter to the data.
         
-    #     Args:
-    #         data: Input data to filter
-    #         cutoff: Cutoff frequency
-    #         fs: Sampling frequency
-    #         order: Filter order (default=4)
+        Args:
+            data: Input data to filter, filtered along the last axis
+            cutoff: Cutoff frequency
+            fs: Sampling frequency
+            order: Filter order (default=4)
             
-    #     Returns:
-    #         numpy.ndarray: Filtered data
-    #     """
-    #     nyquist = 0.5 * fs
-    #     normal_cutoff = cutoff / nyquist
-    #     b, a = scipy.signal.butter(order, normal_cutoff, btype='high', analog=False)
-    #     filtered_data = scipy.signal.filtfilt(b, a, data)
-    #     return filtered_data
+        Returns:
+            numpy.ndarray: Filtered data
+        """
+        return FilterPipeline(fs).highpass(cutoff, order).apply(data)
 
     # @staticmethod
     # def fitting_function(X_c: float, C_f: float, Gamma: float, x: float | np.ndarray, y: float) -> float:
@@ -177,4 +179,240 @@ class DataProcessor:
     #     C_s = 2760    # Shear wave speed (m/s)
     #     C_d = 4790    # Longitudinal wave speed (m/s)
         
-    #     return CohesiveCrack.delta_sigma_xy(x, y, X_c, C_f, C_s, C_d, nu, Gamma, E)
\ No newline at end of file
+    #     return CohesiveCrack.delta_sigma_xy(x, y, X_c, C_f, C_s, C_d, nu, Gamma, E)
+
+
+class FilterPipeline:
+    """
+    Chain of zero-phase filter stages applied along the last axis.
+
+    Stages are added with the builder methods, each of which returns a new
+    pipeline, so a pipeline can be used as a dictionary key::
+
+        pipeline = FilterPipeline(fs=1e6).detrend().highpass(100).savgol(51)
+        filtered = pipeline.apply(raw)  # raw: (n_channels, n_samples)
+
+    Attributes:
+        fs (float): Sampling frequency (Hz), required by the Butterworth and notch stages
+        stages (tuple): (kind, parameters) of each stage, in order
+    """
+
+    kinds = ('savgol', 'highpass', 'lowpass', 'bandpass', 'notch')
+
+    def __init__(self, fs=None, stages=()):
+        self.fs = None if fs is None else float(fs)
+        self.stages = tuple(stages)
+
+    def __eq__(self, other):
+        return isinstance(other, FilterPipeline) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"FilterPipeline(fs={self.fs}, stages={self.stages})"
+
+    def __bool__(self):
+        return len(self.stages) > 0
+
+    @property
+    def key(self):
+        return (self.fs, self.stages)
+
+    def _add(self, kind, **params):
+        return FilterPipeline(self.fs, self.stages + ((kind, tuple(sorted(params.items()))),))
+
+    def detrend(self, type='linear'):
+        """Remove a linear or constant trend."""
+        return self._add('detrend', type=type)
+
+    def highpass(self, cutoff, order=4):
+        """Butterworth highpass, applied forward and backward."""
+        return self._add('highpass', cutoff=float(cutoff), order=int(order))
+
+    def lowpass(self, cutoff, order=4):
+        """Butterworth lowpass, applied forward and backward."""
+        return self._add('lowpass', cutoff=float(cutoff), order=int(order))
+
+    def bandpass(self, low, high, order=4):
+        """Butterworth bandpass, applied forward and backward."""
+        return self._add('bandpass', low=float(low), high=float(high), order=int(order))
+
+    def notch(self, freq, quality=30.0):
+        """IIR notch at freq, applied forward and backward."""
+        return self._add('notch', freq=float(freq), quality=float(quality))
+
+    def savgol(self, window_length, polyorder=2):
+        """Savitzky-Golay smoothing."""
+        return self._add('savgol', window_length=int(window_length), polyorder=int(polyorder))
+
+    @classmethod
+    def from_spec(cls, kind, fs=None, window_length=51, cutoff=()):
+        """
+        Build the pipeline selected in the views' filter controls.
+
+        Args:
+            kind (str): One of FilterPipeline.kinds
+            fs (float): Sampling frequency (Hz)
+            window_length (int): Savitzky-Golay window length
+            cutoff (sequence): Cutoff frequencies (Hz); two values for 'bandpass'
+
+        Returns:
+            FilterPipeline: The configured pipeline
+
+        Raises:
+            ValueError: If the kind is unknown or cutoff frequencies are missing
+        """
+        pipeline = cls(fs)
+        cutoff = list(cutoff)
+        if kind == 'savgol':
+            return pipeline.savgol(window_length)
+        if kind in ('highpass', 'lowpass', 'notch') and len(cutoff) < 1:
+            raise ValueError(f"{kind} filter needs a cutoff frequency")
+        if kind == 'highpass':
+            return pipeline.detrend('constant').highpass(cutoff[0])
+        if kind == 'lowpass':
+            return pipeline.lowpass(cutoff[0])
+        if kind == 'bandpass':
+            if len(cutoff) < 2:
+                raise ValueError("bandpass filter needs two cutoff frequencies")
+            return pipeline.detrend('constant').bandpass(min(cutoff[:2]), max(cutoff[:2]))
+        if kind == 'notch':
+            return pipeline.notch(cutoff[0])
+        raise ValueError(f"Unknown filter: {kind}")
+
+    def _sos(self, kind, params):
+        if self.fs is None:
+            raise ValueError(f"{kind} stage needs a sampling frequency")
+        if kind == 'highpass':
+            return signal.butter(params['order'], params['cutoff'], btype='highpass', fs=self.fs, output='sos')
+        if kind == 'lowpass':
+            return signal.butter(params['order'], params['cutoff'], btype='lowpass', fs=self.fs, output='sos')
+        if kind == 'bandpass':
+            return signal.butter(params['order'], [params['low'], params['high']], btype='bandpass', fs=self.fs, output='sos')
+        b, a = signal.iirnotch(params['freq'], params['quality'], fs=self.fs)
+        return signal.tf2sos(b, a)
+
+    def apply(self, data):
+        """
+        Apply all stages to data along the last axis.
+
+        Args:
+            data (np.ndarray): Array of shape (..., n_samples), e.g. (n_channels, n_samples)
+
+        Returns:
+            np.ndarray: Filtered float array of the same shape
+        """
+        y = np.asarray(data, dtype=float)
+        for kind, params in self.stages:
+            params = dict(params)
+            if kind == 'detrend':
+                y = signal.detrend(y, axis=-1, type=params['type'])
+            elif kind == 'savgol':
+                y = signal.savgol_filter(y, params['window_length'], params['polyorder'], axis=-1)
+            else:
+                y = signal.sosfiltfilt(self._sos(kind, params), y, axis=-1)
+        return y
+
+    def overlap(self):
+        """Number of samples on each side of a chunk needed for edge effects to settle."""
+        n = 0
+        for kind, params in self.stages:
+            params = dict(params)
+            if kind == 'savgol':
+                n = max(n, params['window_length'])
+            elif kind != 'detrend' and self.fs is not None:
+                low = min(v for k, v in params.items() if k in ('cutoff', 'low', 'freq'))
+                # Several time constants of the slowest pole
+                n = max(n, int(np.ceil(10 * self.fs / low)))
+        return n
+
+    def apply_chunked(self, read, n_samples, chunk_size=2 ** 20, overlap=None, out=None, dtype=np.float32):
+        """
+        Filter a long record in overlapping chunks without holding it in memory.
+
+        Each chunk is read with ``overlap`` extra samples on both sides, filtered,
+        and trimmed, so the output matches ``apply`` on the full record up to the
+        filters' settling error. A leading detrend stage is computed over the whole
+        record in a first streaming pass; detrend stages elsewhere are not supported.
+
+        Args:
+            read (callable): read(start, stop) -> array of shape (n_channels, stop - start)
+            n_samples (int): Total number of samples in the record
+            chunk_size (int): Samples written per chunk
+            overlap (int): Extra samples on each side; estimated from the stages if None
+            out (array-like): Output of shape (n_channels, n_samples), e.g. an h5py dataset
+                or np.memmap; allocated in memory if None
+            dtype: dtype of the allocated output
+
+        Returns:
+            The output array
+        """
+        if any(kind == 'detrend' for kind, _ in self.stages[1:]):
+            raise ValueError("Chunked filtering only supports detrend as the first stage")
+        overlap = self.overlap() if overlap is None else int(overlap)
+        stages = self.stages
+        trend = None
+        if stages and stages[0][0] == 'detrend':
+            trend = self._streaming_trend(read, n_samples, chunk_size, dict(stages[0][1])['type'])
+            stages = stages[1:]
+        body = FilterPipeline(self.fs, stages)
+
+        for start in range(0, n_samples, chunk_size):
+            stop = min(start + chunk_size, n_samples)
+            lo = max(start - overlap, 0)
+            hi = min(stop + overlap, n_samples)
+            chunk = np.asarray(read(lo, hi), dtype=float)
+            if trend is not None:
+                offset, slope = trend
+                chunk = chunk - (offset[:, np.newaxis] + slope[:, np.newaxis] * np.arange(lo, hi))
+            filtered = body.apply(chunk)[:, start - lo:stop - lo]
+            if out is None:
+                out = np.empty((filtered.shape[0], n_samples), dtype=dtype)
+            out[:, start:stop] = filtered
+        return out
+
+    @staticmethod
+    def _streaming_trend(read, n_samples, chunk_size, type):
+        """Per-channel least-squares (offset, slope) over the whole record, one chunk at a time."""
+        s_y = s_ty = None
+        for start in range(0, n_samples, chunk_size):
+            stop = min(start + chunk_size, n_samples)
+            chunk = np.asarray(read(start, stop), dtype=float)
+            t = np.arange(start, stop, dtype=float)
+            if s_y is None:
+                s_y = np.zeros(chunk.shape[0])
+                s_ty = np.zeros(chunk.shape[0])
+            s_y += chunk.sum(axis=-1)
+            s_ty += chunk @ t
+        n = float(n_samples)
+        if type == 'constant':
+            return s_y / n, np.zeros_like(s_y)
+        s_t = n * (n - 1) / 2
+        s_tt = (n - 1) * n * (2 * n - 1) / 6
+        slope = (n * s_ty - s_t * s_y) / (n * s_tt - s_t ** 2)
+        return (s_y - slope * s_t) / n, slope
+
+    def apply_tpc5(self, fileRef, channels, block=1, chunk_size=2 ** 20, out=None, dtype=np.float32):
+        """
+        Filter full TPC5 channels in overlapping chunks.
+
+        Args:
+            fileRef (h5py.File): Open TPC5 file
+            channels (sequence): 1-based TPC5 channel numbers
+            block (int): TPC5 block number
+            chunk_size (int): Samples written per chunk
+            out (array-like): Output of shape (len(channels), n_samples); allocated if None
+            dtype: dtype of the allocated output
+
+        Returns:
+            The output array
+        """
+        channels = list(channels)
+        n_samples = tpc5.getNSamples(fileRef, channels[0], block)
+        pipeline = self if self.fs is not None else FilterPipeline(tpc5.getSampleRate(fileRef, channels[0], block), self.stages)
+
+        def read(start, stop):
+            return np.stack([tpc5.getVoltageSlice(fileRef, channel, start, stop, block) for channel in channels])
+
+        return pipeline.apply_chunked(read, n_samples, chunk_size=chunk_size, out=out, dtype=dtype)
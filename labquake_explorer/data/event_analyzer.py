@@ -0,0 +1,162 @@
+"""Automatic stress-drop analysis of extracted events for Labquake Explorer"""
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from labquake_explorer.data.event_detector import EventDetector
+from labquake_explorer.data.uniform_time_axis import UniformTimeAxis
+from labquake_explorer.utils.range_regression import RangeRegression
+
+
+class EventAnalyzer:
+    """Finds the six analysis points of EventAnalyzerView from stress vs displacement.
+
+    Points:
+        0, 1: Loading range, from the lowest stress before the slip to the change point
+            where the loading curve departs from a straight line
+        2, 3: Unloading range, where the stress has dropped by 10% and 90% of the drop
+        4, 5: Rupture start and end, the stress peak and the trough after it
+
+    The slip is the stress drop closest to the event time found by EventDetector. The
+    change point is the split of the loading curve that minimizes the residuals of two
+    straight-line fits, evaluated for every split at once from RangeRegression sums.
+
+    Events whose loading or unloading range has fewer than min_points samples, or whose
+    loading starts before the record, cannot be analyzed and raise ValueError.
+    """
+
+    def __init__(self, drop_fraction: float = 0.2, duration_fraction: float = 0.25,
+                 unloading_range: tuple = (0.1, 0.9), min_segment: int = 3, min_points: int = 3):
+        self.drop_fraction = drop_fraction        # Smallest drop considered, as a fraction of the stress range
+        self.duration_fraction = duration_fraction  # Longest drop considered, as a fraction of the record
+        self.unloading_range = unloading_range    # Fractions of the drop bounding the unloading range
+        self.min_segment = min_segment            # Fewest points of each loading segment
+        self.min_points = min_points              # Fewest points of the loading and unloading ranges
+
+    def find_points(self, x: np.ndarray, y: np.ndarray, center: Optional[int] = None) -> List[int]:
+        """The six analysis points of one event.
+
+        Args:
+            x: Displacement (or any x data) of the event
+            y: Shear stress (or any y data) of the event
+            center: Index of the event time; the middle of the record if None
+
+        Returns:
+            Indices of points 0 to 5
+        """
+        y = np.asarray(y, dtype=float)
+        n = len(y)
+        if n < 2 * self.min_segment + 2:
+            raise ValueError("Event is too short to analyze")
+        center = n // 2 if center is None else center
+
+        # Rupture: the stress drop closest to the event time
+        detector = EventDetector(min_drop=self.drop_fraction * np.ptp(y),
+                                 max_duration=max(1, int(self.duration_fraction * n)))
+        drops = detector.drops(y)
+        if len(drops['peak']):
+            k = np.argmin(np.abs(drops['peak'] - center))
+            peak, trough = int(drops['peak'][k]), int(drops['trough'][k])
+            previous = int(drops['trough'][k - 1]) if k > 0 else 0
+        else:
+            peak = int(np.argmax(y))
+            trough = peak + int(np.argmin(y[peak:]))
+            previous = 0
+
+        # Loading: straight part of the curve from the lowest point before the peak
+        start = previous + int(np.argmin(y[previous:peak + 1]))
+        if previous == 0 and start < self.min_points:
+            raise ValueError("Loading starts before the record; extract a longer window")
+        end = peak
+        splits = np.arange(start + self.min_segment, peak - self.min_segment + 1)
+        if len(splits):
+            regression = RangeRegression(x, y)
+            cost = regression.sse(start, splits) + regression.sse(splits, peak)
+            end = int(splits[np.argmin(cost)])
+
+        # Unloading: central part of the drop
+        drop = y[peak] - y[trough]
+        segment = y[peak:trough + 1]
+        below_first = np.flatnonzero(segment <= y[peak] - self.unloading_range[0] * drop)
+        below_last = np.flatnonzero(segment <= y[peak] - self.unloading_range[1] * drop)
+        unloading_start = peak + int(below_first[0]) if len(below_first) else peak
+        unloading_end = peak + int(below_last[0]) if len(below_last) else trough
+        if unloading_end - unloading_start + 1 < self.min_points:
+            unloading_start, unloading_end = peak, trough
+
+        if end - start + 1 < self.min_points:
+            raise ValueError(f"Loading range has only {end - start + 1} points")
+        if unloading_end - unloading_start + 1 < self.min_points:
+            raise ValueError(f"Stress drop has only {unloading_end - unloading_start + 1} points")
+        return [start, end, unloading_start, unloading_end, peak, trough]
+
+    @staticmethod
+    def results(x: np.ndarray, y: np.ndarray, points: List[int], regression: Optional[RangeRegression] = None) -> Dict[str, Any]:
+        """event_analysis entry for the given six points, as saved by EventAnalyzerView."""
+        regression = RangeRegression(x, y) if regression is None else regression
+        loading_stiffness = regression.fit(points[0], points[1])[0]
+        unloading_stiffness = regression.fit(points[2], points[3])[0]
+        return {
+            'loading_indices': [int(points[0]), int(points[1])],
+            'unloading_indices': [int(points[2]), int(points[3])],
+            'rupture_start_index': int(points[4]),
+            'rupture_end_index': int(points[5]),
+            'loading_stiffness': float(loading_stiffness),
+            'unloading_stiffness': float(unloading_stiffness),
+            'stress_drop': float(abs(y[points[4]] - y[points[5]])),
+            'displacement': float(abs(x[points[5]] - x[points[4]]))
+        }
+
+    @staticmethod
+    def get_field(event: Dict[str, Any], path: str) -> np.ndarray:
+        """Array at a '/'-separated path inside an event."""
+        current = event
+        for part in path.split('/'):
+            current = current[part]
+        return np.asarray(current, dtype=float)
+
+    @staticmethod
+    def event_center(event: Dict[str, Any], n: int) -> Optional[int]:
+        """Index of the event time in an event's records of length n, if known."""
+        if "time" in event and "event_time" in event and len(event["time"]) == n:
+            if isinstance(event["time"], UniformTimeAxis):
+                return event["time"].index(event["event_time"])
+            return int(np.argmin(np.abs(np.asarray(event["time"]) - event["event_time"])))
+        return None
+
+    def analyze_event(self, event: Dict[str, Any], item_x: Optional[str] = "displacement",
+                      item_y: str = "shear_stress") -> Dict[str, Any]:
+        """Analyze one event and return its event_analysis entry; x is the sample index if item_x is None."""
+        y = self.get_field(event, item_y)
+        x = np.arange(len(y), dtype=float) if item_x is None else self.get_field(event, item_x)
+        points = self.find_points(x, y, self.event_center(event, len(y)))
+        return self.results(x, y, points)
+
+    def analyze_run(self, events: List[Dict[str, Any]], item_x: Optional[str] = "displacement", item_y: str = "shear_stress",
+                    n_workers: Optional[int] = None) -> List[Optional[Dict[str, Any]]]:
+        """Analyze every event of a run in parallel and store event_analysis in each.
+
+        Args:
+            events: Events of a run, as extracted by EventProcessor
+            item_x: Path of the x data within each event
+            item_y: Path of the y data within each event
+            n_workers: Worker threads; chosen by ThreadPoolExecutor if None
+
+        Returns:
+            The event_analysis of every event, None where the analysis failed; the
+            saved event_analysis of these events is removed
+        """
+        def analyze(i):
+            try:
+                return self.analyze_event(events[i], item_x, item_y)
+            except (KeyError, ValueError, IndexError) as e:
+                print(f"Warning: Could not analyze event {i}: {str(e)}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(analyze, range(len(events))))
+        for event, result in zip(events, results):
+            if result is not None:
+                event['event_analysis'] = result
+            else:
+                event.pop('event_analysis', None)
+        return results
@@ -0,0 +1,233 @@
+"""Columnar catalog of event results for Labquake Explorer"""
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+
+class EventCatalog:
+    """All events of all runs as one table, with a row per event.
+
+    Scalar results saved in an event (event_time, rupture_speed, event_analysis,
+    czm_parms, ...) become columns, next to the 'run' and 'event' keys and a few
+    derived metrics. Rows are flattened once and cached; invalidating a run or an
+    event re-flattens only those rows the next time the table is used. The table is
+    a pandas DataFrame, so filtering, grouping and export are vectorized.
+    """
+
+    key_columns = ['run', 'event']
+    # Dictionaries of an event whose scalars become columns, with the column prefix
+    flattened = {'event_analysis': '', 'czm_parms': 'czm_'}
+    # Parameter order of czm_parms saved as a list
+    czm_list_keys = ['Cf', 'y', 'Xc', 'Gc', 'x_min', 'x_tip', 'x_max', 'strain_gauge']
+
+    def __init__(self):
+        self.data: Optional[Dict[str, Any]] = None
+        self._rows: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        self._stale_runs: Optional[set] = None   # None: everything is stale
+        self._stale_events: set = set()
+        self._frame: Optional[pd.DataFrame] = None
+
+    def set_data(self, data: Optional[Dict[str, Any]]) -> None:
+        """Catalog a newly loaded experiment."""
+        self.data = data
+        self.invalidate()
+
+    def invalidate(self, run_idx: Optional[int] = None, event_idx: Optional[int] = None) -> None:
+        """Mark rows to be flattened again; everything if run_idx is None."""
+        if run_idx is None:
+            self._stale_runs = None
+            self._stale_events.clear()
+        elif self._stale_runs is not None:
+            if event_idx is None:
+                self._stale_runs.add(run_idx)
+            else:
+                self._stale_events.add((run_idx, event_idx))
+        self._frame = None
+
+    def invalidate_path(self, path: str) -> None:
+        """Mark the rows below a data path, e.g. 'runs/[0]/events/[3]/rupture_speed', as changed."""
+        path = path.strip('/')
+        match = re.match(r'^runs/\[(\d+)\](?:/events(?:/\[(\d+)\])?)?', path)
+        if match:
+            run_idx, event_idx = match.groups()
+            self.invalidate(int(run_idx), int(event_idx) if event_idx is not None else None)
+        elif path == '' or path.split('/')[0] == 'runs':
+            self.invalidate()
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """Up-to-date table of all events."""
+        if self._frame is None:
+            self._update()
+            rows = [self._rows[key] for key in sorted(self._rows)]
+            frame = pd.DataFrame.from_records(rows) if rows else pd.DataFrame(columns=self.key_columns)
+            self._frame = frame.reset_index(drop=True)
+        return self._frame
+
+    def _runs(self) -> List[Any]:
+        if not self.data or 'runs' not in self.data:
+            return []
+        return list(self.data['runs'])
+
+    def _update(self) -> None:
+        runs = self._runs()
+        if self._stale_runs is None:
+            self._rows.clear()
+            stale_runs = set(range(len(runs)))
+        else:
+            stale_runs = self._stale_runs
+        for run_idx in stale_runs:
+            for key in [key for key in self._rows if key[0] == run_idx]:
+                del self._rows[key]
+            if run_idx < len(runs):
+                for event_idx, event in enumerate(runs[run_idx].get('events', [])):
+                    self._rows[(run_idx, event_idx)] = self.event_row(event, run_idx, event_idx, runs[run_idx])
+        for run_idx, event_idx in self._stale_events:
+            if run_idx in stale_runs:
+                continue
+            events = runs[run_idx].get('events', []) if run_idx < len(runs) else []
+            if event_idx < len(events):
+                self._rows[(run_idx, event_idx)] = self.event_row(events[event_idx], run_idx, event_idx, runs[run_idx])
+            else:
+                self._rows.pop((run_idx, event_idx), None)
+        self._stale_runs = set()
+        self._stale_events = set()
+
+    @staticmethod
+    def _scalar(value: Any) -> Optional[Any]:
+        """value as a plain number or string if it is a scalar, else None."""
+        if isinstance(value, (str, bool, int, float, np.number, np.bool_)):
+            return value.item() if isinstance(value, (np.number, np.bool_)) else value
+        if isinstance(value, np.ndarray) and value.size == 1 and value.dtype.kind in 'biuf':
+            return value.item()
+        return None
+
+    @classmethod
+    def event_row(cls, event: Dict[str, Any], run_idx: int, event_idx: int,
+                  run: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Flatten the scalar results of one event into a catalog row."""
+        row: Dict[str, Any] = {'run': run_idx, 'event': event_idx}
+        if run is not None and isinstance(run.get('name'), str):
+            row['run_name'] = run['name']
+        for key, value in event.items():
+            scalar = cls._scalar(value)
+            if scalar is not None:
+                row[key] = scalar
+        for key, prefix in cls.flattened.items():
+            values = event.get(key)
+            if isinstance(values, dict):
+                for name, value in values.items():
+                    scalar = cls._scalar(value)
+                    if scalar is not None:
+                        row[prefix + name] = scalar
+                    elif isinstance(value, dict):  # e.g. joint fit of czm_parms
+                        for sub_name, sub_value in value.items():
+                            scalar = cls._scalar(sub_value)
+                            if scalar is not None:
+                                row[f"{prefix}{name}_{sub_name}"] = scalar
+            elif key == 'czm_parms' and isinstance(values, (list, tuple, np.ndarray)):
+                for name, value in zip(cls.czm_list_keys, values):
+                    scalar = cls._scalar(value)
+                    if scalar is not None:
+                        row[prefix + name] = scalar
+
+        # Derived metrics
+        shear_stress = event.get('shear_stress')
+        if isinstance(shear_stress, np.ndarray) and shear_stress.ndim == 1 and shear_stress.size:
+            row['peak_shear_stress'] = float(np.nanmax(shear_stress))
+        normal_stress = event.get('normal_stress')
+        if isinstance(normal_stress, np.ndarray) and normal_stress.ndim == 1 and normal_stress.size:
+            row['mean_normal_stress'] = float(np.nanmean(normal_stress))
+        if 'stress_drop' in row and row.get('mean_normal_stress'):
+            row['friction_drop'] = row['stress_drop'] / row['mean_normal_stress']
+        if row.get('loading_stiffness') and 'unloading_stiffness' in row:
+            row['stiffness_ratio'] = row['unloading_stiffness'] / row['loading_stiffness']
+        strain = event.get('strain')
+        if isinstance(strain, dict) and 'fitting_channels' in strain:
+            row['n_fitting_channels'] = int(np.sum(np.asarray(strain['fitting_channels'], dtype=bool)))
+        return row
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def query(self, expr: str) -> pd.DataFrame:
+        """Rows matching a pandas query, e.g. 'run == 2 and rupture_speed > 1000'."""
+        return self.frame.query(expr)
+
+    def filter(self, **ranges) -> pd.DataFrame:
+        """Rows whose columns lie in the given (low, high) ranges or equal the given values.
+
+        Example: catalog.filter(run=3, stress_drop=(0.05, None))
+        """
+        frame = self.frame
+        keep = np.ones(len(frame), dtype=bool)
+        for column, value in ranges.items():
+            if column not in frame:
+                raise KeyError(f"No column '{column}' in the event catalog")
+            if isinstance(value, tuple):
+                low, high = value
+                if low is not None:
+                    keep &= (frame[column] >= low).to_numpy()
+                if high is not None:
+                    keep &= (frame[column] <= high).to_numpy()
+            else:
+                keep &= (frame[column] == value).to_numpy()
+        return frame[keep]
+
+    def groupby(self, by='run', columns: Optional[List[str]] = None, stats=('count', 'mean', 'std')) -> pd.DataFrame:
+        """Summary statistics of the numeric columns per group."""
+        frame = self.frame
+        if columns is None:
+            columns = [c for c in frame.select_dtypes('number').columns if c not in self.key_columns]
+        return frame.groupby(by)[columns].agg(list(stats))
+
+    def export(self, path: Path) -> None:
+        """Write the catalog to CSV, or Parquet for .parquet/.pq files (requires pyarrow or fastparquet)."""
+        path = Path(path)
+        if path.suffix.lower() in ('.parquet', '.pq'):
+            self.to_parquet(path)
+        else:
+            self.to_csv(path)
+
+    def to_csv(self, path: Path) -> None:
+        self.frame.to_csv(path, index=False)
+
+    def to_parquet(self, path: Path) -> None:
+        try:
+            self.frame.to_parquet(path, index=False)
+        except ImportError as e:
+            raise ImportError(f"Parquet export needs pyarrow or fastparquet: {e}") from e
+
+    def plot(self, x: str = 'rupture_speed', y: str = 'stress_drop', by: Optional[str] = 'run', ax=None, **kwargs):
+        """Scatter plot of two catalog columns, one color per group.
+
+        Args:
+            x, y: Column names
+            by: Column grouping the points, e.g. 'run'; None for a single group
+            ax: Matplotlib axes; a new figure if None
+            **kwargs: Passed to ax.scatter
+
+        Returns:
+            The matplotlib axes
+        """
+        if ax is None:
+            import matplotlib.pyplot as plt
+            _, ax = plt.subplots()
+        frame = self.frame
+        for column in (x, y):
+            if column not in frame:
+                raise KeyError(f"No column '{column}' in the event catalog")
+        frame = frame[np.isfinite(frame[x].astype(float)) & np.isfinite(frame[y].astype(float))]
+        kwargs.setdefault('s', 10)
+        if by is None or by not in frame:
+            ax.scatter(frame[x], frame[y], **kwargs)
+        else:
+            for group, rows in frame.groupby(by):
+                ax.scatter(rows[x], rows[y], label=f"{by} {group}", **kwargs)
+            if frame[by].nunique() <= 20:
+                ax.legend(fontsize='small')
+        ax.set_xlabel(x)
+        ax.set_ylabel(y)
+        return ax
@@ -0,0 +1,103 @@
+"""Stick-slip event detection for Labquake Explorer"""
+import numpy as np
+from scipy import ndimage, signal
+from typing import Dict, Optional
+
+
+class EventDetector:
+    """Detects stick-slip events as stress drops in a full-run shear stress record.
+
+    Candidate events are the local maxima of the stress. Each drop runs from its peak
+    to the lowest stress that follows it, within max_duration samples or, without a
+    duration limit, before the next peak. Drops are kept if their amplitude, duration
+    and prominence pass the thresholds. With max_duration set, the drops of all local
+    maxima are found in one forward minimum-filter sweep, so noisy records with
+    millions of samples are processed in a fraction of a second.
+    """
+
+    def __init__(self, min_drop: float = 0.0, max_duration: Optional[int] = None,
+                 min_prominence: Optional[float] = None, min_distance: int = 1):
+        self.min_drop = min_drop                # Smallest stress drop kept
+        self.max_duration = max_duration        # Longest peak-to-trough duration (samples); unlimited if None
+        self.min_prominence = min_prominence    # Prominence of the peak; min_drop if None
+        self.min_distance = min_distance        # Smallest distance between events (samples)
+
+    def drops(self, y: np.ndarray) -> Dict[str, np.ndarray]:
+        """Find all stress drops that pass the thresholds.
+
+        Args:
+            y: Shear stress of the run
+
+        Returns:
+            Dictionary of arrays with one entry per event: 'peak' and 'trough' indices,
+            'drop' amplitude and 'duration' in samples
+        """
+        y = np.asarray(y, dtype=float)
+        peaks = np.array([], dtype=int)
+        if len(y) >= 3:
+            if self.max_duration is None:
+                peaks, troughs = self._drops_to_next_peak(y)
+            else:
+                peaks, troughs = self._drops_within(y, max(1, int(self.max_duration)))
+        if len(peaks) == 0:
+            return {'peak': peaks, 'trough': peaks.copy(), 'drop': np.array([]), 'duration': peaks.copy()}
+
+        keep = y[peaks] - y[troughs] >= self.min_drop
+        peaks, troughs = peaks[keep], troughs[keep]
+        if self.min_distance > 1 and len(peaks) > 1:
+            # Keep the largest drop of events closer than min_distance
+            order = np.argsort(-(y[peaks] - y[troughs]), kind='stable')
+            kept = np.zeros(len(peaks), dtype=bool)
+            for i in order:
+                lo, hi = np.searchsorted(peaks, [peaks[i] - self.min_distance + 1, peaks[i] + self.min_distance])
+                if not kept[lo:hi].any():
+                    kept[i] = True
+            peaks, troughs = peaks[kept], troughs[kept]
+        return {'peak': peaks, 'trough': troughs, 'drop': y[peaks] - y[troughs], 'duration': troughs - peaks}
+
+    def prominence(self) -> float:
+        """Prominence threshold in effect."""
+        return self.min_drop if self.min_prominence is None else self.min_prominence
+
+    def _drops_within(self, y: np.ndarray, D: int) -> tuple:
+        """Largest local maximum of every cluster followed by a big enough drop within D samples."""
+        forward_min = ndimage.minimum_filter1d(y, D + 1, mode='nearest', origin=-((D + 1) // 2))
+        maxima, _ = signal.find_peaks(y, plateau_size=(None, None))
+        maxima = maxima[y[maxima] - forward_min[maxima] >= self.min_drop]
+        if len(maxima) == 0:
+            return maxima, maxima
+        # Maxima of the same drop lie within D samples of each other
+        starts = np.flatnonzero(np.diff(maxima, prepend=-2 * D - 2) > D)
+        cluster_max = np.maximum.reduceat(y[maxima], starts)
+        cluster = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(maxima))))
+        is_max = y[maxima] == cluster_max[cluster]
+        peaks = maxima[np.flatnonzero(is_max)[np.searchsorted(np.flatnonzero(is_max), starts)]]
+        prominence = self.prominence()
+        if prominence > 0:
+            peaks = peaks[signal.peak_prominences(y, peaks)[0] >= prominence]
+        padded = np.concatenate([y, np.full(D, np.inf)])
+        windows = np.lib.stride_tricks.sliding_window_view(padded, D + 1)[peaks]
+        return peaks, peaks + np.argmin(windows, axis=1)
+
+    def _drops_to_next_peak(self, y: np.ndarray) -> tuple:
+        """Prominent maxima and the lowest point between each and the next one."""
+        prominence = self.prominence()
+        peaks, _ = signal.find_peaks(y, prominence=prominence if prominence > 0 else None)
+        if len(peaks) == 0:
+            return peaks, peaks
+        bounds = np.append(peaks, len(y))
+        segment_min = np.minimum.reduceat(y, peaks)
+        at_min = np.flatnonzero(y[peaks[0]:] == np.repeat(segment_min, np.diff(bounds))) + peaks[0]
+        return peaks, at_min[np.searchsorted(at_min, peaks)]
+
+    def detect(self, y: np.ndarray) -> np.ndarray:
+        """Indices of the stress peaks at the onset of each detected event."""
+        return self.drops(y)['peak']
+
+    @staticmethod
+    def noise_level(y: np.ndarray) -> float:
+        """Robust estimate of the sample noise from the median absolute difference."""
+        dy = np.diff(np.asarray(y, dtype=float))
+        if len(dy) == 0:
+            return 0.0
+        return float(1.4826 * np.median(np.abs(dy - np.median(dy))) / np.sqrt(2))
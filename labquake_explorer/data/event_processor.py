@@ -1,41 +1,105 @@
 """Event processing for Labquake Explorer"""
+import copy
+import os
+from concurrent.futures import ThreadPoolExecutor
 import h5py
 import numpy as np
 from labquake_explorer.utils import tpc5
-from typing import Dict, Any, List, Optional
+from labquake_explorer.data.event_tensor import EventRecord, EventTensor
+from labquake_explorer.data.raw_strain_array import RawStrainArray
+from labquake_explorer.data.uniform_time_axis import UniformTimeAxis
+from labquake_explorer.utils.instrumentation import instrumentation
+from typing import Dict, Any, List, Optional, Callable, Sequence
 from pathlib import Path
 
 class EventProcessor:
-    def __init__(self, data_path: Optional[Path] = None):
+    def __init__(self, data_path: Optional[Path] = None, n_workers: Optional[int] = None):
         self.data_path = data_path
+        self.n_workers = n_workers if n_workers is not None else (os.cpu_count() or 1)  # Threads reading TPC5 blocks
 
     def set_data_path(self, data_path: Path) -> None:
         """Set the base path for resolving relative file paths"""
         self.data_path = data_path
 
-    def extract_events(self, run_data: Dict[str, Any], event_indices: List[int], window: float) -> List[Dict]:
+    @staticmethod
+    def enabled_channels(events: Sequence[Dict[str, Any]], n_channels: Optional[int] = None) -> np.ndarray:
+        """0-based channels enabled in every event.
+
+        Channels left out of strain/enabled_channels of an event are not read at extraction
+        (their rows are NaN) or were disabled in the picker view, so functions working on
+        all channels of many events default to these.
+
+        Args:
+            events: Events, as extracted by extract_events
+            n_channels: Number of channels; the rows of the first event's strain if None
+
+        Returns:
+            Sorted channel indices; all channels if no event records enabled_channels
+        """
+        events = list(events)
+        if n_channels is None:
+            n_channels = len(events[0]['strain']['original']['raw']) if events else 0
+        enabled = np.ones(n_channels, dtype=bool)
+        for event in events:
+            mask = event.get('strain', {}).get('enabled_channels')
+            if mask is not None:
+                mask = np.asarray(mask, dtype=bool)[:n_channels]
+                enabled[:len(mask)] &= mask
+        return np.flatnonzero(enabled)
+
+    @staticmethod
+    def _channel_runs(enabled: np.ndarray) -> List[tuple]:
+        """(first, stop) rows of each run of consecutive enabled channels, read in one batch each"""
+        edges = np.diff(np.concatenate([[0], np.asarray(enabled, dtype=np.int8), [0]]))
+        return [(int(a), int(b)) for a, b in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1))]
+
+    @staticmethod
+    def _run_enabled_channels(run_data: Dict[str, Any], n_channels: int) -> np.ndarray:
+        """Boolean mask of the channels of a run's strain recording that are read"""
+        enabled = run_data['strain'].get('enabled_channels')
+        return np.ones(n_channels, dtype=bool) if enabled is None else np.asarray(enabled, dtype=bool)[:n_channels]
+
+    @instrumentation.timed('extract_events')
+    def extract_events(self, run_data: Dict[str, Any], event_indices: List[int], window: float,
+                       fixed_length: bool = False, progress: Optional[Callable[[int, int], None]] = None,
+                       keep_counts: bool = False) -> List[Dict]:
         """Extract events from run data using provided indices and time window
         
         Args:
             run_data: Dictionary containing run data including strain data
             event_indices: List of indices marking event locations
             window: Time window size (in seconds) before and after each event
+            fixed_length: Give every full-rate strain window the same number of samples,
+                centered on the event time; the windows are views into one EventTensor
+            progress: Called as progress(n_done, n_events) after each event
+            keep_counts: Keep the full-rate strain windows as int16 counts of the recording
+                in a RawStrainArray, scaled to volts on access; ignored with fixed_length
             
         Returns:
-            List of extracted event dictionaries
+            List of extracted event dictionaries; the time axes of uniformly sampled runs
+            and of the full-rate strain windows are UniformTimeAxis
         """
+        tensor = None
+        if fixed_length and 'strain' in run_data:
+            tensor = self.extract_event_tensor(run_data, event_indices, window)
+        # A uniformly sampled run time gives O(1) window lookups and compact event time axes
+        run_axis = UniformTimeAxis.from_array(run_data['time'])
         events = []
         for i, idx in enumerate(event_indices):
             event = {}
             event_time = run_data["time"][idx]
             
             # Extract time window around event
-            idx_beg = np.argmin(np.abs(event_time - window - run_data["time"]))
-            idx_end = np.argmin(np.abs(event_time + window - run_data["time"]))
+            if run_axis is not None:
+                idx_beg = run_axis.index(event_time - window)
+                idx_end = run_axis.index(event_time + window)
+            else:
+                idx_beg = np.argmin(np.abs(event_time - window - run_data["time"]))
+                idx_end = np.argmin(np.abs(event_time + window - run_data["time"]))
             
             # Store basic event info
             event['event_time'] = event_time
-            event['time'] = run_data['time'][idx_beg:idx_end]
+            event['time'] = run_axis[idx_beg:idx_end] if run_axis is not None else run_data['time'][idx_beg:idx_end]
 
             try:
                 # Store mechanical data
@@ -49,9 +113,18 @@ class EventProcessor:
                         event[field] = run_data[field][idx_beg:idx_end]
 
                 # Handle strain data if available
-                if 'strain' in run_data:
+                if tensor is not None:
+                    event['strain'] = self._downsampled_strain(run_data, event_time - window, window)
+                    event['strain']['original'] = {
+                        'time': UniformTimeAxis(tensor.t0 + tensor.records[i].start / tensor.fs, 1 / tensor.fs,
+                                                tensor.n_samples),
+                        'raw': tensor.data[i]
+                    }
+                    if 'enabled_channels' in run_data['strain']:
+                        event['strain']['enabled_channels'] = list(run_data['strain']['enabled_channels'])
+                elif 'strain' in run_data:
                     event['strain'] = self._process_strain_data(
-                        run_data, event_time, window, idx_beg, idx_end
+                        run_data, event_time, window, idx_beg, idx_end, keep_counts
                     )
 
             except Exception as e:
@@ -67,11 +140,14 @@ class EventProcessor:
                             event[key] = run_data[key][idx]
             
             events.append(event)
+            if progress is not None:
+                progress(i + 1, len(event_indices))
         
         return events
 
+    @instrumentation.timed('process_strain_data')
     def _process_strain_data(self, run_data: Dict[str, Any], event_time: float, 
-                           window: float, idx_beg: int, idx_end: int) -> Dict[str, Any]:
+                           window: float, idx_beg: int, idx_end: int, keep_counts: bool = False) -> Dict[str, Any]:
         """Process strain data for a single event"""
         if self.data_path is None:
             raise ValueError("Data path not set. Call set_data_path() first.")
@@ -80,45 +156,262 @@ class EventProcessor:
         strain_file = self.data_path.parent / run_data['strain']['filename']
         with h5py.File(strain_file, 'r') as f:
             n_channels = tpc5.getNChannels(f)
-            n_samples = tpc5.getNSamples(f, 1)
-            trigger_sample = tpc5.getTriggerSample(f, 1, 1)
-            sampling_rate = tpc5.getSampleRate(f, 1, 1)
-            
-            # Calculate time series
-            start_time = -trigger_sample / sampling_rate
-            end_time = (n_samples - trigger_sample) / sampling_rate
-            ts = np.arange(start_time, end_time, 1/sampling_rate)
-            ts += run_data['strain']['time_offset'] + run_data['time'][0] - ts[0]
+            block_index = tpc5.getBlockIndex(f)
+            n_samples = tpc5.getNSamplesTotal(block_index)
+            sampling_rate = block_index['sampleRate']
 
-            # Get indices for time window
+            # Global sample i of the recording (across blocks) is at time t0 + i / fs
+            t0 = run_data['strain']['time_offset'] + run_data['time'][0]
             time_before = event_time - window
             time_after = event_time + window
-            idx_before = np.argmin(np.abs(ts - time_before))
-            idx_after = np.argmin(np.abs(ts - time_after))
-            tt = ts[idx_before:idx_after]
+            idx_before = int(np.clip(np.round((time_before - t0) * sampling_rate), 0, n_samples - 1))
+            idx_after = int(np.clip(np.round((time_after - t0) * sampling_rate), 0, n_samples))
+            tt = UniformTimeAxis(t0 + idx_before / sampling_rate, 1 / sampling_rate, max(idx_after - idx_before, 0))
 
-            idx_before_strain = np.argmin(np.abs(run_data['strain']['time'] - time_before))
-            idx_after_strain = np.argmin(np.abs(run_data['strain']['time'] - time_before))
-            idx_event_strain = range(idx_before_strain, idx_after_strain + 1)
-            
-            # Extract strain data
-            y = np.zeros((n_channels, len(tt)))
-            for j in range(n_channels):
-                y[j, :] = tpc5.getVoltageData(f, j + 1)[idx_before:idx_after]
-                y[j, :] -= y[j, 0:int(y.shape[1] / 100)].mean()
+            # Read the enabled channels straight into their rows, one batch per run of
+            # consecutive channels; the other rows and samples in gaps between blocks are NaN
+            enabled = self._run_enabled_channels(run_data, n_channels)
+            # The baseline of each channel is the mean of the first 1% of the window's
+            # samples that hold data
+            covered = tpc5.getSampleCoverage(block_index, idx_before, idx_after)
+            baseline = np.flatnonzero(covered)[:int(len(tt) / 100)]
+            if keep_counts:
+                # Disabled channels get a NaN factor and samples in gaps between blocks are
+                # marked missing, so both read as NaN like in the float windows. The baseline
+                # is removed through the offset of each channel.
+                counts = np.zeros((n_channels, len(tt)), dtype=np.int16)
+                factor = np.full(n_channels, np.nan)
+                for a, b in self._channel_runs(enabled):
+                    _, factor[a:b], _ = tpc5.readChannelCounts(f, range(a + 1, b + 1), idx_before, idx_after,
+                                                               out=counts[a:b], blockIndex=block_index)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    constant = -counts[:, baseline].sum(axis=1) / len(baseline) * factor
+                y = RawStrainArray(counts, factor, constant, dtype=np.float32,
+                                   missing=None if covered.all() else ~covered)
+            else:
+                y = np.full((n_channels, len(tt)), np.nan, dtype=np.float32)
+                for a, b in self._channel_runs(enabled):
+                    tpc5.readChannels(f, range(a + 1, b + 1), idx_before, idx_after, out=y[a:b], blockIndex=block_index)
+                for j in np.flatnonzero(enabled):
+                    y[j, :] -= np.nanmean(y[j, baseline])
+            instrumentation.count_bytes('process_strain_data', y.nbytes)
             
             # Return formatted strain dat
-            return {
-                'filename_downsampled': run_data['strain'].get('filename_downsampled', ''),
-                'filename': run_data['strain']['filename'],
-                'time': run_data['time'][0] + run_data['strain']['time_offset'] + 
-                       run_data['strain']['time'][idx_event_strain],
-                'raw': run_data['strain']['raw'][:, idx_event_strain],
-                'original': {
-                    'time': tt,
-                    'raw': y
-                }
+            strain = self._downsampled_strain(run_data, time_before, window)
+            strain['original'] = {
+                'time': tt,
+                'raw': y
             }
+            if 'enabled_channels' in run_data['strain']:
+                strain['enabled_channels'] = enabled.tolist()
+            return strain
+
+    def _downsampled_strain(self, run_data: Dict[str, Any], time_before: float, window: float) -> Dict[str, Any]:
+        """Strain fields of an event from time_before to time_before + 2 * window, taken from the run's downsampled strain"""
+        # The downsampled strain time counts from the first strain sample at t0
+        t0 = run_data['time'][0] + run_data['strain']['time_offset']
+        strain_time = np.asarray(run_data['strain']['time'])
+        idx_before_strain = np.argmin(np.abs(strain_time - (time_before - t0)))
+        idx_after_strain = np.argmin(np.abs(strain_time - (time_before + 2 * window - t0)))
+        idx_event_strain = range(idx_before_strain, idx_after_strain + 1)
+        return {
+            'filename_downsampled': run_data['strain'].get('filename_downsampled', ''),
+            'filename': run_data['strain']['filename'],
+            'time': t0 + strain_time[idx_event_strain],
+            'raw': run_data['strain']['raw'][:, idx_event_strain],
+        }
+
+    @instrumentation.timed('extract_event_tensor')
+    def extract_event_tensor(self, run_data: Dict[str, Any], event_indices: List[int], window: float,
+                             run_idx: int = -1) -> EventTensor:
+        """Extract the full-rate strain windows of events into one dense array
+
+        Every window has round(2 * window * fs) samples and starts round(window * fs)
+        samples before the sample at the event time, so all windows are aligned on the
+        event time. Each window has its baseline removed like in _process_strain_data, and
+        only the channels in run_data['strain']['enabled_channels'] are read.
+
+        Args:
+            run_data: Dictionary containing run data including strain data
+            event_indices: List of indices marking event locations
+            window: Time window size (in seconds) before and after each event
+            run_idx: Run index stored in the event records
+
+        Returns:
+            Float32 EventTensor of shape (n_events, n_channels, n_samples), like the
+            windows of _process_strain_data; rows of channels not read are NaN, and so are
+            samples outside the recording or in gaps between its blocks, whose events are
+            marked invalid
+        """
+        if self.data_path is None:
+            raise ValueError("Data path not set. Call set_data_path() first.")
+
+        run_time = np.asarray(run_data['time'], dtype=float)
+        event_times = run_time[np.asarray(event_indices, dtype=int)]
+        t0 = run_data['strain']['time_offset'] + run_time[0]  # time of the first strain sample
+
+        strain_file = self.data_path.parent / run_data['strain']['filename']
+        with h5py.File(strain_file, 'r') as f:
+            n_channels = tpc5.getNChannels(f)
+            block_index = tpc5.getBlockIndex(f)
+            n_samples = tpc5.getNSamplesTotal(block_index)
+            sampling_rate = block_index['sampleRate']
+            n_before = int(round(window * sampling_rate))
+            n_window = 2 * n_before
+            n_baseline = max(n_window // 100, 1)
+            starts = np.round((event_times - t0) * sampling_rate).astype(np.int64) - n_before
+            enabled = self._run_enabled_channels(run_data, n_channels)
+            runs = self._channel_runs(enabled)
+
+            data = np.full((len(event_times), n_channels, n_window), np.nan, dtype=np.float32)
+            records = []
+            for k, start in enumerate(starts):
+                lo, hi = max(start, 0), min(start + n_window, n_samples)
+                if hi > lo:
+                    for a, b in runs:
+                        tpc5.readChannels(f, range(a + 1, b + 1), lo, hi, out=data[k, a:b, lo - start:hi - start],
+                                          blockIndex=block_index)
+                    baseline = data[k, enabled, lo - start:lo - start + n_baseline]
+                    data[k, enabled] -= np.nanmean(baseline, axis=1, keepdims=True)
+                records.append(EventRecord(run=run_idx, event=k, event_time=float(event_times[k]), start=int(start),
+                                           valid=bool(start >= 0 and start + n_window <= n_samples
+                                                      and np.isfinite(data[k, enabled]).all())))
+
+        instrumentation.count_bytes('extract_event_tensor', data.nbytes)
+        return EventTensor(data, sampling_rate, n_before, records, t0=t0)
+
+    def scan_strain_triggers(self, run_data: Dict[str, Any], detector, chunk_size: int = 2 ** 20) -> Dict[str, np.ndarray]:
+        """Scan the full strain recording of a run for triggers without loading it into memory
+
+        Args:
+            run_data: Dictionary containing run data including strain data
+            detector: StreamingDetector used for the scan
+            chunk_size: Samples read per chunk
+
+        Returns:
+            Trigger catalog of StreamingDetector.scan, with 'time' in the run's time base
+        """
+        if self.data_path is None:
+            raise ValueError("Data path not set. Call set_data_path() first.")
+
+        strain_file = self.data_path.parent / run_data['strain']['filename']
+        with h5py.File(strain_file, 'r') as f:
+            channels = range(1, tpc5.getNChannels(f) + 1)
+            block_index = tpc5.getBlockIndex(f)
+
+            # Blocks are separate segments: each gets its own copy of the detector
+            def scan_block(block):
+                return copy.deepcopy(detector).scan_tpc5(f, channels, block=block, chunk_size=chunk_size)
+            catalogs = self._map_blocks(scan_block, block_index['blocks'])
+
+        catalog = self._merge_block_results(catalogs, block_index, ('on', 'off'))
+        order = np.lexsort((catalog['channel'], catalog['on']))
+        catalog = {key: value[order] for key, value in catalog.items()}
+        # Same time base as the event windows of _process_strain_data
+        catalog['time'] = catalog['on'] / block_index['sampleRate'] + run_data['strain']['time_offset'] + run_data['time'][0]
+        return catalog
+
+    def match_strain_templates(self, run_data: Dict[str, Any], templates: List[np.ndarray], offsets: List[int],
+                               matcher, channels: Optional[Sequence[int]] = None) -> Dict[str, np.ndarray]:
+        """Search the full strain recording of a run for waveforms matching event templates
+
+        Args:
+            run_data: Dictionary containing run data including strain data
+            templates: Templates of shape (n_channels, m), e.g. from TemplateMatcher.templates_from_events
+            offsets: Sample offset of the event time within each template
+            matcher: TemplateMatcher used for the search
+            channels: 0-based channels of the template rows; the first len(templates[0]) if None
+
+        Returns:
+            Detections of TemplateMatcher.scan with 'time' of the matched event in the run's
+            time base and the nearest 'event_index' into run_data['time']
+        """
+        if self.data_path is None:
+            raise ValueError("Data path not set. Call set_data_path() first.")
+
+        strain_file = self.data_path.parent / run_data['strain']['filename']
+        with h5py.File(strain_file, 'r') as f:
+            channels = range(1, len(templates[0]) + 1) if channels is None else [int(j) + 1 for j in channels]
+            block_index = tpc5.getBlockIndex(f)
+
+            def scan_block(block):
+                return copy.deepcopy(matcher).scan_tpc5(f, channels, templates, block=block)
+            detections = self._merge_block_results(self._map_blocks(scan_block, block_index['blocks']),
+                                                   block_index, ('start',))
+        order = np.argsort(detections['start'], kind='stable')
+        detections = {key: value[order] for key, value in detections.items()}
+
+        # Same time base as the event windows of _process_strain_data
+        samples = detections['start'] + np.asarray(offsets, dtype=np.int64)[detections['template']]
+        detections['time'] = samples / block_index['sampleRate'] + run_data['strain']['time_offset'] + run_data['time'][0]
+        run_time = np.asarray(run_data['time'], dtype=float)
+        idx = np.clip(np.searchsorted(run_time, detections['time']), 1, len(run_time) - 1)
+        nearer_before = np.abs(detections['time'] - run_time[idx - 1]) <= np.abs(run_time[idx] - detections['time'])
+        detections['event_index'] = np.where(nearer_before, idx - 1, idx)
+        return detections
+
+    def _map_blocks(self, fn: Callable[[int], Any], blocks: np.ndarray) -> List[Any]:
+        """fn(block) for every TPC5 block, on a thread pool if there are several"""
+        blocks = [int(block) for block in blocks]
+        if len(blocks) == 1 or self.n_workers <= 1:
+            return [fn(block) for block in blocks]
+        with ThreadPoolExecutor(max_workers=min(self.n_workers, len(blocks))) as executor:
+            return list(executor.map(fn, blocks))
+
+    @staticmethod
+    def _merge_block_results(results: List[Dict[str, np.ndarray]], block_index: Dict[str, Any],
+                             sample_keys: tuple) -> Dict[str, np.ndarray]:
+        """Concatenate per-block scan results, moving their sample indices to the global index of the recording"""
+        merged = {}
+        for key in results[0]:
+            if key == 'time':   # relative to each block's trigger; recomputed by the caller
+                continue
+            parts = [result[key] + start if key in sample_keys else result[key]
+                     for result, start in zip(results, block_index['startSamples'])]
+            merged[key] = np.concatenate(parts)
+        return merged
+
+    def trim_strain_file(self, run_data: Dict[str, Any], event_indices: List[int], window: float,
+                         path: Path) -> Dict[str, Any]:
+        """Copy only the strain around events of a run to a new TPC5 file
+
+        Overlapping windows are merged; every merged window becomes one block of the new
+        file (see tpc5.trimToWindows).
+
+        Args:
+            run_data: Dictionary containing run data including strain data
+            event_indices: List of indices marking event locations
+            window: Time window size (in seconds) kept before and after each event
+            path: New TPC5 file
+
+        Returns:
+            Copy of run_data['strain'] referring to the new file; its time_offset is moved
+            to the first kept sample, so the first block keeps the run's time base
+        """
+        if self.data_path is None:
+            raise ValueError("Data path not set. Call set_data_path() first.")
+
+        run_time = np.asarray(run_data['time'], dtype=float)
+        event_times = run_time[np.asarray(event_indices, dtype=int)]
+        t0 = run_data['strain']['time_offset'] + run_time[0]
+        strain_file = self.data_path.parent / run_data['strain']['filename']
+        with h5py.File(strain_file, 'r') as f:
+            if tpc5.getNBlocks(f) > 1:
+                raise ValueError("The strain recording is already split into blocks")
+            sampling_rate = tpc5.getSampleRate(f, 1, 1)
+        n_before = int(round(window * sampling_rate))
+        centers = np.round((event_times - t0) * sampling_rate).astype(np.int64)
+        ranges = tpc5.trimToWindows(strain_file, path, zip(centers - n_before, centers + n_before))
+        if not ranges:
+            raise ValueError("No event window lies inside the strain recording")
+
+        strain = dict(run_data['strain'])
+        try:
+            strain['filename'] = str(Path(path).relative_to(self.data_path.parent))
+        except ValueError:
+            strain['filename'] = str(path)
+        strain['time_offset'] = run_data['strain']['time_offset'] + ranges[0][0] / sampling_rate
+        return strain
 
     def get_data_at_path(self, data: Dict[str, Any], path: str) -> Any:
         """Get data at specified path"""
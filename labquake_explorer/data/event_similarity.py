@@ -0,0 +1,149 @@
+"""Waveform similarity and clustering of events for Labquake Explorer"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import scipy.fft
+from scipy.cluster import hierarchy
+from scipy.spatial.distance import squareform
+from typing import Any, Dict, List, Optional, Sequence
+from labquake_explorer.data.event_stacker import EventStacker
+
+
+class EventSimilarity:
+    """Maximum normalized cross-correlation between all pairs of events, and event families.
+
+    Every channel window is demeaned and scaled to unit energy, and its spectrum is
+    computed once. The cross-spectra of a block of event pairs are formed together;
+    in 'stack' mode the channels are averaged in the frequency domain first (one
+    batched matrix product per frequency), so each pair needs a single inverse FFT.
+    Blocks are sized to a memory budget and run on a thread pool. Families are the
+    clusters of average-linkage hierarchical clustering on 1 - similarity.
+
+    Modes:
+        'stack': Correlation of all channels together, at a common lag
+        'channel': Correlation of each channel at its own best lag, averaged over channels
+    """
+
+    modes = ('stack', 'channel')
+
+    def __init__(self, mode: str = 'stack', max_lag: Optional[int] = None, threshold: float = 0.7,
+                 method: str = 'average', memory_limit: int = 2 ** 28, n_workers: Optional[int] = None):
+        if mode not in self.modes:
+            raise ValueError(f"Unknown similarity mode: {mode}")
+        self.mode = mode
+        self.max_lag = max_lag              # Largest lag searched (samples); a quarter of the window if None
+        self.threshold = threshold          # Smallest similarity linking events of one family
+        self.method = method                # Linkage method of scipy.cluster.hierarchy
+        self.memory_limit = memory_limit    # Bytes of intermediate arrays, shared by all workers
+        self.n_workers = n_workers if n_workers is not None else (os.cpu_count() or 1)
+
+    def spectra(self, windows: np.ndarray, max_lag: int) -> tuple:
+        """Spectra of the unit-energy windows, zero-padded against wrap-around up to max_lag.
+
+        Returns:
+            tuple: (spectra of shape (n_events, n_channels, n_freq), FFT length)
+        """
+        x = np.nan_to_num(np.asarray(windows, dtype=float))
+        x = x - x.mean(axis=-1, keepdims=True)
+        norm = np.sqrt((x ** 2).sum(axis=-1, keepdims=True))
+        x = np.where(norm > 0, x / np.where(norm > 0, norm, 1.0), 0.0)
+        n_fft = scipy.fft.next_fast_len(x.shape[-1] + max_lag, real=True)
+        return scipy.fft.rfft(x, n_fft, axis=-1, workers=self.n_workers), n_fft
+
+    def matrix(self, windows: np.ndarray) -> Dict[str, np.ndarray]:
+        """Similarity of every pair of events.
+
+        Args:
+            windows: Aligned windows of shape (n_events, n_channels, m), e.g. from EventStacker.align
+
+        Returns:
+            Dictionary with 'cc', the (n_events, n_events) similarity, and 'lag', the lag
+            (samples) by which the second event trails the first; per channel, of shape
+            (n_events, n_events, n_channels), in 'channel' mode. The 'channel' mode also
+            gives 'channel_cc' of the same shape.
+        """
+        windows = np.asarray(windows)
+        n_events, n_channels, m = windows.shape
+        max_lag = min(m - 1, m // 4 if self.max_lag is None else int(self.max_lag))
+        spectra, n_fft = self.spectra(windows, max_lag)
+        lags = np.concatenate([np.arange(0, max_lag + 1), np.arange(-max_lag, 0)])
+        lag_index = lags % n_fft
+        n_freq = spectra.shape[-1]
+
+        per_channel = self.mode == 'channel'
+        shape = (n_events, n_events, n_channels) if per_channel else (n_events, n_events)
+        cc = np.ones(shape, dtype=np.float32)
+        best_lag = np.zeros(shape, dtype=np.int32)
+
+        # Block of b x b pairs per task within the memory budget
+        per_pair = (n_freq * 16 + n_fft * 8) * (n_channels if per_channel else 1)
+        budget = self.memory_limit / max(self.n_workers, 1)
+        b = int(max(1, min(n_events, np.sqrt(budget / per_pair))))
+        starts = range(0, n_events, b)
+        tasks = [(i, j) for i in starts for j in starts if j >= i]
+        # Frequency-major layout for the batched matrix products of 'stack' mode
+        by_freq = np.ascontiguousarray(spectra.transpose(2, 0, 1)) if not per_channel else None
+
+        def run(task):
+            i, j = task
+            a, c = slice(i, min(i + b, n_events)), slice(j, min(j + b, n_events))
+            if per_channel:
+                cross = np.conj(spectra[a, np.newaxis]) * spectra[np.newaxis, c]
+            else:
+                cross = (np.conj(by_freq[:, a]) @ by_freq[:, c].transpose(0, 2, 1)).transpose(1, 2, 0) / n_channels
+            correlation = scipy.fft.irfft(cross, n_fft, axis=-1, workers=1)[..., lag_index]
+            k = np.argmax(correlation, axis=-1)
+            value = np.take_along_axis(correlation, k[..., np.newaxis], axis=-1)[..., 0]
+            cc[a, c] = value
+            best_lag[a, c] = lags[k]
+            if j != i:
+                cc[c, a] = np.swapaxes(value, 0, 1)
+                best_lag[c, a] = -np.swapaxes(lags[k], 0, 1)
+
+        with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+            list(executor.map(run, tasks))
+
+        result = {'cc': cc, 'lag': best_lag}
+        if per_channel:
+            result['channel_cc'] = cc
+            result['cc'] = cc.mean(axis=-1)
+        return result
+
+    def cluster(self, cc: np.ndarray) -> tuple:
+        """Families of events from their similarity matrix.
+
+        Returns:
+            tuple: (family label of each event, numbered from 0 by decreasing family size;
+                order of the events along the dendrogram)
+        """
+        n = len(cc)
+        if n < 2:
+            return np.zeros(n, dtype=int), np.arange(n)
+        distance = 1.0 - np.clip((cc + cc.T) / 2, -1.0, 1.0)
+        np.fill_diagonal(distance, 0.0)
+        tree = hierarchy.linkage(squareform(distance, checks=False), method=self.method)
+        clusters = hierarchy.fcluster(tree, t=1.0 - self.threshold, criterion='distance')
+        _, inverse, counts = np.unique(clusters, return_inverse=True, return_counts=True)
+        rank = np.empty(len(counts), dtype=int)
+        rank[np.argsort(-counts, kind='stable')] = np.arange(len(counts))
+        return rank[inverse], hierarchy.leaves_list(tree)
+
+    def cluster_run(self, events: List[Dict[str, Any]], window: tuple = (-2e-4, 8e-4),
+                    channels: Optional[Sequence[int]] = None, alignment: str = 'event') -> Dict[str, np.ndarray]:
+        """Cluster the events of a run by strain waveform and write their 'family' labels.
+
+        Args:
+            events: Events of a run, as extracted by EventProcessor
+            window: (before, after) extent of the compared windows relative to the alignment time (s)
+            channels: 0-based channels compared; the channels enabled in every event if None
+            alignment: Alignment of the windows, see EventStacker
+
+        Returns:
+            Output of matrix, with 'family' labels and the dendrogram 'order'
+        """
+        windows, _ = EventStacker(window=window, alignment=alignment, fractional=False).align(events, channels)
+        result = self.matrix(windows)
+        result['family'], result['order'] = self.cluster(result['cc'])
+        for event, family in zip(events, result['family']):
+            event['family'] = int(family)
+        return result
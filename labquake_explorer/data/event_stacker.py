@@ -0,0 +1,142 @@
+"""Event-aligned stacking of strain waveforms for Labquake Explorer"""
+import warnings
+import numpy as np
+import scipy.fft
+from typing import Any, Dict, List, Optional, Sequence
+from labquake_explorer.data.event_processor import EventProcessor
+
+
+class EventStacker:
+    """Aligns the strain windows of many events and computes ensemble statistics.
+
+    Each channel of each event is cut around an alignment time, by default its picked
+    rupture arrival. The whole-sample part of the shift is taken by indexing and the
+    remaining fraction of a sample by a linear phase in the frequency domain, applied
+    to all windows in one batched FFT. Mean, standard deviation, median and percentile
+    envelopes are then reductions over the event axis.
+
+    Alignments:
+        'arrival': Per-channel arrival times under strain/original (key)
+        'event': Event time, the same for all channels
+    """
+
+    alignments = ('arrival', 'event')
+
+    def __init__(self, window: tuple = (-2e-4, 8e-4), alignment: str = 'arrival', key: str = 'rupture_arrival_time',
+                 percentiles: tuple = (5.0, 95.0), fractional: bool = True, normalize: bool = False,
+                 n_workers: int = 1):
+        if alignment not in self.alignments:
+            raise ValueError(f"Unknown alignment: {alignment}")
+        self.window = window            # (before, after) extent of the stack relative to the alignment time (s)
+        self.alignment = alignment
+        self.key = key                  # Arrival times used for the 'arrival' alignment
+        self.percentiles = percentiles  # Lower and upper envelope percentiles
+        self.fractional = fractional    # Shift by fractions of a sample as well
+        self.normalize = normalize      # Scale every window to unit peak amplitude before stacking
+        self.n_workers = n_workers      # Threads used by the FFTs
+
+    margin = 16  # Extra samples cut on both sides of a window to absorb FFT wrap-around
+
+    @staticmethod
+    def shift(windows: np.ndarray, fraction: np.ndarray, n_workers: int = 1) -> np.ndarray:
+        """Shift windows by a fraction of a sample: out[..., n] = windows[..., n + fraction].
+
+        Args:
+            windows: Shape (..., m); NaNs are treated as zeros
+            fraction: Shifts in samples, broadcastable to windows.shape[:-1]
+
+        Returns:
+            Shifted windows of the same shape
+        """
+        m = windows.shape[-1]
+        n_fft = scipy.fft.next_fast_len(m, real=True)
+        spectrum = scipy.fft.rfft(np.nan_to_num(windows), n_fft, axis=-1, workers=n_workers)
+        phase = np.exp(2j * np.pi * np.fft.rfftfreq(n_fft) * np.asarray(fraction)[..., np.newaxis])
+        return scipy.fft.irfft(spectrum * phase, n_fft, axis=-1, workers=n_workers)[..., :m]
+
+    def _alignment_times(self, event: Dict[str, Any], n_channels: int) -> np.ndarray:
+        if self.alignment == 'event':
+            return np.full(n_channels, float(event['event_time']))
+        arrivals = event['strain']['original'].get(self.key)
+        times = np.full(n_channels, np.nan)
+        if arrivals is not None:
+            arrivals = np.asarray(arrivals, dtype=float)[:n_channels]
+            times[:len(arrivals)] = arrivals
+        return times
+
+    def align(self, events: List[Dict[str, Any]], channels: Optional[Sequence[int]] = None) -> tuple:
+        """Cut every channel of every event around its alignment time.
+
+        Args:
+            events: Events of a run, as extracted by EventProcessor
+            channels: 0-based channels to stack; the channels enabled in every event if None
+
+        Returns:
+            tuple: (windows of shape (n_events, n_channels, m) with NaN where no data
+                or no arrival, time of each window sample relative to the alignment (s))
+        """
+        if not events:
+            raise ValueError("No events to stack")
+        fs = 1.0 / np.median(np.diff(np.asarray(events[0]['strain']['original']['time'][:1001], dtype=float)))
+        n_before = int(round(-self.window[0] * fs))
+        m = int(round(self.window[1] * fs)) + n_before + 1
+        offsets = np.arange(-n_before - self.margin, m - n_before + self.margin)
+
+        channels = EventProcessor.enabled_channels(events) if channels is None else np.asarray(channels, dtype=int)
+        n_cut = len(offsets)
+        cut = np.full((len(events), len(channels), n_cut), np.nan)
+        fraction = np.zeros((len(events), len(channels)))
+        for k, event in enumerate(events):
+            original = event['strain']['original']
+            raw = np.atleast_2d(original['raw'])
+            t = np.asarray(original['time'], dtype=float)
+            times = self._alignment_times(event, raw.shape[0])[channels]
+            position = (times - t[0]) * fs  # fractional sample of the alignment time
+            usable = np.isfinite(position)
+            whole = np.floor(np.where(usable, position, 0.0)).astype(np.int64)
+            fraction[k] = np.where(usable, position - whole, 0.0)
+            idx = whole[:, np.newaxis] + offsets
+            inside = (idx >= 0) & (idx < raw.shape[1]) & usable[:, np.newaxis]
+            cut[k] = np.where(inside, raw[channels[:, np.newaxis], np.clip(idx, 0, raw.shape[1] - 1)], np.nan)
+
+        missing = np.isnan(cut)
+        if self.fractional:
+            cut = self.shift(cut, fraction, self.n_workers)
+            # A missing sample spoils its neighbours after the shift
+            missing |= np.roll(missing, -1, axis=-1)
+            cut[missing] = np.nan
+        windows = cut[..., self.margin:self.margin + m]
+        if self.normalize:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)  # windows without data
+                peak = np.nanmax(np.abs(windows), axis=-1, keepdims=True)
+            windows = np.where(peak > 0, windows / np.where(peak > 0, peak, 1.0), np.nan)
+        return windows, (np.arange(m) - n_before) / fs
+
+    def stack(self, windows: np.ndarray) -> Dict[str, np.ndarray]:
+        """Ensemble statistics over the event axis of aligned windows.
+
+        Returns:
+            Dictionary of arrays of shape (n_channels, m): 'mean', 'std', 'median',
+            'low' and 'high' percentile envelopes and 'count' of events contributing
+        """
+        count = np.isfinite(windows).sum(axis=0)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # samples without any event
+            if np.all(count == len(windows)):
+                mean, std = windows.mean(axis=0), windows.std(axis=0)
+                low, median, high = np.percentile(windows, [self.percentiles[0], 50, self.percentiles[1]], axis=0)
+            else:
+                mean, std = np.nanmean(windows, axis=0), np.nanstd(windows, axis=0)
+                low, median, high = np.nanpercentile(windows, [self.percentiles[0], 50, self.percentiles[1]], axis=0)
+        return {'mean': mean, 'std': std, 'median': median, 'low': low, 'high': high, 'count': count}
+
+    def stack_events(self, events: List[Dict[str, Any]], channels: Optional[Sequence[int]] = None) -> Dict[str, np.ndarray]:
+        """Align and stack events; see align and stack. Adds 'time', the 'windows' stacked and their 'channels'."""
+        channels = EventProcessor.enabled_channels(events) if channels is None else np.asarray(channels, dtype=int)
+        windows, time = self.align(events, channels)
+        result = self.stack(windows)
+        result['time'] = time
+        result['windows'] = windows
+        result['channels'] = channels
+        return result
@@ -0,0 +1,154 @@
+"""Dense event-aligned strain storage for Labquake Explorer"""
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence
+
+
+class EventRecord:
+    """Scalars of one event in an EventTensor."""
+
+    __slots__ = ('run', 'event', 'event_time', 'start', 'valid',
+                 'rupture_speed', 'rupture_speed_uncertainty', 'stress_drop')
+
+    def __init__(self, run: int = -1, event: int = -1, event_time: float = np.nan, start: int = 0,
+                 valid: bool = True, rupture_speed: float = np.nan, rupture_speed_uncertainty: float = np.nan,
+                 stress_drop: float = np.nan):
+        self.run = run                                              # Run index
+        self.event = event                                          # Event index within the run
+        self.event_time = event_time                                # Event time in the run's time base (s)
+        self.start = start                                          # First sample of the window in its record
+        self.valid = valid                                          # Whether the whole window lies within the record
+        self.rupture_speed = rupture_speed
+        self.rupture_speed_uncertainty = rupture_speed_uncertainty
+        self.stress_drop = stress_drop
+
+    @classmethod
+    def from_event(cls, event: Dict[str, Any], run: int = -1, event_idx: int = -1, **kwargs) -> 'EventRecord':
+        """Record of the saved scalars of an extracted event."""
+        analysis = event.get('event_analysis')
+        return cls(run=run, event=event_idx, event_time=float(event.get('event_time', np.nan)),
+                   rupture_speed=float(event.get('rupture_speed', np.nan)),
+                   rupture_speed_uncertainty=float(event.get('rupture_speed_uncertainty', np.nan)),
+                   stress_drop=float(analysis.get('stress_drop', np.nan)) if isinstance(analysis, dict) else np.nan,
+                   **kwargs)
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"EventRecord({fields})"
+
+
+class EventTensor:
+    """Strain windows of many events in one (n_events, n_channels, n_samples) array.
+
+    Every window has the same number of samples, and sample align_index of each
+    window is the sample at the event time, so operations across events (stacking,
+    averaging, SVD, correlation) are single NumPy calls along axis 0. Samples outside
+    the recording are NaN.
+    """
+
+    def __init__(self, data: np.ndarray, fs: float, align_index: int, records: Optional[List[EventRecord]] = None,
+                 t0: float = 0.0):
+        """
+        Args:
+            data: Strain windows of shape (n_events, n_channels, n_samples)
+            fs: Sampling rate (Hz)
+            align_index: Sample of the event time within every window
+            records: Scalars of each event
+            t0: Time of the first sample of the record the windows were cut from (s), so
+                that window k starts at t0 + records[k].start / fs
+        """
+        self.data = np.asarray(data)
+        if self.data.ndim != 3:
+            raise ValueError("Event tensor data must have shape (n_events, n_channels, n_samples)")
+        self.fs = float(fs)
+        self.align_index = int(align_index)
+        self.t0 = float(t0)
+        self.records = records if records is not None else [EventRecord(event=k) for k in range(len(self.data))]
+        if len(self.records) != len(self.data):
+            raise ValueError("One record per event is required")
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    @property
+    def n_channels(self) -> int:
+        return self.data.shape[1]
+
+    @property
+    def n_samples(self) -> int:
+        return self.data.shape[2]
+
+    @property
+    def time(self) -> np.ndarray:
+        """Time of every window sample relative to the event time (s)."""
+        return (np.arange(self.n_samples) - self.align_index) / self.fs
+
+    @property
+    def valid(self) -> np.ndarray:
+        return np.array([record.valid for record in self.records], dtype=bool)
+
+    def scalars(self, name: str) -> np.ndarray:
+        """One record field of all events as an array, e.g. scalars('rupture_speed')."""
+        return np.array([getattr(record, name) for record in self.records])
+
+    def select(self, mask: Sequence) -> 'EventTensor':
+        """Tensor of a subset of events, given as a boolean mask or indices."""
+        idx = np.flatnonzero(mask) if np.asarray(mask).dtype == bool else np.asarray(mask, dtype=int)
+        return EventTensor(self.data[idx], self.fs, self.align_index, [self.records[i] for i in idx], self.t0)
+
+    def mean(self) -> np.ndarray:
+        """Average waveform over events, shape (n_channels, n_samples)."""
+        return np.nanmean(self.data, axis=0)
+
+    def svd(self, channel: int) -> tuple:
+        """Singular value decomposition of one channel, rows being events.
+
+        Returns:
+            tuple: (U, S, Vt) of the (n_events, n_samples) matrix, NaNs taken as 0
+        """
+        return np.linalg.svd(np.nan_to_num(self.data[:, channel]), full_matrices=False)
+
+    def correlation(self, channel: int) -> np.ndarray:
+        """Zero-lag correlation coefficients between the windows of all events, (n_events, n_events)."""
+        x = np.nan_to_num(self.data[:, channel])
+        x = x - x.mean(axis=1, keepdims=True)
+        norm = np.linalg.norm(x, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x = np.where(norm[:, np.newaxis] > 0, x / norm[:, np.newaxis], 0.0)
+        return x @ x.T
+
+    @classmethod
+    def from_events(cls, events: List[Dict[str, Any]], n_before: Optional[int] = None,
+                    n_after: Optional[int] = None, run: int = -1) -> 'EventTensor':
+        """Align the strain/original windows of extracted events on their event times.
+
+        Args:
+            events: Events of a run, as extracted by EventProcessor
+            n_before: Samples kept before the event time; the shortest available if None
+            n_after: Samples kept from the event time on; the shortest available if None
+            run: Run index stored in the records
+
+        Returns:
+            EventTensor; windows not covering n_before and n_after are NaN-padded and
+            marked invalid
+        """
+        if not events:
+            raise ValueError("No events to stack")
+        times = [np.asarray(event['strain']['original']['time'], dtype=float) for event in events]
+        raws = [np.atleast_2d(np.asarray(event['strain']['original']['raw'], dtype=float)) for event in events]
+        centers = [int(np.searchsorted(t, event['event_time'])) for t, event in zip(times, events)]
+        fs = 1.0 / np.median(np.diff(times[0]))
+        if n_before is None:
+            n_before = min(centers)
+        if n_after is None:
+            n_after = min(len(t) - c for t, c in zip(times, centers))
+
+        n_channels = max(raw.shape[0] for raw in raws)
+        data = np.full((len(events), n_channels, n_before + n_after), np.nan)
+        records = []
+        for k, (raw, center, event) in enumerate(zip(raws, centers, events)):
+            lo, hi = max(center - n_before, 0), min(center + n_after, raw.shape[1])
+            offset = lo - (center - n_before)
+            data[k, :raw.shape[0], offset:offset + hi - lo] = raw[:, lo:hi]
+            records.append(EventRecord.from_event(event, run, k, start=center - n_before,
+                                                  valid=offset == 0 and hi - lo == n_before + n_after))
+        return cls(data, fs, n_before, records)
@@ -0,0 +1,74 @@
+"""Cache of filtered strain signals for Labquake Explorer"""
+from collections import OrderedDict
+from typing import Any, Optional, Sequence
+import numpy as np
+from labquake_explorer.data.data_processor import FilterPipeline
+
+
+class FilterCache:
+    """LRU cache of filtered strain channels.
+
+    Entries are keyed by (file, run, event, channel, FilterPipeline), so views can
+    redraw and refit without filtering the same data again. On a miss every missing
+    channel of the event is filtered in one vectorized call along the last axis.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def filtered(self, file: Any, run_idx: int, event_idx: int, raw: np.ndarray, pipeline: FilterPipeline,
+                 channels: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Return filtered channels of an event's (n_channels, n_samples) array.
+
+        Args:
+            file: Data file the event belongs to
+            run_idx: Run index
+            event_idx: Event index
+            raw: Unfiltered (n_channels, n_samples) data of the event
+            pipeline: Filter applied to the channels; part of the cache key
+            channels: Channels to return; all channels if None
+
+        Returns:
+            Array of shape (len(channels), n_samples)
+        """
+        n_channels = len(raw)
+        if channels is None:
+            channels = range(n_channels)
+        prefix = (str(file), int(run_idx), int(event_idx))
+
+        missing = [j for j in range(n_channels) if prefix + (j, pipeline) not in self._entries]
+        if missing:
+            data = np.asarray(raw[missing], dtype=float)
+            result = pipeline.apply(data)
+            for row, j in zip(result, missing):
+                row.setflags(write=False)
+                self._entries[prefix + (j, pipeline)] = row
+
+        rows = []
+        for j in channels:
+            key = prefix + (int(j), pipeline)
+            self._entries.move_to_end(key)
+            rows.append(self._entries[key])
+        self._evict()
+        return np.stack(rows)
+
+    def invalidate(self, file: Any = None, run_idx: Optional[int] = None, event_idx: Optional[int] = None) -> None:
+        """Drop entries matching the given file, run and event (None matches any)."""
+        def matches(key):
+            return ((file is None or key[0] == str(file)) and
+                    (run_idx is None or key[1] == run_idx) and
+                    (event_idx is None or key[2] == event_idx))
+        for key in [key for key in self._entries if matches(key)]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        self._entries.clear()
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,129 @@
+"""Strain windows stored as raw ADC counts for Labquake Explorer"""
+import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
+from typing import Optional
+
+
+class RawStrainArray(NDArrayOperatorsMixin):
+    """Strain windows kept as the integer counts of the recording, scaled to volts on access.
+
+    The voltage of channel (row) j is counts[j] * factor[j] + constant[j], as in
+    tpc5.getVoltageData. Indexing scales only the selected samples; np.asarray, numpy
+    functions and arithmetic scale the whole array into a new float array of dtype, which
+    is not kept. int16 counts take a quarter of the memory of float64 volts.
+
+    Channels whose factor is NaN (e.g. disabled channels that were not read) read as NaN,
+    and so do samples marked in missing (e.g. gaps between the blocks of a recording).
+    """
+
+    hdf5_class = 'RawStrainArray'   # 'class' attribute of the HDF5 group of a saved array
+
+    def __init__(self, counts: np.ndarray, factor, constant, dtype=np.float64, missing: Optional[np.ndarray] = None):
+        self.counts = np.asarray(counts)
+        if self.counts.ndim != 2:
+            raise ValueError("counts must have shape (n_channels, n_samples)")
+        n_channels = self.counts.shape[0]
+        self.factor = np.broadcast_to(np.asarray(factor, dtype=float), (n_channels,)).copy()
+        self.constant = np.broadcast_to(np.asarray(constant, dtype=float), (n_channels,)).copy()
+        self.dtype = np.dtype(dtype)
+        # Boolean, broadcastable to counts (e.g. one row for all channels); True where no sample was recorded
+        self.missing = None if missing is None else np.asarray(missing, dtype=bool)
+        if self.missing is not None:
+            np.broadcast_to(self.missing, self.counts.shape)
+
+    @property
+    def shape(self) -> tuple:
+        return self.counts.shape
+
+    @property
+    def ndim(self) -> int:
+        return 2
+
+    @property
+    def size(self) -> int:
+        return self.counts.size
+
+    @property
+    def nbytes(self) -> int:
+        return (self.counts.nbytes + self.factor.nbytes + self.constant.nbytes +
+                (self.missing.nbytes if self.missing is not None else 0))
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def __repr__(self) -> str:
+        return f"RawStrainArray(shape={self.shape}, counts={self.counts.dtype}, dtype={self.dtype})"
+
+    def voltage(self, dtype=None) -> np.ndarray:
+        """All windows in volts"""
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+        out = self.counts.astype(dtype)
+        out *= self.factor[:, np.newaxis].astype(dtype)
+        out += self.constant[:, np.newaxis].astype(dtype)
+        if self.missing is not None:
+            out[np.broadcast_to(self.missing, self.shape)] = np.nan
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        if copy is False:
+            raise ValueError("A RawStrainArray is always scaled into a new array")
+        return self.voltage(dtype)
+
+    def __getitem__(self, key) -> np.ndarray:
+        # Broadcast views give the scaling of exactly the selected samples
+        factor = np.broadcast_to(self.factor[:, np.newaxis], self.shape)[key]
+        constant = np.broadcast_to(self.constant[:, np.newaxis], self.shape)[key]
+        out = (self.counts[key] * factor + constant).astype(self.dtype, copy=False)
+        if self.missing is not None:
+            out = np.where(np.broadcast_to(self.missing, self.shape)[key], np.nan, out).astype(self.dtype, copy=False)
+        return out
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = tuple(x.voltage() if isinstance(x, RawStrainArray) else x for x in inputs)
+        if 'out' in kwargs:
+            kwargs['out'] = tuple(x.voltage() if isinstance(x, RawStrainArray) else x for x in kwargs['out'])
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __getattr__(self, name):
+        # Other ndarray attributes (T, mean, max, ...) act on the scaled array
+        if name.startswith('__') or name in ('counts', 'factor', 'constant', 'dtype', 'missing'):
+            raise AttributeError(name)
+        return getattr(self.voltage(), name)
+
+    def astype(self, dtype) -> np.ndarray:
+        return self.voltage(dtype)
+
+    def copy(self) -> 'RawStrainArray':
+        return RawStrainArray(self.counts.copy(), self.factor, self.constant, self.dtype,
+                              None if self.missing is None else self.missing.copy())
+
+    def scaled(self, gain: float, offset: float = 0.0) -> 'RawStrainArray':
+        """gain * self + offset on the same counts, e.g. to convert volts to strain"""
+        return RawStrainArray(self.counts, self.factor * gain, self.constant * gain + offset, self.dtype, self.missing)
+
+    @classmethod
+    def from_voltage(cls, voltage: np.ndarray, factor, constant=0.0, dtype: Optional[np.dtype] = None) -> 'RawStrainArray':
+        """Quantize volts to int16 counts with the given per-channel scaling"""
+        voltage = np.atleast_2d(voltage)
+        factor = np.broadcast_to(np.asarray(factor, dtype=float), (voltage.shape[0],))
+        constant = np.broadcast_to(np.asarray(constant, dtype=float), (voltage.shape[0],))
+        counts = np.rint((voltage - constant[:, np.newaxis]) / factor[:, np.newaxis])
+        missing = np.isnan(counts)
+        counts = np.clip(np.nan_to_num(counts), -32768, 32767).astype(np.int16)
+        return cls(counts, factor, constant, dtype if dtype is not None else voltage.dtype,
+                   missing if missing.any() else None)
+
+    def save_hdf5(self, group) -> None:
+        """Write to an empty h5py group"""
+        group.attrs['class'] = self.hdf5_class
+        group.attrs['dtype'] = self.dtype.str
+        group.create_dataset('counts', data=self.counts, compression="gzip", shuffle=True)
+        group.create_dataset('binToVoltFactor', data=self.factor)
+        group.create_dataset('binToVoltConstant', data=self.constant)
+        if self.missing is not None:
+            group.create_dataset('missing', data=self.missing, compression="gzip")
+
+    @classmethod
+    def load_hdf5(cls, group) -> 'RawStrainArray':
+        return cls(group['counts'][()], group['binToVoltFactor'][()], group['binToVoltConstant'][()],
+                   np.dtype(group.attrs.get('dtype', '<f8')), group['missing'][()] if 'missing' in group else None)
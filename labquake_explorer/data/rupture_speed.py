@@ -0,0 +1,134 @@
+"""Robust rupture speed estimation for Labquake Explorer"""
+import warnings
+import numpy as np
+from scipy import stats
+from typing import Dict, Any, List, Optional, Sequence
+
+
+class RuptureSpeedEstimator:
+    """Theil-Sen fit of arrival time against gauge location, for many events at once.
+
+    The slope is the median of the slopes between all pairs of usable gauges, so a
+    single bad pick cannot drag the rupture speed. Confidence intervals follow
+    Sen (1968), as in scipy.stats.theilslopes. Speeds use the convention of
+    DynamicStrainArrivalPickerView: locations in mm, speed = -1e-3 / slope in m/s.
+    """
+
+    def __init__(self, confidence: float = 0.95):
+        self.confidence = confidence
+
+    def theil_sen(self, arrival_times: np.ndarray, locations: np.ndarray, mask: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """Fit arrival_time = slope * location + intercept for every event.
+
+        Args:
+            arrival_times: Shape (n_events, n_channels); NaN marks missing picks
+            locations: Shape (n_channels,) or (n_events, n_channels)
+            mask: Channels used per event, broadcastable to arrival_times
+
+        Returns:
+            Dictionary of arrays of shape (n_events,): 'slope', 'intercept',
+            'slope_low', 'slope_high' and 'n' (number of gauges used). The slope
+            bounds are NaN for fewer than three gauges, whose few pairwise slopes
+            cannot bound the slope.
+        """
+        t = np.atleast_2d(np.asarray(arrival_times, dtype=float))
+        x = np.broadcast_to(np.asarray(locations, dtype=float), t.shape)
+        valid = np.isfinite(t) & np.isfinite(x)
+        if mask is not None:
+            valid &= np.broadcast_to(np.asarray(mask, dtype=bool), t.shape)
+
+        # Slopes between every pair of gauges, (n_events, n_pairs)
+        i, j = np.triu_indices(t.shape[1], k=1)
+        dx = x[:, j] - x[:, i]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slopes = (t[:, j] - t[:, i]) / dx
+        slopes = np.where(valid[:, i] & valid[:, j] & (dx != 0), slopes, np.nan)
+        slopes = np.concatenate([slopes, np.full((len(t), 1), np.nan)], axis=1)  # keeps rank lookups valid
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # events without usable pairs
+            slope = np.nanmedian(slopes, axis=1)
+            intercept = np.nanmedian(np.where(valid, t - slope[:, np.newaxis] * x, np.nan), axis=1)
+        n = valid.sum(axis=1)
+
+        # Rank-based confidence interval on the slope
+        n_slopes = np.isfinite(slopes).sum(axis=1)
+        z = stats.norm.ppf(0.5 + self.confidence / 2)
+        sigma = np.sqrt(n * (n - 1) * (2 * n + 5) / 18.0)
+        low_rank = np.clip(np.round((n_slopes - z * sigma) / 2).astype(int) - 1, 0, None)
+        high_rank = np.clip(np.round((n_slopes + z * sigma) / 2).astype(int), None, np.maximum(n_slopes - 1, 0))
+        low_rank = np.minimum(low_rank, np.maximum(n_slopes - 1, 0))
+        ordered = np.sort(slopes, axis=1)  # NaNs sort last
+        slope_low = np.take_along_axis(ordered, low_rank[:, np.newaxis], axis=1)[:, 0]
+        slope_high = np.take_along_axis(ordered, high_rank[:, np.newaxis], axis=1)[:, 0]
+
+        usable = n >= 2
+        # A single pairwise slope, or bounds of the same rank, would give a zero-width interval
+        bounded = usable & (n >= 3) & (low_rank < high_rank)
+        return {
+            'slope': np.where(usable, slope, np.nan),
+            'intercept': np.where(usable, intercept, np.nan),
+            'slope_low': np.where(bounded, slope_low, np.nan),
+            'slope_high': np.where(bounded, slope_high, np.nan),
+            'n': n
+        }
+
+    def speeds(self, arrival_times: np.ndarray, locations: np.ndarray, mask: Optional[np.ndarray] = None) -> tuple:
+        """Rupture speed and its uncertainty for every event.
+
+        Returns:
+            tuple: (speeds, uncertainties, fit) where the uncertainty is half the width
+                of the speed confidence interval, NaN if theil_sen gives no interval,
+                and fit is the output of theil_sen
+        """
+        fit = self.theil_sen(arrival_times, locations, mask)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            speeds = -1e-3 / fit['slope']
+            bounds = -1e-3 / np.stack([fit['slope_low'], fit['slope_high']])
+            # An interval that includes zero slope has an unbounded speed
+            unbounded = np.isfinite(fit['slope_low']) & (np.sign(fit['slope_low']) != np.sign(fit['slope_high']))
+            uncertainties = np.where(unbounded, np.inf, np.abs(bounds[0] - bounds[1]) / 2)
+        return speeds, uncertainties, fit
+
+    def estimate_run(self, events: List[Dict[str, Any]], fitting_channels: Optional[Sequence[bool]] = None,
+                     locations: Optional[Sequence[float]] = None, key: str = "rupture_arrival_time") -> tuple:
+        """Robust rupture speed of every event of a run from its stored arrival times.
+
+        Arrival times of all events are stacked into one array and fitted in a single
+        batched computation. Channel selections and locations saved in an event take
+        precedence over the defaults given here. Writes rupture_speed and
+        rupture_speed_uncertainty to each event that has enough arrivals.
+
+        Args:
+            events: Events of a run
+            fitting_channels: Default channels used for the fit
+            locations: Default gauge locations along the fault (mm)
+            key: Arrival times under strain/original to use, e.g. 'xcorr_arrival_time'
+
+        Returns:
+            tuple: (speeds, uncertainties), each of shape (n_events,)
+        """
+        n_events = len(events)
+        if n_events == 0:
+            return np.array([]), np.array([])
+        n_channels = max(len(event["strain"]["original"]["raw"]) for event in events)
+        arrival_times = np.full((n_events, n_channels), np.nan)
+        all_locations = np.full((n_events, n_channels), np.nan)
+        mask = np.zeros((n_events, n_channels), dtype=bool)
+        for k, event in enumerate(events):
+            strain = event["strain"]
+            arrivals = strain["original"].get(key)
+            fitting = strain.get("fitting_channels", fitting_channels)
+            loc = strain.get("locations", locations)
+            if arrivals is None or fitting is None or loc is None:
+                continue
+            n = min(len(arrivals), len(fitting), len(loc), n_channels)
+            arrival_times[k, :n] = np.asarray(arrivals[:n], dtype=float)
+            all_locations[k, :n] = np.asarray(loc[:n], dtype=float)
+            mask[k, :n] = np.asarray(fitting[:n], dtype=bool)
+
+        speeds, uncertainties, _ = self.speeds(arrival_times, all_locations, mask)
+        for event, speed, uncertainty in zip(events, speeds, uncertainties):
+            if np.isfinite(speed):
+                event["rupture_speed"] = float(speed)
+                event["rupture_speed_uncertainty"] = float(uncertainty)
+        return speeds, uncertainties
@@ -0,0 +1,197 @@
+"""Streaming trigger detection over long strain recordings for Labquake Explorer"""
+import numpy as np
+from scipy import signal
+from typing import Callable, Dict, List, Optional, Sequence
+from labquake_explorer.utils import tpc5
+
+
+class StreamingDetector:
+    """Recursive STA/LTA or energy-envelope trigger over records too large for memory.
+
+    The record is read one chunk at a time. Running averages are first-order recursive
+    filters (scipy.signal.lfilter) whose state is carried from chunk to chunk, so the
+    characteristic function and the triggers are identical to processing the whole
+    record at once, while memory stays bounded by the chunk size.
+
+    Modes:
+        'sta_lta': Ratio of short- and long-term averages of the squared, demeaned
+            signal; on and off are ratios.
+        'energy': RMS envelope over the short-term window; on and off are amplitudes
+            in signal units.
+    """
+
+    modes = ('sta_lta', 'energy')
+
+    def __init__(self, mode: str = 'sta_lta', n_sta: int = 50, n_lta: int = 5000, on: float = 4.0,
+                 off: float = 1.5, n_mean: Optional[int] = None):
+        if mode not in self.modes:
+            raise ValueError(f"Unknown detector mode: {mode}")
+        if off > on:
+            raise ValueError("The off threshold must not exceed the on threshold")
+        self.mode = mode
+        self.n_sta = n_sta                                      # STA window (samples)
+        self.n_lta = n_lta                                      # LTA window (samples)
+        self.on = on                                            # Trigger on threshold
+        self.off = off                                          # Trigger off threshold
+        self.n_mean = n_lta if n_mean is None else n_mean       # Window of the running mean removed (samples)
+        self._state = None
+
+    def reset(self) -> None:
+        """Forget the carried state, e.g. before scanning another record."""
+        self._state = None
+
+    @staticmethod
+    def _average(x: np.ndarray, n: int, zi: np.ndarray) -> tuple:
+        """Exponential moving average over about n samples along the last axis."""
+        alpha = 1.0 / n
+        return signal.lfilter([alpha], [1.0, alpha - 1.0], x, axis=-1, zi=zi)
+
+    def characteristic(self, chunk: np.ndarray) -> np.ndarray:
+        """Characteristic function of the next chunk of the record, updating the carried state.
+
+        Args:
+            chunk: Samples of shape (n_channels, n), following the previous chunk
+
+        Returns:
+            Characteristic function of shape (n_channels, n)
+        """
+        x = np.atleast_2d(np.asarray(chunk, dtype=float))
+        n_channels, n = x.shape
+        if self._state is None:
+            # Start the running mean at the first sample and the averages at zero energy
+            first = x[:, :1]
+            self._state = {
+                'mean': first * (1.0 - 1.0 / self.n_mean),
+                'sta': np.zeros((n_channels, 1)),
+                'lta': np.zeros((n_channels, 1)),
+                'position': 0,
+                'triggered': np.zeros(n_channels, dtype=bool),
+                'onset': np.zeros(n_channels, dtype=np.int64),
+                'peak': np.zeros(n_channels),
+            }
+        state = self._state
+
+        mean, state['mean'] = self._average(x, self.n_mean, state['mean'])
+        energy = (x - mean) ** 2
+        sta, state['sta'] = self._average(energy, self.n_sta, state['sta'])
+        if self.mode == 'energy':
+            cf = np.sqrt(sta)
+        else:
+            lta, state['lta'] = self._average(energy, self.n_lta, state['lta'])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cf = np.where(lta > 0, sta / lta, 0.0)
+
+        # LTA (and running mean) not yet established
+        warm_up = max(self.n_lta if self.mode == 'sta_lta' else self.n_sta, self.n_mean) - state['position']
+        if warm_up > 0:
+            cf[:, :warm_up] = 0.0
+        return cf
+
+    def process(self, chunk: np.ndarray) -> List[tuple]:
+        """Detect triggers in the next chunk of the record.
+
+        Args:
+            chunk: Samples of shape (n_channels, n), following the previous chunk
+
+        Returns:
+            Triggers that ended within the chunk, as (channel, on, off, peak) tuples with
+            on and off sample indices counted from the start of the record
+        """
+        cf = self.characteristic(chunk)
+        state = self._state
+        start = state['position']
+        n = cf.shape[1]
+        triggers = []
+        if n == 0:
+            return triggers
+
+        # Hysteresis: above on switches on, below off switches off, otherwise hold
+        switch = np.where(cf > self.on, 1, np.where(cf < self.off, 0, -1))
+        idx = np.where(switch >= 0, np.arange(n), -1)
+        np.maximum.accumulate(idx, axis=1, out=idx)
+        held = np.take_along_axis(switch, np.maximum(idx, 0), axis=1)
+        active = np.where(idx >= 0, held == 1, state['triggered'][:, np.newaxis])
+        edges = np.diff(np.concatenate([state['triggered'][:, np.newaxis], active], axis=1).astype(np.int8), axis=1)
+
+        for channel in np.flatnonzero(edges.any(axis=1) | state['triggered']):
+            # Peak of the characteristic function over every active stretch
+            changes = np.flatnonzero(edges[channel])
+            bounds = np.unique(np.concatenate([[0], changes]))
+            peaks = np.maximum.reduceat(np.where(active[channel], cf[channel], -np.inf), bounds)
+            peak = max(state['peak'][channel], peaks[0]) if state['triggered'][channel] else state['peak'][channel]
+            onset = state['onset'][channel]
+            for i in changes:
+                if edges[channel, i] == 1:
+                    onset, peak = start + i, peaks[np.searchsorted(bounds, i)]
+                else:
+                    triggers.append((int(channel), int(onset), int(start + i), float(peak)))
+            state['triggered'][channel] = active[channel, -1]
+            state['onset'][channel] = onset
+            state['peak'][channel] = peak
+
+        state['position'] = start + n
+        return triggers
+
+    def finish(self) -> List[tuple]:
+        """Close triggers still on at the end of the record."""
+        if self._state is None:
+            return []
+        state = self._state
+        return [(int(channel), int(state['onset'][channel]), int(state['position']), float(state['peak'][channel]))
+                for channel in np.flatnonzero(state['triggered'])]
+
+    def scan(self, read: Callable[[int, int], np.ndarray], n_samples: int, chunk_size: int = 2 ** 20,
+             fs: Optional[float] = None, t0: float = 0.0) -> Dict[str, np.ndarray]:
+        """Scan a whole record and return its trigger catalog.
+
+        Args:
+            read: read(start, stop) -> array of shape (n_channels, stop - start)
+            n_samples: Total number of samples in the record
+            chunk_size: Samples read per chunk
+            fs: Sampling rate (Hz), used for the trigger times
+            t0: Time of the first sample (s)
+
+        Returns:
+            Catalog with one entry per trigger, ordered by onset: 'channel', 'on' and 'off'
+            sample indices, 'peak' of the characteristic function and, if fs is given,
+            'time' and 'duration' in seconds
+        """
+        self.reset()
+        triggers = []
+        for start in range(0, n_samples, chunk_size):
+            triggers += self.process(read(start, min(start + chunk_size, n_samples)))
+        triggers += self.finish()
+        triggers.sort(key=lambda trigger: (trigger[1], trigger[0]))
+
+        catalog = {
+            'channel': np.array([t[0] for t in triggers], dtype=int),
+            'on': np.array([t[1] for t in triggers], dtype=np.int64),
+            'off': np.array([t[2] for t in triggers], dtype=np.int64),
+            'peak': np.array([t[3] for t in triggers], dtype=float),
+        }
+        if fs is not None:
+            catalog['time'] = t0 + catalog['on'] / fs
+            catalog['duration'] = (catalog['off'] - catalog['on']) / fs
+        return catalog
+
+    def scan_tpc5(self, fileRef, channels: Sequence[int], block: int = 1, chunk_size: int = 2 ** 20) -> Dict[str, np.ndarray]:
+        """Scan full TPC5 channels; times are relative to the trigger sample.
+
+        Args:
+            fileRef (h5py.File): Open TPC5 file
+            channels: 1-based TPC5 channel numbers; catalog channels index into this list
+            block: TPC5 block number
+            chunk_size: Samples read per chunk
+
+        Returns:
+            Trigger catalog, see scan
+        """
+        channels = list(channels)
+        n_samples = tpc5.getNSamples(fileRef, channels[0], block)
+        fs = tpc5.getSampleRate(fileRef, channels[0], block)
+        t0 = -tpc5.getTriggerSample(fileRef, channels[0], block) / fs
+
+        def read(start, stop):
+            return np.stack([tpc5.getVoltageSlice(fileRef, channel, start, stop, block) for channel in channels])
+
+        return self.scan(read, n_samples, chunk_size=chunk_size, fs=fs, t0=t0)
@@ -0,0 +1,173 @@
+"""Matched-filter template search for Labquake Explorer"""
+import numpy as np
+import scipy.fft
+from scipy import signal
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from labquake_explorer.utils import tpc5
+from labquake_explorer.data.event_processor import EventProcessor
+
+
+class TemplateMatcher:
+    """Finds waveforms that look like known events by normalized cross-correlation.
+
+    Each template is an (n_channels, m) window of an extracted event. The correlation
+    coefficient of every channel with the data is computed with FFTs, using sliding
+    sums for the local normalization, and averaged over channels. Long records are
+    processed in chunks that overlap by one template length, so memory is bounded by
+    the chunk size and the result does not depend on it. Templates of equal length
+    are correlated in one batched FFT call.
+    """
+
+    def __init__(self, threshold: float = 0.7, min_distance: Optional[int] = None,
+                 chunk_size: int = 2 ** 20, n_workers: int = 1):
+        self.threshold = threshold          # Smallest channel-averaged correlation coefficient kept
+        self.min_distance = min_distance    # Smallest distance between detections (samples); template length if None
+        self.chunk_size = chunk_size        # Correlation samples per chunk
+        self.n_workers = n_workers          # Threads used by the FFTs
+
+    @staticmethod
+    def correlate(data: np.ndarray, templates: np.ndarray) -> np.ndarray:
+        """Channel-averaged normalized cross-correlation for every template start position.
+
+        Args:
+            data: Record of shape (n_channels, n)
+            templates: Templates of shape (n_templates, n_channels, m), m <= n
+
+        Returns:
+            Correlation coefficients of shape (n_templates, n - m + 1)
+        """
+        data = np.atleast_2d(np.asarray(data, dtype=float))
+        data = data - data.mean(axis=-1, keepdims=True)  # keeps the sliding sums well conditioned
+        templates = np.asarray(templates, dtype=float)
+        if templates.ndim == 2:
+            templates = templates[np.newaxis]
+        m = templates.shape[-1]
+
+        templates = templates - templates.mean(axis=-1, keepdims=True)
+        template_norm = np.sqrt((templates ** 2).sum(axis=-1))
+        numerator = signal.fftconvolve(data[np.newaxis], templates[..., ::-1], mode='valid', axes=-1)
+
+        # Local energy of the data around its local mean, from sliding sums
+        c1 = np.concatenate([np.zeros((data.shape[0], 1)), np.cumsum(data, axis=-1)], axis=-1)
+        c2 = np.concatenate([np.zeros((data.shape[0], 1)), np.cumsum(data ** 2, axis=-1)], axis=-1)
+        s1 = c1[:, m:] - c1[:, :-m]
+        s2 = c2[:, m:] - c2[:, :-m]
+        data_norm = np.sqrt(np.maximum(s2 - s1 ** 2 / m, 0.0))
+
+        denominator = template_norm[..., np.newaxis] * data_norm[np.newaxis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cc = np.where(denominator > 1e-12 * denominator.max(initial=0.0), numerator / denominator, 0.0)
+        used = (template_norm > 0).sum(axis=-1)
+        return cc.sum(axis=1) / np.maximum(used, 1)[:, np.newaxis]
+
+    def scan(self, read: Callable[[int, int], np.ndarray], n_samples: int,
+             templates: Sequence[np.ndarray]) -> Dict[str, np.ndarray]:
+        """Search a whole record for every template.
+
+        Args:
+            read: read(start, stop) -> array of shape (n_channels, stop - start)
+            n_samples: Total number of samples in the record
+            templates: Templates, each of shape (n_channels, m)
+
+        Returns:
+            Detections ordered by position: 'start' sample of the matching window,
+            'template' index and correlation coefficient 'cc'
+        """
+        templates = [np.atleast_2d(np.asarray(template, dtype=float)) for template in templates]
+        groups: Dict[int, List[int]] = {}
+        for i, template in enumerate(templates):
+            groups.setdefault(template.shape[-1], []).append(i)
+        m_max = max(groups)
+
+        starts, template_ids, coefficients = [], [], []
+        with scipy.fft.set_workers(self.n_workers):
+            for start in range(0, max(n_samples - min(groups) + 1, 0), self.chunk_size):
+                stop = min(start + self.chunk_size + m_max - 1, n_samples)
+                chunk = np.asarray(read(start, stop), dtype=float)
+                for m, ids in groups.items():
+                    n_valid = min(self.chunk_size, chunk.shape[-1] - m + 1)
+                    if n_valid <= 0:
+                        continue
+                    cc = self.correlate(chunk[:, :n_valid + m - 1], np.stack([templates[i] for i in ids]))
+                    for i, row in zip(ids, cc):
+                        # Local maxima above threshold; chunk edges count as maxima
+                        peaks, _ = signal.find_peaks(np.concatenate([[-np.inf], row, [-np.inf]]), height=self.threshold)
+                        starts.append(start + peaks - 1)
+                        template_ids.append(np.full(len(peaks), i))
+                        coefficients.append(row[peaks - 1])
+
+        starts = np.concatenate(starts) if starts else np.array([], dtype=np.int64)
+        template_ids = np.concatenate(template_ids) if template_ids else np.array([], dtype=int)
+        coefficients = np.concatenate(coefficients) if coefficients else np.array([])
+        min_distance = m_max if self.min_distance is None else self.min_distance
+        keep = self.strongest(starts, coefficients, min_distance)
+        order = np.argsort(starts[keep], kind='stable')
+        return {
+            'start': starts[keep][order].astype(np.int64),
+            'template': template_ids[keep][order].astype(int),
+            'cc': coefficients[keep][order],
+        }
+
+    @staticmethod
+    def strongest(positions: np.ndarray, values: np.ndarray, min_distance: int) -> np.ndarray:
+        """Indices of the largest values such that no two kept positions are closer than min_distance."""
+        order = np.argsort(positions, kind='stable')
+        positions = positions[order]
+        kept = np.zeros(len(positions), dtype=bool)
+        for i in np.argsort(-values[order], kind='stable'):
+            lo, hi = np.searchsorted(positions, [positions[i] - min_distance + 1, positions[i] + min_distance])
+            if not kept[lo:hi].any():
+                kept[i] = True
+        return np.sort(order[kept])
+
+    def scan_tpc5(self, fileRef, channels: Sequence[int], templates: Sequence[np.ndarray],
+                  block: int = 1) -> Dict[str, np.ndarray]:
+        """Search full TPC5 channels; see scan. Adds 'time' of the window start relative to the trigger.
+
+        Args:
+            fileRef (h5py.File): Open TPC5 file
+            channels: 1-based TPC5 channel numbers, in the channel order of the templates
+            templates: Templates, each of shape (len(channels), m)
+            block: TPC5 block number
+        """
+        channels = list(channels)
+        n_samples = tpc5.getNSamples(fileRef, channels[0], block)
+        fs = tpc5.getSampleRate(fileRef, channels[0], block)
+
+        def read(start, stop):
+            return np.stack([tpc5.getVoltageSlice(fileRef, channel, start, stop, block) for channel in channels])
+
+        detections = self.scan(read, n_samples, templates)
+        detections['time'] = (detections['start'] - tpc5.getTriggerSample(fileRef, channels[0], block)) / fs
+        return detections
+
+    @staticmethod
+    def templates_from_events(events: List[Dict[str, Any]], event_numbers: Sequence[int], window: tuple,
+                              channels: Optional[Sequence[int]] = None) -> tuple:
+        """Cut templates from the full-rate strain of extracted events.
+
+        Args:
+            events: Events of a run, as extracted by EventProcessor
+            event_numbers: Events used as templates
+            window: (before, after) extent of the template relative to event_time (s)
+            channels: 0-based channels to include; the channels enabled in all template events if None
+
+        Returns:
+            tuple: (templates of shape (n_channels, m), sample offset of event_time
+                within each template)
+        """
+        if channels is None:
+            channels = EventProcessor.enabled_channels([events[k] for k in event_numbers])
+        templates, offsets = [], []
+        for k in event_numbers:
+            event = events[k]
+            original = event["strain"]["original"]
+            t = np.asarray(original["time"], dtype=float)
+            raw = np.asarray(original["raw"], dtype=float)[list(channels)]
+            start, center, stop = np.searchsorted(t, [event["event_time"] + window[0], event["event_time"],
+                                                      event["event_time"] + window[1]])
+            if stop - start < 2:
+                raise ValueError(f"Template window of event {k} is outside its strain record")
+            templates.append(raw[:, start:stop])
+            offsets.append(int(center - start))
+        return templates, offsets
@@ -0,0 +1,147 @@
+"""Implicit time axes of uniformly sampled series for Labquake Explorer"""
+import numbers
+import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
+from typing import Optional
+
+
+class UniformTimeAxis(NDArrayOperatorsMixin):
+    """The times t0 + i * dt for i in range(n), stored as these three numbers.
+
+    Behaves like a 1-D float64 array: integer indexing gives a time, slicing with a
+    positive step gives another UniformTimeAxis, and boolean or integer array indexing,
+    np.asarray, numpy functions and other ndarray attributes give plain arrays. Adding or
+    subtracting a scalar and multiplying by a positive scalar keep the axis implicit, so
+    e.g. time - event_time stays compact. searchsorted and index find samples in O(1).
+    """
+
+    hdf5_class = 'UniformTimeAxis'   # 'class' attribute of the HDF5 group of a saved axis
+    dtype = np.dtype(np.float64)
+    ndim = 1
+
+    def __init__(self, t0: float, dt: float, n: int):
+        if not dt > 0:
+            raise ValueError("The sampling interval dt must be positive")
+        if n < 0:
+            raise ValueError("The number of samples n must not be negative")
+        self.t0 = float(t0)
+        self.dt = float(dt)
+        self.n = int(n)
+
+    @classmethod
+    def from_array(cls, t, tolerance: float = 1e-6) -> Optional['UniformTimeAxis']:
+        """Axis equal to t within tolerance * dt at every sample, or None if t is not uniform"""
+        t = np.asarray(t, dtype=float)
+        if t.ndim != 1 or len(t) < 2 or not np.isfinite(t[[0, -1]]).all():
+            return None
+        dt = (t[-1] - t[0]) / (len(t) - 1)
+        if not dt > 0:
+            return None
+        axis = cls(t[0], dt, len(t))
+        if np.max(np.abs(t - axis.values())) > tolerance * dt:
+            return None
+        return axis
+
+    @property
+    def shape(self) -> tuple:
+        return (self.n,)
+
+    @property
+    def size(self) -> int:
+        return self.n
+
+    @property
+    def nbytes(self) -> int:
+        return 24
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __repr__(self) -> str:
+        return f"UniformTimeAxis(t0={self.t0!r}, dt={self.dt!r}, n={self.n})"
+
+    def values(self, dtype=None) -> np.ndarray:
+        """All times as an array"""
+        values = self.t0 + np.arange(self.n) * self.dt
+        return values if dtype is None else values.astype(dtype, copy=False)
+
+    def __array__(self, dtype=None, copy=None):
+        if copy is False:
+            raise ValueError("A UniformTimeAxis is always materialized into a new array")
+        return self.values(dtype)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple) and len(key) == 1:
+            key = key[0]
+        if isinstance(key, (numbers.Integral, np.integer)):
+            i = int(key) + self.n if key < 0 else int(key)
+            if not 0 <= i < self.n:
+                raise IndexError(f"index {key} is out of bounds for axis 0 with size {self.n}")
+            return self.t0 + i * self.dt
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.n)
+            if step > 0:
+                return UniformTimeAxis(self.t0 + start * self.dt, self.dt * step, len(range(start, stop, step)))
+        return self.t0 + np.arange(self.n)[key] * self.dt
+
+    def __iter__(self):
+        return iter(self.values())
+
+    def index(self, t):
+        """Index of the sample nearest to time(s) t"""
+        i = np.clip(np.rint((np.asarray(t, dtype=float) - self.t0) / self.dt), 0, max(self.n - 1, 0)).astype(np.int64)
+        return int(i) if i.ndim == 0 else i
+
+    def searchsorted(self, v, side: str = 'left', sorter=None):
+        """Like np.searchsorted on the materialized times, in O(1) per value"""
+        v = np.asarray(v, dtype=float)
+        x = (v - self.t0) / self.dt
+        if side == 'left':      # first i with t[i] >= v
+            i = np.ceil(x)
+            i = np.where((i > 0) & (self.t0 + (i - 1) * self.dt >= v), i - 1, i)
+            i = np.where((i < self.n) & (self.t0 + i * self.dt < v), i + 1, i)
+        elif side == 'right':   # first i with t[i] > v
+            i = np.floor(x) + 1
+            i = np.where((i > 0) & (self.t0 + (i - 1) * self.dt > v), i - 1, i)
+            i = np.where((i < self.n) & (self.t0 + i * self.dt <= v), i + 1, i)
+        else:
+            raise ValueError(f"side must be 'left' or 'right', not {side!r}")
+        i = np.clip(np.nan_to_num(i, nan=self.n), 0, self.n).astype(np.int64)
+        return int(i) if i.ndim == 0 else i
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method == '__call__' and not kwargs and len(inputs) == 2:
+            a, b = inputs
+            if a is self and np.ndim(b) == 0 and np.isreal(b):
+                if ufunc is np.add:
+                    return UniformTimeAxis(self.t0 + b, self.dt, self.n)
+                if ufunc is np.subtract:
+                    return UniformTimeAxis(self.t0 - b, self.dt, self.n)
+                if ufunc is np.multiply and b > 0:
+                    return UniformTimeAxis(self.t0 * b, self.dt * b, self.n)
+                if ufunc is np.true_divide and b > 0:
+                    return UniformTimeAxis(self.t0 / b, self.dt / b, self.n)
+            elif b is self and np.ndim(a) == 0 and np.isreal(a):
+                if ufunc is np.add:
+                    return UniformTimeAxis(a + self.t0, self.dt, self.n)
+                if ufunc is np.multiply and a > 0:
+                    return UniformTimeAxis(a * self.t0, a * self.dt, self.n)
+        inputs = tuple(x.values() if isinstance(x, UniformTimeAxis) else x for x in inputs)
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __getattr__(self, name):
+        # Other ndarray attributes (min, max, T, ...) act on the materialized times
+        if name.startswith('__') or name in ('t0', 'dt', 'n'):
+            raise AttributeError(name)
+        return getattr(self.values(), name)
+
+    def save_hdf5(self, group) -> None:
+        """Write to an empty h5py group as three attributes"""
+        group.attrs['class'] = self.hdf5_class
+        group.attrs['t0'] = self.t0
+        group.attrs['dt'] = self.dt
+        group.attrs['n'] = self.n
+
+    @classmethod
+    def load_hdf5(cls, group) -> 'UniformTimeAxis':
+        return cls(group.attrs['t0'], group.attrs['dt'], group.attrs['n'])
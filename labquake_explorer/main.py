@@ -1,9 +1,21 @@
 """Main entry point for Labquake Explorer application"""
+import argparse
 import sys
 import tkinter as tk
 from labquake_explorer.ui.labquake_explorer import LabquakeExplorer
+from labquake_explorer.utils.instrumentation import instrumentation
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Labquake Explorer")
+    parser.add_argument("--profile", nargs="?", const="profiles", default=None, metavar="DIR",
+                        help="write a cProfile and a tracemalloc snapshot of every loading, saving, "
+                             "extraction and redraw to DIR (default: ./profiles)")
+    return parser.parse_args(argv)
 
 def main():
+    args = parse_args()
+    if args.profile is not None:
+        instrumentation.enable_profiling(args.profile)
     try:
         root = tk.Tk()
         app = LabquakeExplorer(root)
@@ -1,5 +1,8 @@
 """Main UI class for Labquake Explorer"""
 import sys
+import queue
+import threading
+import time
 import tkinter as tk
 import numpy as np
 import os
@@ -7,12 +10,23 @@ from tkinter import ttk, filedialog, simpledialog, messagebox
 from pathlib import Path
 from typing import Optional, List, Dict, Any
 
-from labquake_explorer.data.data_manager import DataManager
+from labquake_explorer.data.data_manager import DataManager, LoadCancelled
+from labquake_explorer.data.event_processor import EventProcessor
+from labquake_explorer.data.event_detector import EventDetector
+from labquake_explorer.data.stream_detector import StreamingDetector
+from labquake_explorer.data.template_matcher import TemplateMatcher
+from labquake_explorer.data.event_analyzer import EventAnalyzer
+from labquake_explorer.data.event_similarity import EventSimilarity
+from labquake_explorer.data.raw_strain_array import RawStrainArray
+from labquake_explorer.data.uniform_time_axis import UniformTimeAxis
 from labquake_explorer.utils.config import LabquakeExplorerConfig
+from labquake_explorer.utils.job_runner import JobRunner
+from labquake_explorer.utils.instrumentation import instrumentation
 from labquake_explorer.ui.views import (
     SimplePlotView, PointsSelectorView, IndexPickerView,
     SlopeAnalyzerView, DynamicStrainArrivalPickerView, CZMFitterView,
-    EventAnalyzerView
+    EventAnalyzerView, EventStackView, ProgressView, JobStatusPanel,
+    PerformanceView
 )
 
 class LabquakeExplorer:
@@ -22,6 +36,7 @@ class LabquakeExplorer:
         self.root.title(self.config.WINDOW_TITLE)
         
         self.data_manager = DataManager()
+        self.job_runner = JobRunner()
         self.child_windows: List[tk.Toplevel] = []
         self.data_tree: Optional[ttk.Treeview] = None
         self.active_context_menu: Optional[tk.Menu] = None
@@ -30,6 +45,7 @@ class LabquakeExplorer:
         self.setup_window()
         self.create_widgets()
         self.setup_bindings()
+        self.poll_jobs()
 
         # debug
         # file_path = Path("/Users/hueyke/Library/CloudStorage/SynologyDrive-KeResearch-data/PSU/Gc-dataset/p5993ec.npz")
@@ -55,13 +71,50 @@ class LabquakeExplorer:
         self.root.focus_force()
 
     def create_widgets(self) -> None:
+        self.create_menubar()
         self.create_context_menus()
         self.create_buttons()
         self.init_data_tree()
+        self.job_panel = JobStatusPanel(self.root)
+        self.job_panel.grid(row=2, column=0, columnspan=4, padx=2, pady=2, sticky="ew")
+        self.job_panel.grid_remove()
+
+    def poll_jobs(self) -> None:
+        """Hand finished background jobs to their callbacks on the Tk thread and show job status"""
+        self.job_runner.dispatch()
+        now = time.monotonic()
+        recent = [job for job in self.job_runner.jobs if job.finished is None or now - job.finished < 10]
+        if recent:
+            self.job_panel.refresh(recent)
+            self.job_panel.grid()
+        else:
+            self.job_panel.grid_remove()
+        self.root.after(200, self.poll_jobs)
+
+    def create_menubar(self) -> None:
+        self.menubar = tk.Menu(self.root)
+        self.catalog_menu = tk.Menu(self.menubar, tearoff=0)
+        self.catalog_menu.add_command(label="Plot Stress Drop vs Rupture Speed",
+                                      command=lambda: self.plot_catalog('rupture_speed', 'stress_drop'))
+        self.catalog_menu.add_command(label="Plot Columns...", command=self.plot_catalog)
+        self.catalog_menu.add_command(label="Export Catalog...", command=self.export_catalog)
+        self.menubar.add_cascade(label="Catalog", menu=self.catalog_menu)
+        self.tools_menu = tk.Menu(self.menubar, tearoff=0)
+        self.tools_menu.add_command(label="Performance", command=self.show_performance)
+        self.menubar.add_cascade(label="Tools", menu=self.tools_menu)
+        self.root.config(menu=self.menubar)
 
     def create_context_menus(self) -> None:
         self.run_menu = tk.Menu(self.root, tearoff=0)
         self.run_menu.add_command(label="Pick Events", command=self.pick_events)
+        self.run_menu.add_command(label="Detect Events", command=self.detect_events)
+        self.run_menu.add_command(label="Scan Strain Triggers", command=self.scan_strain_triggers)
+        self.run_menu.add_command(label="Match Event Templates", command=self.match_event_templates)
+
+        self.events_menu = tk.Menu(self.root, tearoff=0)
+        self.events_menu.add_command(label="Analyze All Events", command=self.analyze_all_events)
+        self.events_menu.add_command(label="Stack Events", command=self.stack_events)
+        self.events_menu.add_command(label="Cluster Events", command=self.cluster_events)
 
         self.event_menu = tk.Menu(self.root, tearoff=0)
         self.event_menu.add_command(label="Analyze Event", command=self.analyze_event)
@@ -75,6 +128,10 @@ class LabquakeExplorer:
 
         self.event_indices_menu = tk.Menu(self.root, tearoff=0)
         self.event_indices_menu.add_command(label="Extract Events", command=self.extract_events)
+        self.event_indices_menu.add_command(label="Extract Events (Fixed Length)",
+                                            command=lambda: self.extract_events(fixed_length=True))
+        self.event_indices_menu.add_command(label="Extract Events (Raw Counts)",
+                                            command=lambda: self.extract_events(keep_counts=True))
 
         self.event_array_menu = tk.Menu(self.root, tearoff=0)
         self.event_array_menu.add_command(label="Pick Indices", command=self.pick_indices)
@@ -96,6 +153,8 @@ class LabquakeExplorer:
             btn.grid(row=1, column=col, padx=2, pady=2, sticky="w" if col < 2 else "e")
             if text == "Save As":
                 self.save_button = btn
+            elif text == "Load":
+                self.load_button = btn
 
     def init_data_tree(self) -> None:
         if self.data_tree:
@@ -119,13 +178,70 @@ class LabquakeExplorer:
         if not file_path:
             return
 
+        # Read on a worker thread; the Tk main loop polls for the result
+        path = Path(file_path)
+        cancel = threading.Event()
+        messages = queue.Queue()
+        last_report = [0.0]
+
+        def report(items, bytes_read, total_bytes):
+            now = time.monotonic()
+            if now - last_report[0] >= 0.1:
+                last_report[0] = now
+                messages.put(('progress', (items, bytes_read, total_bytes)))
+
+        def read():
+            try:
+                messages.put(('done', self.data_manager.read_file(path, report, cancel)))
+            except LoadCancelled:
+                messages.put(('cancelled', None))
+            except Exception as e:
+                messages.put(('error', e))
+
+        progress_view = ProgressView(self, f"Loading {path.name}", on_cancel=cancel.set)
+        self.set_window_icon(progress_view)
+        self.load_button.configure(state="disabled")
+        threading.Thread(target=read, daemon=True).start()
+        self.root.after(100, lambda: self.poll_load(path, messages, progress_view))
+
+    def poll_load(self, path: Path, messages: queue.Queue, progress_view: ProgressView) -> None:
+        """Show the progress of a background load and take over its result once done"""
+        result = None
+        progress = None
+        while result is None:
+            try:
+                kind, value = messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'progress':
+                progress = value
+            else:
+                result = (kind, value)
+        if progress is not None:
+            items, bytes_read, total_bytes = progress
+            fraction = bytes_read / total_bytes if total_bytes else None
+            progress_view.update_progress(
+                fraction, f"{bytes_read / 1e6:.1f} of {total_bytes / 1e6:.1f} MB, {items} items read")
+        if result is None:
+            self.root.after(100, lambda: self.poll_load(path, messages, progress_view))
+            return
+
+        progress_view.destroy()
+        self.load_button.configure(state="normal")
+        kind, value = result
+        if kind == 'cancelled':
+            print(f"Loading {path} cancelled.")
+            return
+        if kind == 'error':
+            messagebox.showerror("Error", f"Failed to load file: {value}")
+            return
+
         try:
-            path = Path(file_path)
-            self.data_manager.load_file(path)
+            self.data_manager.use_data(path, value)
             self.current_file_path = path
             self.save_button.configure(state="normal")
             self.refresh_tree()
-            print(f"File loaded: {file_path}")
+            print(f"File loaded: {path}")
 
             # Expand the runs node
             for item in self.data_tree.get_children(""):
@@ -152,13 +268,18 @@ class LabquakeExplorer:
         if not file_path:
             return
 
-        try:
-            self.data_manager.save_file(Path(file_path))
+        def saved(_):
             print(f"File saved: {file_path}")
             messagebox.showinfo("Success", "File saved successfully")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save file: {e}")
 
+        # Save a copy taken now, so edits made while the job runs cannot change the data being written
+        snapshot = self.data_manager.snapshot()
+        self.job_runner.submit(
+            f"Save {Path(file_path).name}", lambda job, path: self.data_manager.save_file(path, snapshot), Path(file_path),
+            on_done=saved, on_error=lambda e: messagebox.showerror("Error", f"Failed to save file: {e}")
+        )
+
+    @instrumentation.timed('refresh_tree')
     def refresh_tree(self) -> None:
         if not self.data_manager.data:
             return
@@ -217,6 +338,11 @@ class LabquakeExplorer:
             else:
                 shape_str = str(list(value.shape)).replace(" ", "")  # Remove spaces
                 return f"{key}: array{shape_str}"
+        elif isinstance(value, RawStrainArray):
+            shape_str = str(list(value.shape)).replace(" ", "")
+            return f"{key}: {value.counts.dtype}{shape_str}"
+        elif isinstance(value, UniformTimeAxis):
+            return f"{key}: uniform[{len(value)}]"
         elif isinstance(value, list):
             if len(value) == 1 and not key == 'events':
                 return f"{key}: {value[0]}"
@@ -239,16 +365,21 @@ class LabquakeExplorer:
         return os.path.join(*node, i), i
     
 
-    def pick_events(self) -> None:
-        path, item = self.get_full_path()
+    def pick_events(self, picked_idx: Optional[List[int]] = None, path: Optional[str] = None) -> None:
+        """Pick events on an array of a run; the selected one if path is None"""
+        if path is None:
+            path, item = self.get_full_path()
+        else:
+            item = path[path.rfind('/')+1:]
         y = self.data_manager.get_data(path)
         x = np.arange(len(y))
         save_path = path[:path.rfind('/')+1] + "event_indices"
-        parent_id = self.data_tree.parent(self.data_tree.selection()[0])
-        if self.has_child_named(parent_id, "event_indices"):
-            picked_idx = self.data_manager.get_data(self.get_full_path(parent_id)[0] + "/event_indices")
-        else:
-            picked_idx = []
+        if picked_idx is None:
+            parent_id = self.data_tree.parent(self.data_tree.selection()[0])
+            if self.has_child_named(parent_id, "event_indices"):
+                picked_idx = self.data_manager.get_data(self.get_full_path(parent_id)[0] + "/event_indices")
+            else:
+                picked_idx = []
         def save_and_refresh(data):
             self.data_manager.set_data(save_path, data, add_key=True)
             self.refresh_tree()
@@ -258,6 +389,173 @@ class LabquakeExplorer:
         self.set_window_icon(view)
         self.child_windows.append(view)
 
+    def detect_events(self) -> None:
+        """Detect stress drops in the selected run array and open them for review in the event picker"""
+        path, item = self.get_full_path()
+        y = np.asarray(self.data_manager.get_data(path), dtype=float)
+        run_data = self.data_manager.get_data(path[:path.rfind('/')])
+
+        min_drop = simpledialog.askfloat(
+            'Detect events',
+            f'Minimum stress drop ({item}):',
+            initialvalue=float(f"{10 * EventDetector.noise_level(y):.3g}")
+        )
+        if min_drop is None:
+            print('Event detection aborted.')
+            return
+        max_duration = simpledialog.askfloat(
+            'Detect events',
+            'Maximum drop duration (s), 0 for no limit:',
+            initialvalue=0.1, minvalue=0
+        )
+        if max_duration is None:
+            print('Event detection aborted.')
+            return
+
+        max_samples = None
+        if max_duration > 0:
+            if "time" in run_data and len(run_data["time"]) > 1:
+                dt = np.median(np.diff(run_data["time"]))
+                max_samples = max(1, int(round(max_duration / dt)))
+            else:
+                print("No time vector in run; drop duration not limited.")
+
+        detector = EventDetector(min_drop=min_drop, max_duration=max_samples)
+        picked_idx = [int(i) for i in detector.detect(y)]
+        print(f"Detected {len(picked_idx)} events in {path}.")
+        self.pick_events(picked_idx=picked_idx)
+
+    def scan_strain_triggers(self) -> None:
+        """Scan the full strain recording of the selected run with a streaming STA/LTA detector"""
+        path, _ = self.get_full_path()
+        run_path = path[:path.rfind('/')]
+        run_data = self.data_manager.get_data(run_path)
+        if 'strain' not in run_data or 'filename' not in run_data['strain']:
+            messagebox.showerror("Error", "This run has no strain recording.")
+            return
+
+        on = simpledialog.askfloat(
+            'Scan strain triggers',
+            'STA/LTA trigger threshold:',
+            initialvalue=4.0, minvalue=1.0
+        )
+        if on is None:
+            print('Trigger scan aborted.')
+            return
+
+        detector = StreamingDetector(on=on, off=min(1.5, on))
+
+        def save_triggers(catalog):
+            self.data_manager.set_data(f"{run_path}/strain/triggers", catalog, add_key=True)
+            self.refresh_tree()
+            print(f"Found {len(catalog['on'])} strain triggers in {run_path}.")
+
+        # The scan reads the whole recording, so it runs on a worker thread
+        self.job_runner.submit(
+            f"Scan strain triggers of {run_path}",
+            lambda job: self.data_manager.event_processor.scan_strain_triggers(run_data, detector),
+            on_done=save_triggers,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to scan strain triggers: {str(e)}")
+        )
+
+    def match_event_templates(self) -> None:
+        """Search the strain recording of the selected run for events resembling extracted ones"""
+        path, _ = self.get_full_path()
+        run_path = path[:path.rfind('/')]
+        run_data = self.data_manager.get_data(run_path)
+        events = run_data.get('events', [])
+        if not events or 'strain' not in run_data:
+            messagebox.showerror("Error", "Extract events with strain data from this run first.")
+            return
+
+        numbers = simpledialog.askstring(
+            'Match event templates',
+            f'Template events (comma separated, 0-{len(events) - 1}):',
+            initialvalue="0"
+        )
+        if numbers is None:
+            print('Template matching aborted.')
+            return
+        before = simpledialog.askfloat('Match event templates', 'Template start relative to event time (s):',
+                                       initialvalue=-0.0005)
+        after = simpledialog.askfloat('Match event templates', 'Template end relative to event time (s):',
+                                      initialvalue=0.002)
+        threshold = simpledialog.askfloat('Match event templates', 'Correlation threshold:',
+                                          initialvalue=0.7, minvalue=0.0, maxvalue=1.0)
+        if before is None or after is None or threshold is None:
+            print('Template matching aborted.')
+            return
+
+        try:
+            event_numbers = [int(n) for n in numbers.split(',') if n.strip()]
+            channels = EventProcessor.enabled_channels([events[k] for k in event_numbers])
+            templates, offsets = TemplateMatcher.templates_from_events(events, event_numbers, (before, after), channels)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to match templates: {str(e)}")
+            return
+
+        def pick_matches(detections):
+            picked_idx = sorted(set(int(i) for i in detections['event_index']))
+            print(f"Found {len(detections['start'])} template matches in {run_path}.")
+            self.pick_events(picked_idx=picked_idx, path=path)
+
+        # The search correlates the whole recording, so it runs on a worker thread
+        self.job_runner.submit(
+            f"Match event templates in {run_path}",
+            lambda job: self.data_manager.event_processor.match_strain_templates(
+                run_data, templates, offsets, TemplateMatcher(threshold=threshold), channels),
+            on_done=pick_matches,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to match templates: {str(e)}")
+        )
+
+    def plot_catalog(self, x: Optional[str] = None, y: Optional[str] = None) -> None:
+        """Scatter plot of two columns of the event catalog over all runs"""
+        if not self.data_manager.data:
+            messagebox.showerror("Error", "No data loaded.")
+            return
+        catalog = self.data_manager.catalog
+        if x is None or y is None:
+            columns = [c for c in catalog.frame.select_dtypes('number').columns if c not in catalog.key_columns]
+            columns_text = ", ".join(columns)
+            x = simpledialog.askstring('Plot event catalog', f'x column ({columns_text}):', initialvalue='rupture_speed')
+            y = simpledialog.askstring('Plot event catalog', f'y column ({columns_text}):', initialvalue='stress_drop')
+            if not x or not y:
+                return
+        try:
+            view = SimplePlotView(self)
+            view.title(f"Event catalog: {y} vs {x}")
+            catalog.plot(x.strip(), y.strip(), ax=view.ax)
+            view.canvas.draw()
+        except KeyError as e:
+            view.destroy()
+            messagebox.showerror("Error", f"Cannot plot catalog: {e}")
+            return
+        self.set_window_icon(view)
+        self.child_windows.append(view)
+
+    def export_catalog(self) -> None:
+        """Write the event catalog of all runs to CSV or Parquet"""
+        if not self.data_manager.data:
+            messagebox.showerror("Error", "No data loaded.")
+            return
+        initial_file = f"{self.current_file_path.stem}_events.csv" if self.current_file_path else "events.csv"
+        file_path = filedialog.asksaveasfilename(
+            title="Export event catalog",
+            initialfile=initial_file,
+            filetypes=(
+                ("CSV file", ".csv"),
+                ("Parquet file", ".parquet"),
+                ("All files", "*")
+            )
+        )
+        if not file_path:
+            return
+        try:
+            self.data_manager.catalog.export(Path(file_path))
+            print(f"Exported {len(self.data_manager.catalog)} events to {file_path}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export catalog: {e}")
+
     def min_max(self):
         path, item = self.get_full_path()
         y = self.data_manager.get_data(path)
@@ -319,6 +617,79 @@ class LabquakeExplorer:
         self.set_window_icon(view)
         self.child_windows.append(view)
 
+    def analyze_all_events(self):
+        """Automatically analyze stress drops of every event in the selected run"""
+        events_path, _ = self.get_full_path()
+        events = self.data_manager.get_data(events_path)
+        if any('event_analysis' in event for event in events):
+            ans = messagebox.askokcancel(
+                title="Confirmation",
+                message=f'This procedure will replace event_analysis of all events in "{events_path}".',
+                icon=messagebox.WARNING
+            )
+            if not ans:
+                return
+        results = EventAnalyzer().analyze_run(events)
+        self.data_manager.mark_changed(events_path)
+        self.refresh_tree()
+        print(f"Analyzed {sum(r is not None for r in results)} of {len(events)} events in {events_path}.")
+
+    def show_performance(self):
+        """Open the timing statistics of loading, saving, extraction, fits and redraws"""
+        view = PerformanceView(self)
+        self.set_window_icon(view)
+        self.child_windows.append(view)
+
+    def stack_events(self):
+        """Open the stacked strain waveforms of every event in the selected run"""
+        events_path, _ = self.get_full_path()
+        run_idx = int(events_path[events_path.find('runs/[') + 6:events_path.find(']')])
+        view = EventStackView(self, run_idx)
+        self.set_window_icon(view)
+        self.child_windows.append(view)
+
+    def cluster_events(self):
+        """Group the events of the selected run into families by strain waveform similarity"""
+        events_path, _ = self.get_full_path()
+        events = self.data_manager.get_data(events_path)
+        window = simpledialog.askstring(
+            'Cluster events',
+            'Compared window around the event time (ms before, ms after):',
+            initialvalue="0.2, 0.8"
+        )
+        if window is None:
+            print('Event clustering aborted.')
+            return
+        threshold = simpledialog.askfloat('Cluster events', 'Minimum similarity within a family:',
+                                          initialvalue=0.7, minvalue=-1.0, maxvalue=1.0)
+        if threshold is None:
+            print('Event clustering aborted.')
+            return
+
+        try:
+            before, after = (float(v) * 1e-3 for v in window.split(','))
+            result = EventSimilarity(threshold=threshold).cluster_run(events, window=(-before, after))
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to cluster events: {str(e)}")
+            return
+        self.data_manager.mark_changed(events_path)
+        self.refresh_tree()
+        sizes = np.bincount(result['family'])
+        print(f"Grouped {len(events)} events in {events_path} into {len(sizes)} families, "
+              f"largest {', '.join(str(n) for n in sizes[:5])}.")
+
+        # Similarity matrix in dendrogram order
+        order = result['order']
+        view = SimplePlotView(self)
+        view.title(f"Event similarity: {events_path}")
+        image = view.ax.imshow(result['cc'][np.ix_(order, order)], vmin=-1, vmax=1, cmap='RdBu_r', interpolation='nearest')
+        view.figure.colorbar(image, ax=view.ax, label='max normalized cross-correlation')
+        view.ax.set_xlabel('event (dendrogram order)')
+        view.ax.set_ylabel('event (dendrogram order)')
+        view.canvas.draw()
+        self.set_window_icon(view)
+        self.child_windows.append(view)
+
     def pick_indices(self):
         item = self.data_tree.selection()[0]
         view = IndexPickerView(self, item_y=self.get_full_path(item)[0])
@@ -344,7 +715,7 @@ class LabquakeExplorer:
         self.set_window_icon(view)
         self.child_windows.append(view)
 
-    def extract_events(self):
+    def extract_events(self, fixed_length: bool = False, keep_counts: bool = False):
         """Handle UI for event extraction and delegate to EventProcessor"""
         # Get selected item and paths
         item_id = self.data_tree.selection()[0]
@@ -374,26 +745,31 @@ class LabquakeExplorer:
             return
         print(f'Window set to (-{window}, {window})')
 
-        try:
-            # Get run data and indices
-            run_data = self.data_manager.get_data(parent_path)
-            event_indices = self.data_manager.get_data(event_indices_path)
+        # Get run data and indices
+        run_data = self.data_manager.get_data(parent_path)
+        event_indices = self.data_manager.get_data(event_indices_path)
 
-            # Extract events using EventProcessor
-            events = self.data_manager.event_processor.extract_events(
+        def extract(job):
+            return self.data_manager.event_processor.extract_events(
                 run_data,
                 event_indices,
-                window
+                window,
+                fixed_length=fixed_length,
+                keep_counts=keep_counts,
+                progress=lambda done, total: job.report(done / total, f"{done} of {total} events")
             )
 
+        def save_events(events):
             # Save results
             self.data_manager.set_data(events_path, events, add_key=True)
             self.refresh_tree()
+            messagebox.showinfo(title="Success", message="Events extracted.")
 
-            self.root.after(100, lambda: messagebox.showinfo(title="Success", message="Events extracted."))
-
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to extract events: {str(e)}")
+        # Extract events using EventProcessor on a worker thread
+        self.job_runner.submit(
+            f"Extract events of {parent_path}", extract, on_done=save_events,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to extract events: {str(e)}")
+        )
 
     def edit_string(self):
         """Edit a string value in the data structure"""
@@ -455,6 +831,8 @@ class LabquakeExplorer:
         if grandparent_name == "runs":
             if item_label[0] == "event_indices":
                 self.active_context_menu = self.event_indices_menu
+            elif item_label[0] == "events":
+                self.active_context_menu = self.events_menu
             elif len(item_label) > 1 and "array" in item_label[1]:
                 self.active_context_menu = self.run_menu
         elif grandparent_name == "events":
@@ -558,6 +936,8 @@ class LabquakeExplorer:
 
     def on_closing(self) -> None:
         try:
+            self.job_runner.shutdown()
+
             # First withdraw (hide) all windows
             for window in self.child_windows[:]:
                 if window.winfo_exists():
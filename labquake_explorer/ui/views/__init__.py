@@ -6,6 +6,10 @@ from labquake_explorer.ui.views.slope_analyzer_view import SlopeAnalyzerView
 from labquake_explorer.ui.views.dynamic_strain_arrival_picker_view import DynamicStrainArrivalPickerView
 from labquake_explorer.ui.views.czm_fitter_view import CZMFitterView
 from labquake_explorer.ui.views.event_analyzer_view import EventAnalyzerView
+from labquake_explorer.ui.views.event_stack_view import EventStackView
+from labquake_explorer.ui.views.progress_view import ProgressView
+from labquake_explorer.ui.views.job_status_panel import JobStatusPanel
+from labquake_explorer.ui.views.performance_view import PerformanceView
 from labquake_explorer.ui.views.misc import *
 
 __all__ = [
@@ -15,5 +19,9 @@ __all__ = [
     'SlopeAnalyzerView',
     'DynamicStrainArrivalPickerView',
     'CZMFitterView',
-    'EventAnalyzerView'
+    'EventAnalyzerView',
+    'EventStackView',
+    'ProgressView',
+    'JobStatusPanel',
+    'PerformanceView'
 ]
\ No newline at end of file
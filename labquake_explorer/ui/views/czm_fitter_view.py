@@ -3,14 +3,17 @@ from tkinter import ttk
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy import signal, optimize
-from matplotlib.widgets import Cursor
 from labquake_explorer.utils.cohesive_crack import CohesiveCrack
-from labquake_explorer.data.data_processor import DataProcessor
+from labquake_explorer.data.data_processor import DataProcessor, FilterPipeline
+from labquake_explorer.data.czm_fitter import CZMFitter
+from labquake_explorer.data.event_processor import EventProcessor
+from labquake_explorer.utils.instrumentation import instrumentation
 
 
 
 class CZMFitterView(tk.Toplevel):
+    default_eyy_channel = 14  # Normal strain gauge (0-based) of events without strain/eyy_channel
+
     def __init__(self, parent, run_idx, event_idx):
         self.parent = parent
         super().__init__(self.parent.root)
@@ -30,6 +33,8 @@ class CZMFitterView(tk.Toplevel):
         self.nu = 0.25     # Poisson's ratio
         self.C_s = 2760    # Shear wave speed (m/s)
         self.C_d = 4790    # Longitudinal wave speed (m/s)
+        self.fitter = CZMFitter(self.E, self.nu, self.C_s, self.C_d)
+        self.joint_fit_result = None
 
         # Create matplotlib figure
         self.create_matplotlib_figure()
@@ -66,6 +71,8 @@ class CZMFitterView(tk.Toplevel):
         self.init_event_combobox()
         self.event_combobox.bind("<<ComboboxSelected>>", self.on_event_changed)
         self.filter_spinbox.bind("<Return>", self.update_plot)
+        self.filter_kind_combobox.bind("<<ComboboxSelected>>", self.update_plot)
+        self.cutoff_entry.bind("<Return>", self.update_plot)
         
         # Initial plot
         self.update_plot()
@@ -89,11 +96,34 @@ class CZMFitterView(tk.Toplevel):
         )
         self.gauge_combobox.pack(side=tk.LEFT, padx=5)
         self.gauge_combobox.bind("<<ComboboxSelected>>", self.update_plot)
+
+        # Gauges used by the joint fit
+        self.joint_gauges_mb = tk.Menubutton(control_frame, text="Joint Gauges", relief="raised")
+        self.joint_gauges_mb.pack(side=tk.LEFT, padx=5)
+        self.joint_gauges_mb.menu = tk.Menu(self.joint_gauges_mb, tearoff=0)
+        self.joint_gauges_mb["menu"] = self.joint_gauges_mb.menu
+        self.joint_gauges_mb.items = []
         
         # Filter controls
         filter_frame = ttk.Frame(control_frame)
         filter_frame.pack(side=tk.LEFT, padx=10)
         
+        ttk.Label(filter_frame, text="Filter:").pack(side=tk.LEFT, padx=2)
+        self.filter_kind = tk.StringVar(value="savgol")
+        self.filter_kind_combobox = ttk.Combobox(
+            filter_frame,
+            textvariable=self.filter_kind,
+            values=FilterPipeline.kinds,
+            width=9,
+            state="readonly"
+        )
+        self.filter_kind_combobox.pack(side=tk.LEFT, padx=2)
+
+        ttk.Label(filter_frame, text="Cutoff (Hz):").pack(side=tk.LEFT, padx=2)
+        self.filter_cutoff = tk.StringVar(value="")
+        self.cutoff_entry = ttk.Entry(filter_frame, textvariable=self.filter_cutoff, width=12)
+        self.cutoff_entry.pack(side=tk.LEFT, padx=2)
+
         ttk.Label(filter_frame, text="Filter Window:").pack(side=tk.LEFT, padx=2)
         self.filter_window = tk.IntVar(value=51)
         self.filter_spinbox = ttk.Spinbox(
@@ -176,6 +206,20 @@ class CZMFitterView(tk.Toplevel):
             command=self.fit_parameters
         )
         fit_button.pack(side=tk.LEFT, padx=5)
+
+        # Add Joint Fit button and shared-Xc option
+        joint_fit_button = ttk.Button(
+            button_frame,
+            text="Joint Fit",
+            command=self.fit_joint_parameters
+        )
+        joint_fit_button.pack(side=tk.LEFT, padx=5)
+        self.joint_fit_Xc = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            button_frame,
+            text="Fit Xc",
+            variable=self.joint_fit_Xc
+        ).pack(side=tk.LEFT, padx=5)
         
         # Add Save button
         save_button = ttk.Button(
@@ -202,6 +246,8 @@ class CZMFitterView(tk.Toplevel):
         self.num_gauges = len(self.event["strain"]["original"]["raw"])
         gauge_options = [str(i) for i in range(self.num_gauges)]
         self.gauge_combobox.config(values=gauge_options)
+        self.init_joint_gauges_mb()
+        self.joint_fit_result = None
 
         # Update view limits and parameters if saved data exists
         if 'czm_parms' in self.event:
@@ -270,6 +316,16 @@ class CZMFitterView(tk.Toplevel):
             self.vlines.append(vline)
             self.vlines_twin.append(vline_twin)
 
+    def init_joint_gauges_mb(self):
+        """Populate the joint-fit gauge menu, defaulting to the event's fitting channels"""
+        fitting_channels = self.event["strain"].get("fitting_channels")
+        if fitting_channels is None or len(fitting_channels) != self.num_gauges:
+            fitting_channels = [i == self.strain_gauge.get() for i in range(self.num_gauges)]
+        self.joint_gauges_mb.menu.delete(0, "end")
+        self.joint_gauges_mb.items = [tk.IntVar(value=int(bool(fitting_channels[i]))) for i in range(self.num_gauges)]
+        for i in range(self.num_gauges):
+            self.joint_gauges_mb.menu.add_checkbutton(label="gauge %d" % i, variable=self.joint_gauges_mb.items[i])
+
     def init_event_combobox(self):
         n_events = len(self.data_manager.get_data(f"runs/[{self.run_idx}]/events"))
         options = [f"{i}" for i in range(n_events)]
@@ -288,6 +344,39 @@ class CZMFitterView(tk.Toplevel):
             self.filter_button.config(text="Filter Off", relief="raised")
         self.update_plot()
 
+    def get_filter_pipeline(self):
+        """Build the FilterPipeline selected in the filter controls"""
+        t = self.event["strain"]["original"]["time"]
+        cutoff = [float(v) for v in self.filter_cutoff.get().replace(',', ' ').split()]
+        return FilterPipeline.from_spec(
+            self.filter_kind.get(), fs=1 / (t[1] - t[0]),
+            window_length=self.filter_window.get(), cutoff=cutoff
+        )
+
+    def get_channels(self, channels):
+        """Raw voltage of the given channels, filtered through the shared cache if filtering is on"""
+        raw = self.event["strain"]["original"]["raw"]
+        if not self.filtering:
+            return np.asarray(raw[channels], dtype=float)
+        try:
+            pipeline = self.get_filter_pipeline()
+        except ValueError as e:
+            print(f"Filter not applied: {e}")
+            return np.asarray(raw[channels], dtype=float)
+        return self.data_manager.filter_cache.filtered(
+            self.data_manager.data_path, self.run_idx, self.event_idx, raw,
+            pipeline, channels
+        )
+
+    def get_eyy_channel(self):
+        """0-based channel of the normal strain gauge, or None if the event has no enabled one"""
+        strain = self.event["strain"]
+        channel = int(strain.get("eyy_channel", self.default_eyy_channel))
+        n_channels = len(strain["original"]["raw"])
+        if channel not in EventProcessor.enabled_channels([self.event], n_channels):
+            return None
+        return channel
+
     def save_parameters(self):
         """Save the current parameters to the event data."""
         if hasattr(self, 'vlines') and self.vlines is not None and len(self.vlines) >= 2:
@@ -311,6 +400,9 @@ class CZMFitterView(tk.Toplevel):
                 'x_lim_max': self.x_lim_max
             }
             
+            if self.joint_fit_result is not None:
+                params['joint'] = self.joint_fit_result
+
             # Update the event data
             self.event['czm_parms'] = params
             
@@ -319,6 +411,7 @@ class CZMFitterView(tk.Toplevel):
             self.parent.refresh_tree()
             print(f"Saved parameters for event {self.event_idx}: {params}")
 
+    @instrumentation.timed('redraw czm_fitter_view')
     def update_plot(self, event=None):
         # Store current line positions before clearing
         line_positions = []
@@ -342,8 +435,6 @@ class CZMFitterView(tk.Toplevel):
         # Get data
         t = self.event["strain"]["original"]["time"] - self.event["event_time"]
         gage_idx = self.strain_gauge.get()
-        exy = DataProcessor.voltage_to_strain(self.event["strain"]["original"]["raw"][gage_idx])
-        eyy = DataProcessor.voltage_to_strain(self.event["strain"]["original"]["raw"][14])
 
         # Apply filter if enabled
         if self.filtering:
@@ -351,14 +442,19 @@ class CZMFitterView(tk.Toplevel):
             if window_length % 2 == 0:
                 window_length += 1
                 self.filter_window.set(window_length)
-            exy = signal.savgol_filter(exy, window_length, 2)
-            eyy = signal.savgol_filter(eyy, window_length, 2)
+        # The measured Eyy is left out if the normal strain gauge is disabled (its row is NaN)
+        eyy_channel = self.get_eyy_channel()
+        channels = [gage_idx] if eyy_channel is None else [gage_idx, eyy_channel]
+        strains = DataProcessor.voltage_to_strain(self.get_channels(channels))
+        exy = strains[0]
 
         idx_zero_xy = np.argmin(np.abs(t - line_positions[2]))
         idx_zero_yy = np.argmin(np.abs(t - line_positions[0]))
         # Plot data
         self.axs[0].plot(t, exy - exy[idx_zero_xy], 'b-', label='Exy')
-        self.axs[1].plot(t, eyy - eyy[idx_zero_yy], 'r-', label='Eyy')
+        if eyy_channel is not None:
+            eyy = strains[1]
+            self.axs[1].plot(t, eyy - eyy[idx_zero_yy], 'r-', label='Eyy')
 
         # Add delta_sigma_xy to the Sxy axis
         rupture_speed = self.Cf.get()
@@ -470,61 +566,90 @@ class CZMFitterView(tk.Toplevel):
         # Get experimental data
         t = self.event["strain"]["original"]["time"] - self.event["event_time"]
         gage_idx = self.strain_gauge.get()
-        exy = DataProcessor.voltage_to_strain(self.event["strain"]["original"]["raw"][gage_idx])
-        
-        if self.filtering:
-            window_length = self.filter_window.get()
-            exy = signal.savgol_filter(exy, window_length, 2)
-        
-        # Get indices for fitting region
-        mask = (t >= t1) & (t <= t2)
-        t_fit = t[mask]
-        exy_fit = exy[mask]
-        
-        # Zero the data at the first point
-        idx_zero = np.argmin(np.abs(t_fit - t2))
-        exy_fit -= exy_fit[idx_zero]
-        
-        # Define objective function for optimization
-        def objective(params):
-            Gc, Xc = params
-            x = -t_fit * self.Cf.get()
-            x_zeroed = x + t1 * self.Cf.get()
-            
-            delta_sigma_xx, delta_sigma_xy, delta_sigma_yy = CohesiveCrack.delta_sigmas(
-                x_zeroed, self.y.get(), Xc, self.Cf.get(), 
-                self.C_s, self.C_d, self.nu, Gc, self.E
-            )
-            delta_e_xx, delta_e_xy, delta_e_yy = DataProcessor.stress_to_strain(
-                self.E, self.nu, delta_sigma_xx, delta_sigma_xy, delta_sigma_yy
-            )
-            delta_e_xy -= delta_e_xy[idx_zero]
-            
-            return np.sum(((exy_fit - delta_e_xy) * 1e9) ** 2)
-        
-        # Initial guess
-        initial_guess = [self.Gc.get(), self.Xc.get()]
-        
-        # Bounds for parameters (Gc > 0, Xc > 0)
-        bounds = ((1e-6, None), (1e-6, None))
-        
-        # Perform optimization
-        result = optimize.minimize(
-            objective, 
-            initial_guess,
-            bounds=bounds,
-            method='L-BFGS-B'
+        exy = DataProcessor.voltage_to_strain(self.get_channels([gage_idx])[0])
+
+        # Optimize in a worker process; the result is applied on the Tk thread
+        event_idx = self.event_idx
+
+        def apply(result):
+            if not self.winfo_exists() or self.event_idx != event_idx:
+                print(f"Fit of event {event_idx} finished after its view moved on: "
+                      f"Gc={result['Gc']:.2e}, Xc={result['Xc']:.2f}")
+                return
+            if result['success']:
+                # Update parameters with fitted values
+                self.Gc.set(result['Gc'])
+                self.Xc.set(result['Xc'])
+
+                self.update_plot()
+                print(f"Fitted parameters: Gc={result['Gc']:.2e}, Xc={result['Xc']:.2f}")
+            else:
+                print("Fitting failed:", result['message'])
+
+        self.parent.job_runner.submit(
+            f"CZM fit run {self.run_idx} event {event_idx}", self.fitter.fit_single,
+            t, exy, t1, t2, self.Cf.get(), self.y.get(), self.Gc.get(), self.Xc.get(),
+            use_process=True, on_done=apply, operation='fit_parameters',
+            on_error=lambda e: print(f"Fitting failed: {e}")
         )
-        
-        if result.success:
-            # Update parameters with fitted values
-            self.Gc.set(result.x[0])
-            self.Xc.set(result.x[1])
-            
+
+    def fit_joint_parameters(self):
+        """Fit a shared Gc (and optionally Xc) to all selected gauges at once."""
+        if len(self.vlines) < 3:
+            print("Need 3 vertical lines to define fitting region")
+            return
+        gauges = [i for i, item in enumerate(self.joint_gauges_mb.items) if item.get()]
+        if not gauges:
+            print("Select at least one gauge for the joint fit")
+            return
+
+        t0, t1, t2 = sorted([self.vlines[0].get_xdata()[0], self.vlines[1].get_xdata()[0], self.vlines[2].get_xdata()[0]])
+
+        # Get experimental data for all selected gauges at once
+        t = self.event["strain"]["original"]["time"] - self.event["event_time"]
+        exy = DataProcessor.voltage_to_strain(self.get_channels(gauges))
+
+        # The tip line marks the selected gauge; other gauges are shifted by their picked arrivals
+        offsets = CZMFitter.arrival_offsets(self.event, gauges, self.strain_gauge.get())
+        t_tips = t1 + offsets
+        ys = np.full(len(gauges), self.y.get())
+
+        fit_Xc = self.joint_fit_Xc.get()
+        event_idx = self.event_idx
+
+        def apply(result):
+            if not self.winfo_exists() or self.event_idx != event_idx:
+                print(f"Joint fit of event {event_idx} finished after its view moved on: "
+                      f"Gc={result['Gc']:.2e}, Xc={result['Xc']:.2f}")
+                return
+            self.apply_joint_fit(result, gauges, fit_Xc)
+
+        self.parent.job_runner.submit(
+            f"Joint CZM fit run {self.run_idx} event {event_idx}", self.fitter.fit_joint,
+            t, exy, t_tips, ys, (0, t2 - t1), self.Cf.get(), self.Gc.get(), self.Xc.get(),
+            fit_Xc=fit_Xc, use_process=True, on_done=apply, operation='fit_joint_parameters',
+            on_error=lambda e: print(f"Joint fitting failed: {e}")
+        )
+
+    def apply_joint_fit(self, result, gauges, fit_Xc):
+        """Show the result of a joint fit"""
+        if result['success']:
+            self.Gc.set(result['Gc'])
+            self.Xc.set(result['Xc'])
+            if self.strain_gauge.get() in gauges:
+                self.y.set(result['ys'][gauges.index(self.strain_gauge.get())])
+            self.joint_fit_result = {
+                'gauges': gauges,
+                't_tips': result['t_tips'],
+                'ys': result['ys'],
+                'fit_Xc': fit_Xc
+            }
             self.update_plot()
-            print(f"Fitted parameters: Gc={result.x[0]:.2e}, Xc={result.x[1]:.2f}")
+            print(f"Joint fit over gauges {gauges}: Gc={result['Gc']:.2e}, Xc={result['Xc']:.2f}")
+            for gauge, t_tip, y in zip(gauges, result['t_tips'], result['ys']):
+                print(f"  gauge {gauge}: t_tip={t_tip:.6e} s, y={y:.3e} m")
         else:
-            print("Fitting failed:", result.message)
+            print("Joint fitting failed:", result['message'])
 
 if __name__ == "__main__":
-    pass
\ No newline at end of file
+    pass
@@ -1,13 +1,15 @@
 import tkinter as tk
-from tkinter import ttk
+from tkinter import ttk, messagebox
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 import numpy as np
-import scipy
-from scipy import signal
-import warnings
+from labquake_explorer.data.data_processor import FilterPipeline
+from labquake_explorer.data.arrival_picker import ArrivalPicker
+from labquake_explorer.data.time_delay import TimeDelayEstimator
+from labquake_explorer.data.rupture_speed import RuptureSpeedEstimator
+from labquake_explorer.utils.instrumentation import instrumentation
 
 class DynamicStrainArrivalPickerView(tk.Toplevel):
     def __init__(self, parent, run_idx, event_idx):
@@ -40,8 +42,19 @@ class DynamicStrainArrivalPickerView(tk.Toplevel):
         self.cf_label = ttk.Label(self, text="Cf=0.00m/s")
         self.cf_label.grid(row=0, column=4, padx=5, pady=5, sticky="e")
         # [0, 5]
-        self.magic_button = tk.Button(self, text="Magic", command=self.magic)
-        self.magic_button.grid(row=0, column=5, padx=5, pady=5, sticky="e")
+        picking_frame = ttk.Frame(self)
+        picking_frame.grid(row=0, column=5, padx=5, pady=5, sticky="e")
+        self.pick_method_combobox = ttk.Combobox(picking_frame, values=ArrivalPicker.methods, width=10, state="readonly")
+        self.pick_method_combobox.current(0)
+        self.pick_method_combobox.pack(side=tk.LEFT, padx=2)
+        self.magic_button = tk.Button(picking_frame, text="Magic", command=self.magic)
+        self.magic_button.pack(side=tk.LEFT, padx=2)
+        self.pick_all_button = tk.Button(picking_frame, text="Pick All Events", command=self.pick_all_events)
+        self.pick_all_button.pack(side=tk.LEFT, padx=2)
+        self.xcorr_button = tk.Button(picking_frame, text="XCorr Speeds", command=self.xcorr_speeds)
+        self.xcorr_button.pack(side=tk.LEFT, padx=2)
+        self.robust_button = tk.Button(picking_frame, text="Robust Speeds", command=self.robust_speeds)
+        self.robust_button.pack(side=tk.LEFT, padx=2)
         # [0, 6]
         self.save_button = tk.Button(self, text="Save", command=self.save)
         self.save_button.grid(row=0, column=6, padx=5, pady=5, sticky="e")
@@ -63,10 +76,10 @@ class DynamicStrainArrivalPickerView(tk.Toplevel):
 
         # [3, 0]
         ttk.Label(self, text="Filter:", justify="left").grid(row=3, column=0, padx=5, pady=5, sticky="ew")
-        self.filter_combobox = ttk.Combobox(self, state="disabled")
+        self.filter_combobox = ttk.Combobox(self, state="readonly")
         # [3, 1]
         self.filter_combobox.grid(row=3, column=1, padx=5, pady=5, sticky="ew")
-        self.filter_combobox["values"] = ("scipy.savgol_filter")
+        self.filter_combobox["values"] = FilterPipeline.kinds
         self.filter_combobox.current(0)
         # [3, 2]
         ttk.Label(self, text="Window length", justify="right").grid(row=3, column=2, padx=5, pady=5, sticky="w")
@@ -77,6 +90,12 @@ class DynamicStrainArrivalPickerView(tk.Toplevel):
         # [3, 4]
         self.filter_toggle = tk.Button(self, text="Filter Off", relief="raised", command=self.toggle_filter)
         self.filter_toggle.grid(row=3, column=4, padx=5, pady=5, sticky="ew")
+        # [3, 5]
+        ttk.Label(self, text="Cutoff (Hz)", justify="right").grid(row=3, column=5, padx=5, pady=5, sticky="e")
+        # [3, 6]
+        self.filter_cutoff = tk.StringVar(value="")
+        self.filter_cutoff_entry = ttk.Entry(self, textvariable=self.filter_cutoff, width=12)
+        self.filter_cutoff_entry.grid(row=3, column=6, padx=5, pady=5, sticky="ew")
         
 
         # Data
@@ -86,12 +105,14 @@ class DynamicStrainArrivalPickerView(tk.Toplevel):
         self.enabled_channels = None
         self.fitting_channels = None
         self.picked_idx = None
+        self.sub_sample_picks = None
         self.fitting_markers = []
         self.not_fitting_markers = []
         self.offset = [0, 0]
         self.current_artist = None
         self.currently_dragging = False
         self.rupture_speed = None
+        self.rupture_speed_uncertainty = None
         self.fitted_line = None
         self.filtering = False
         self.xlim = None
@@ -108,7 +129,10 @@ class DynamicStrainArrivalPickerView(tk.Toplevel):
         self.fig.canvas.mpl_connect("scroll_event", self.on_resize)
         self.event_combobox.bind("<<ComboboxSelected>>", self.on_selected_event_changed)
         self.filter_window_length_box.bind("<ButtonRelease>", self.on_filter_window_length_box_changed)
+        self.filter_combobox.bind("<<ComboboxSelected>>", self.on_filter_window_length_box_changed)
+        self.filter_cutoff_entry.bind("<Return>", self.on_filter_window_length_box_changed)
 
+    @instrumentation.timed('redraw dynamic_strain_arrival_picker_view')
     def plot(self):
         exp_number = int(self.parent.data_manager.get_data("name")[1:5])
         # print(exp_number)
@@ -163,9 +187,14 @@ class DynamicStrainArrivalPickerView(tk.Toplevel):
         self.lines = [None for i in range(n_channels)]
 
         if self.filtering:
-            nf = int(self.filter_window_length.get())
-            for i in range(y.shape[0]):
-                y[i, :] = scipy.signal.savgol_filter(y[i, :], nf, 2)
+            try:
+                pipeline = self.get_filter_pipeline()
+                y = self.parent.data_manager.filter_cache.filtered(
+                    self.parent.data_manager.data_path, self.run_idx, self.event_idx,
+                    self.event["strain"]["original"]["raw"], pipeline
+                )
+            except ValueError as e:
+                print(f"Filter not applied: {e}")
         line_idx = 0
         ratios = np.ones(y.shape[0])
         for i in range(y.shape[0]):
@@ -199,6 +228,15 @@ class DynamicStrainArrivalPickerView(tk.Toplevel):
                 self.picked_idx = [middle_idx for i in range(n_channels)]
         self.draw_markers()
 
+    def get_filter_pipeline(self):
+        """Build the FilterPipeline selected in the filter controls"""
+        tt = self.event["strain"]["original"]["time"]
+        cutoff = [float(v) for v in self.filter_cutoff.get().replace(",", " ").split()]
+        return FilterPipeline.from_spec(self.filter_combobox.get(),
+                                        fs=1 / (tt[1] - tt[0]),
+                                        window_length=int(self.filter_window_length.get()),
+                                        cutoff=cutoff)
+
     def draw_markers(self):
         width, height = self.get_circle_dims()
         for marker in self.fitting_markers:
@@ -251,6 +289,8 @@ class DynamicStrainArrivalPickerView(tk.Toplevel):
                     idx = np.argmin(((x - cx) / xw) ** 2 + ((y - cy) / yw) ** 2)
                     self.current_artist.set_center((x[idx], y[idx]))
                     self.picked_idx[channel] = idx
+                    if self.sub_sample_picks is not None:
+                        self.sub_sample_picks[channel] = np.nan
                     self.update_fitted_line()
                 except:
                     pass
@@ -295,26 +335,37 @@ class DynamicStrainArrivalPickerView(tk.Toplevel):
             idx = int(self.fitting_markers[i].get_label())
             x[i] = self.fitting_markers[i].get_center()[0]
             y[i] = self.event["strain"]["locations"][idx]
-        a = np.polyfit(y, x, 1)
+        speeds, uncertainties, fit = RuptureSpeedEstimator().speeds(x[np.newaxis, :], y)
         if self.fitted_line:
             self.fitted_line[0].remove()
-        self.fitted_line = self.axs[4].plot(a[0] * y + a[1], y, "r--")
+            self.fitted_line = None
+        if np.isfinite(fit["slope"][0]):
+            self.fitted_line = self.axs[4].plot(fit["slope"][0] * y + fit["intercept"][0], y, "r--")
         self.canvas.draw()
-        warnings.filterwarnings("ignore", message="divide by zero encountered in double_scalars")
-        self.rupture_speed = -1e-3 / a[0]
-        warnings.filterwarnings("default", message="divide by zero encountered in double_scalars")
-        if np.abs(self.rupture_speed) < 1e4:
-            self.cf_label.configure(text=f"Cf = {self.rupture_speed:.2f} m/s")
-        else:
-            self.cf_label.configure(text=f"Cf = {self.rupture_speed:.2e} m/s")
+        self.rupture_speed = float(speeds[0])
+        self.rupture_speed_uncertainty = float(uncertainties[0])
+        self.cf_label.configure(text=self.format_speed(self.rupture_speed, self.rupture_speed_uncertainty))
         self.update()
+
+    @staticmethod
+    def format_speed(speed, uncertainty):
+        fmt = ".2f" if np.abs(speed) < 1e4 else ".2e"
+        if np.isfinite(uncertainty):
+            return f"Cf = {speed:{fmt}} \u00b1 {uncertainty:{fmt}} m/s"
+        return f"Cf = {speed:{fmt}} m/s"
     
     def save(self):
         self.event["strain"]["enabled_channels"] = self.enabled_channels
         self.event["strain"]["fitting_channels"] = self.fitting_channels
         self.event["rupture_speed"] = self.rupture_speed
+        self.event["rupture_speed_uncertainty"] = self.rupture_speed_uncertainty
         self.event["strain"]["original"]["picked_idx"] = self.picked_idx
-        self.event["strain"]["original"]["rupture_arrival_time"] = np.array([self.event["strain"]["original"]["time"][i] for i in self.picked_idx])
+        picks = np.asarray(self.picked_idx, dtype=float)
+        if self.sub_sample_picks is not None:
+            picks = np.where(np.isfinite(self.sub_sample_picks), self.sub_sample_picks, picks)
+        self.event["strain"]["original"]["rupture_arrival_time"] = ArrivalPicker.index_to_time(
+            self.event["strain"]["original"]["time"], picks)
+        self.parent.data_manager.mark_changed(f"runs/[{self.run_idx}]/events/[{self.event_idx}]")
         self.parent.refresh_tree()
         print(f"Saved runs[{self.run_idx}]/events[{self.event_idx}] to data.")
 
@@ -355,6 +406,7 @@ class DynamicStrainArrivalPickerView(tk.Toplevel):
             self.picked_idx = self.event["strain"]["original"]["picked_idx"]
         else:
             self.picked_idx = None
+        self.sub_sample_picks = None
         self.xlim = None
         self.fitting_markers = []
         self.not_fitting_markers = []
@@ -362,6 +414,7 @@ class DynamicStrainArrivalPickerView(tk.Toplevel):
         self.current_artist = None
         self.currently_dragging = False
         self.rupture_speed = None
+        self.rupture_speed_uncertainty = None
         self.fitted_line = None
         self.plot()
         self.init_enabled_channels_mb()
@@ -416,12 +469,87 @@ class DynamicStrainArrivalPickerView(tk.Toplevel):
         # self.event["strain"]["fitting_channels"] = [0,0, 0,0, 0,0, 0,0, 0,1, 0,1, 0,1, 0,1]
         # self.on_selected_event_changed()
 
-        for i in range(len(self.lines)):
-            if self.lines[i] is None:
-                continue
-            (x , y) = self.lines[i][0].get_data()
-            self.picked_idx[i] = np.argmin(y)
+        channels = [i for i in range(len(self.lines)) if self.lines[i] is not None]
+        if not channels:
+            return
+        # Plotted lines are flipped (negative scale), so 'peak' looks for their minimum
+        x = self.lines[channels[0]][0].get_xdata()
+        y = np.array([self.lines[i][0].get_ydata() for i in channels])
+        start, stop = np.searchsorted(x, self.axs[0].get_xlim())
+        picks = ArrivalPicker(self.pick_method_combobox.get(), polarity=-1).pick(y, start, stop)
+
+        self.sub_sample_picks = np.full(len(self.picked_idx), np.nan)
+        for i, pick in zip(channels, picks):
+            if np.isfinite(pick):
+                self.picked_idx[i] = int(round(pick))
+                self.sub_sample_picks[i] = pick
         self.draw_markers()
+        self.update_fitted_line()
+
+    def pick_all_events(self):
+        """Pick arrivals and rupture speeds of every event in the run"""
+        ans = messagebox.askokcancel(
+            title="Confirmation",
+            message=f"This will replace the picked arrivals of all events in run {self.run_idx}.",
+            icon=messagebox.WARNING,
+            parent=self
+        )
+        if not ans:
+            return
+        pipeline = None
+        if self.filtering:
+            try:
+                pipeline = self.get_filter_pipeline()
+            except ValueError as e:
+                print(f"Filter not applied: {e}")
+        events = self.parent.data_manager.get_data(f"runs/[{self.run_idx}]/events")
+        picker = ArrivalPicker(self.pick_method_combobox.get())
+        speeds = picker.pick_run(events, self.enabled_channels, self.fitting_channels,
+                                 self.event["strain"]["locations"], pipeline=pipeline,
+                                 search_window=self.axs[0].get_xlim())
+        print(f"Picked {len(events)} events in run {self.run_idx}, "
+              f"{np.isfinite(speeds).sum()} with rupture speeds.")
+        self.parent.data_manager.mark_changed(f"runs/[{self.run_idx}]/events")
+        self.on_selected_event_changed()
+        self.parent.refresh_tree()
+
+    def xcorr_speeds(self):
+        """Rupture speeds of every event in the run from cross-correlating neighboring fitting channels"""
+        channels = [i for i in range(len(self.fitting_channels)) if self.fitting_channels[i]]
+        if len(channels) < 2:
+            messagebox.showerror("Error", "Select at least two fitting channels.", parent=self)
+            return
+        pipeline = None
+        if self.filtering:
+            try:
+                pipeline = self.get_filter_pipeline()
+            except ValueError as e:
+                print(f"Filter not applied: {e}")
+        events = self.parent.data_manager.get_data(f"runs/[{self.run_idx}]/events")
+        try:
+            speeds = TimeDelayEstimator().estimate_run(events, channels, self.event["strain"]["locations"],
+                                                       search_window=self.axs[0].get_xlim(), pipeline=pipeline)
+        except ValueError as e:
+            messagebox.showerror("Error", f"Cross-correlation failed: {e}", parent=self)
+            return
+        print(f"Cross-correlated {len(events)} events in run {self.run_idx}: "
+              f"median rupture speed {np.nanmedian(speeds):.2f} m/s")
+        speed = self.event.get("rupture_speed")
+        if speed is not None:
+            self.cf_label.configure(text=f"Cf(xcorr) = {speed:.2f} m/s")
+        self.parent.data_manager.mark_changed(f"runs/[{self.run_idx}]/events")
+        self.parent.refresh_tree()
+
+    def robust_speeds(self):
+        """Refit rupture speeds of every event in the run from their saved arrival times"""
+        events = self.parent.data_manager.get_data(f"runs/[{self.run_idx}]/events")
+        speeds, uncertainties = RuptureSpeedEstimator().estimate_run(
+            events, self.fitting_channels, self.event["strain"]["locations"])
+        print(f"Refitted {np.isfinite(speeds).sum()} of {len(events)} events in run {self.run_idx}: "
+              f"median rupture speed {np.nanmedian(speeds):.2f} m/s")
+        self.cf_label.configure(text=self.format_speed(speeds[self.event_idx], uncertainties[self.event_idx]))
+        self.parent.data_manager.mark_changed(f"runs/[{self.run_idx}]/events")
+        self.parent.refresh_tree()
 
 if __name__ == "__main__":
     pass
@@ -5,8 +5,11 @@ import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 from matplotlib.figure import Figure
 import numpy as np
-from scipy import stats
 import os
+from labquake_explorer.utils.range_regression import RangeRegression
+from labquake_explorer.data.event_analyzer import EventAnalyzer
+from labquake_explorer.data.uniform_time_axis import UniformTimeAxis
+from labquake_explorer.utils.instrumentation import instrumentation
 
 
 class EventAnalyzerView(tk.Toplevel):
@@ -47,6 +50,12 @@ class EventAnalyzerView(tk.Toplevel):
         self.save_button = ttk.Button(event_selection_frame, text="Save Event", command=self.save_results, width=15)
         self.save_button.grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky="ew")
 
+        self.auto_button = ttk.Button(event_selection_frame, text="Auto Analyze", command=self.auto_analyze, width=15)
+        self.auto_button.grid(row=2, column=0, columnspan=2, padx=5, pady=5, sticky="ew")
+
+        self.analyze_all_button = ttk.Button(event_selection_frame, text="Analyze All", command=self.analyze_all, width=15)
+        self.analyze_all_button.grid(row=3, column=0, columnspan=2, padx=5, pady=5, sticky="ew")
+
         # Create data selection frame
         data_frame = ttk.LabelFrame(self, text="Data Fields")
         data_frame.grid(row=0, column=1, rowspan=2, columnspan=2, padx=5, pady=5, sticky="nsew")
@@ -98,6 +107,7 @@ class EventAnalyzerView(tk.Toplevel):
         # Initialize data attributes
         self.data_x = []
         self.data_y = []
+        self.regression = None
 
         # Initialize marker attributes
         self.markers = []
@@ -235,7 +245,7 @@ class EventAnalyzerView(tk.Toplevel):
             if isinstance(data, dict):
                 for key, value in data.items():
                     new_path = f"{path}/{key}" if path else key
-                    if isinstance(value, (list, np.ndarray)) and len(value) == time_length:
+                    if isinstance(value, (list, np.ndarray, UniformTimeAxis)) and len(value) == time_length:
                         matching_fields.append(new_path)
                     elif isinstance(value, dict):
                         matching_fields.extend(find_matching_arrays(value, new_path))
@@ -318,6 +328,7 @@ class EventAnalyzerView(tk.Toplevel):
         # Update the plot with points
         self.plot_picked_points()
     
+    @instrumentation.timed('redraw event_analyzer_view')
     def plot_data(self):
         """Plot the selected data"""
         if self.item_y is None:
@@ -344,6 +355,7 @@ class EventAnalyzerView(tk.Toplevel):
                 return
                 
             self.data_x = np.arange(len(self.data_y))  # Use indices as x-values
+            self.regression = RangeRegression(self.data_x, self.data_y)
             self.ax.plot(self.data_x, self.data_y, zorder=-100, linewidth=1.5)
             self.ax.set_ylabel(self.item_y)
             self.ax.set_xlabel("Index")
@@ -354,6 +366,7 @@ class EventAnalyzerView(tk.Toplevel):
             
             if self.data_x is None or self.data_y is None:
                 return
+            self.regression = RangeRegression(self.data_x, self.data_y)
                 
             self.ax.plot(self.data_x, self.data_y, zorder=-100, linewidth=1.5)
             self.ax.set_ylabel(self.item_y)
@@ -471,33 +484,15 @@ class EventAnalyzerView(tk.Toplevel):
 
     def update_analysis(self):
         """Update all calculated values using linear regression for slope calculations"""
-        if len(self.picked_idx) != 6:
+        if len(self.picked_idx) != 6 or self.regression is None:
             return
             
         try:
-            # Sort indices to ensure proper range selection
-            loading_idx_start = min(self.picked_idx[0], self.picked_idx[1])
-            loading_idx_end = max(self.picked_idx[0], self.picked_idx[1])
-            
-            rupture_idx_start = min(self.picked_idx[2], self.picked_idx[3])
-            rupture_idx_end = max(self.picked_idx[2], self.picked_idx[3])
-            
-            # Get data ranges for linear regression
-            loading_indices = range(loading_idx_start, loading_idx_end + 1)
-            rupture_indices = range(rupture_idx_start, rupture_idx_end + 1)
-            
-            # Extract x and y data for linear regression
-            x_loading = [self.data_x[i] for i in loading_indices]
-            y_loading = [self.data_y[i] for i in loading_indices]
-            
-            x_rupture = [self.data_x[i] for i in rupture_indices]
-            y_rupture = [self.data_y[i] for i in rupture_indices]
-            
-            # Perform linear regression for loading stiffness
-            slope_loading, intercept_loading, r_value_loading, p_value_loading, std_err_loading = stats.linregress(x_loading, y_loading)
-            
-            # Perform linear regression for unloading/rupture stiffness
-            slope_rupture, intercept_rupture, r_value_rupture, p_value_rupture, std_err_rupture = stats.linregress(x_rupture, y_rupture)
+            # Linear regression over the ranges between the marker pairs, from precomputed sums
+            slope_loading, intercept_loading, r_value_loading, std_err_loading = self.regression.fit(
+                self.picked_idx[0], self.picked_idx[1])
+            slope_rupture, intercept_rupture, r_value_rupture, std_err_rupture = self.regression.fit(
+                self.picked_idx[2], self.picked_idx[3])
             
             # Rupture start/end (points 4,5)
             x4, y4 = self.data_x[self.picked_idx[4]], self.data_y[self.picked_idx[4]]
@@ -516,6 +511,35 @@ class EventAnalyzerView(tk.Toplevel):
         except (IndexError, ZeroDivisionError) as e:
             print(f"Error calculating values: {e}")
     
+    def auto_analyze(self):
+        """Place the six points automatically for review"""
+        if len(self.data_y) == 0:
+            return
+        try:
+            self.picked_idx = EventAnalyzer().find_points(
+                self.data_x, self.data_y, EventAnalyzer.event_center(self.event, len(self.data_y)))
+        except ValueError as e:
+            messagebox.showerror("Error", f"Automatic analysis failed: {e}", parent=self)
+            return
+        self.plot_picked_points()
+
+    def analyze_all(self):
+        """Analyze every event of the run automatically, replacing saved analyses"""
+        events = self.data_manager.get_data(f"runs/[{self.run_idx}]/events")
+        if not messagebox.askokcancel("Confirmation",
+                                      f"This will replace event_analysis of all {len(events)} events in run {self.run_idx}.",
+                                      icon=messagebox.WARNING, parent=self):
+            return
+        results = EventAnalyzer().analyze_run(events, self.item_x, self.item_y)
+        print(f"Analyzed {sum(r is not None for r in results)} of {len(events)} events in run {self.run_idx}.")
+        self.data_manager.mark_changed(f"runs/[{self.run_idx}]/events")
+        saved_analysis = results[self.event_idx]
+        if saved_analysis is not None:
+            self.picked_idx = saved_analysis['loading_indices'] + saved_analysis['unloading_indices'] + [
+                saved_analysis['rupture_start_index'], saved_analysis['rupture_end_index']]
+            self.plot_picked_points()
+        self.parent.refresh_tree()
+
     def set_textbox(self, textbox, text):
         """Helper method to set text in a readonly textbox"""
         textbox.config(state="normal")
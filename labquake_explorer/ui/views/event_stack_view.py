@@ -0,0 +1,104 @@
+import tkinter as tk
+from tkinter import ttk, messagebox
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+import numpy as np
+from labquake_explorer.data.event_stacker import EventStacker
+from labquake_explorer.utils.instrumentation import instrumentation
+
+
+class EventStackView(tk.Toplevel):
+    """Stacked strain waveforms of all events of a run, with percentile envelopes"""
+
+    def __init__(self, parent, run_idx):
+        self.parent = parent
+        super().__init__(self.parent.root)
+        self.title(f"Stack Events: run {run_idx}")
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_columnconfigure(9, weight=1)
+
+        # [0, 0::]
+        ttk.Label(self, text="Align on:").grid(row=0, column=0, padx=5, pady=5, sticky="e")
+        self.alignment_combobox = ttk.Combobox(self, values=EventStacker.alignments, width=8, state="readonly")
+        self.alignment_combobox.current(0)
+        self.alignment_combobox.grid(row=0, column=1, padx=5, pady=5)
+        ttk.Label(self, text="Before (ms):").grid(row=0, column=2, padx=5, pady=5, sticky="e")
+        self.before = tk.StringVar(value="0.2")
+        ttk.Entry(self, textvariable=self.before, width=8).grid(row=0, column=3, padx=5, pady=5)
+        ttk.Label(self, text="After (ms):").grid(row=0, column=4, padx=5, pady=5, sticky="e")
+        self.after_ms = tk.StringVar(value="0.8")
+        ttk.Entry(self, textvariable=self.after_ms, width=8).grid(row=0, column=5, padx=5, pady=5)
+        ttk.Label(self, text="Center:").grid(row=0, column=6, padx=5, pady=5, sticky="e")
+        self.center_combobox = ttk.Combobox(self, values=("mean", "median"), width=8, state="readonly")
+        self.center_combobox.current(0)
+        self.center_combobox.grid(row=0, column=7, padx=5, pady=5)
+        self.normalize = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self, text="Normalize", variable=self.normalize).grid(row=0, column=8, padx=5, pady=5)
+        self.info_label = ttk.Label(self, text="")
+        self.info_label.grid(row=0, column=9, padx=5, pady=5, sticky="e")
+        self.stack_button = tk.Button(self, text="Stack", command=self.update_stack)
+        self.stack_button.grid(row=0, column=10, padx=5, pady=5, sticky="e")
+
+        # [1, 0::]
+        self.figure = Figure(figsize=(7, 7), dpi=100, constrained_layout=True)
+        self.ax = self.figure.add_subplot(111)
+        self.canvas = FigureCanvasTkAgg(self.figure, master=self)
+        self.canvas.get_tk_widget().grid(row=1, column=0, columnspan=11, padx=5, pady=5, sticky="nsew")
+
+        # [2, 0::]
+        toolbar_frame = ttk.Frame(self)
+        toolbar_frame.grid(row=2, column=0, columnspan=11, padx=0, pady=0, sticky="ew")
+        toolbar = NavigationToolbar2Tk(self.canvas, toolbar_frame)
+        toolbar.update()
+
+        # Data
+        self.run_idx = run_idx
+        self.events = self.parent.data_manager.get_data(f"runs/[{run_idx}]/events")
+        self.stacker = None
+        self.result = None
+
+        self.alignment_combobox.bind("<<ComboboxSelected>>", lambda event: self.update_stack())
+        self.center_combobox.bind("<<ComboboxSelected>>", lambda event: self.plot())
+        self.update_stack()
+
+    def update_stack(self):
+        try:
+            window = (-float(self.before.get()) * 1e-3, float(self.after_ms.get()) * 1e-3)
+        except ValueError:
+            messagebox.showerror("Error", "Window bounds must be numbers.", parent=self)
+            return
+        self.stacker = EventStacker(window=window, alignment=self.alignment_combobox.get(),
+                                    normalize=self.normalize.get())
+        try:
+            self.result = self.stacker.stack_events(self.events)
+        except (KeyError, ValueError) as e:
+            messagebox.showerror("Error", f"Failed to stack events: {e}", parent=self)
+            return
+        n_used = int(np.any(np.isfinite(self.result['windows']), axis=(1, 2)).sum())
+        self.info_label.configure(text=f"{n_used} of {len(self.events)} events")
+        self.plot()
+
+    @instrumentation.timed('redraw event_stack_view')
+    def plot(self):
+        if self.result is None:
+            return
+        center = self.result[self.center_combobox.get()]
+        low, high = self.result['low'], self.result['high']
+        t = self.result['time'] * 1e3
+        with np.errstate(invalid='ignore'):
+            scale = np.nanmax(np.abs(np.stack([low, high]))) if np.isfinite(low).any() else 1.0
+        spacing = scale if scale > 0 else 1.0
+
+        self.ax.clear()
+        for i in range(len(center)):
+            offset = i * spacing
+            self.ax.fill_between(t, low[i] + offset, high[i] + offset, color=f"C{i % 10}", alpha=0.25, linewidth=0)
+            self.ax.plot(t, center[i] + offset, color=f"C{i % 10}", linewidth=1)
+        self.ax.axvline(0, color="k", linestyle="--", linewidth=0.8)
+        self.ax.set_yticks(np.arange(len(center)) * spacing)
+        self.ax.set_yticklabels([str(j) for j in self.result['channels']])
+        self.ax.set_ylabel("channel")
+        self.ax.set_xlabel(f"time - {self.alignment_combobox.get()} time (ms)")
+        percentiles = self.stacker.percentiles
+        self.ax.set_title(f"{self.center_combobox.get()} with {percentiles[0]:g}-{percentiles[1]:g}% envelope")
+        self.canvas.draw()
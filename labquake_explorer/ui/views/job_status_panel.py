@@ -0,0 +1,52 @@
+import tkinter as tk
+from tkinter import ttk
+from typing import List
+from labquake_explorer.utils.job_runner import Job
+
+
+class JobStatusPanel(ttk.Frame):
+    """List of background jobs with their progress, and a button to cancel the selected one"""
+
+    def __init__(self, master, height: int = 4):
+        super().__init__(master)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.job_tree = ttk.Treeview(self, columns=("status", "progress", "time"), height=height)
+        self.job_tree.heading("#0", text="Job", anchor="w")
+        self.job_tree.heading("status", text="Status", anchor="w")
+        self.job_tree.heading("progress", text="Progress", anchor="w")
+        self.job_tree.heading("time", text="Time", anchor="e")
+        self.job_tree.column("#0", width=140, stretch=True)
+        self.job_tree.column("status", width=70, stretch=False)
+        self.job_tree.column("progress", width=110, stretch=False)
+        self.job_tree.column("time", width=50, stretch=False, anchor="e")
+        self.job_tree.grid(row=0, column=0, sticky="nsew")
+
+        self.cancel_button = tk.Button(self, text="Cancel Job", command=self.cancel_selected)
+        self.cancel_button.grid(row=1, column=0, padx=2, pady=2, sticky="e")
+        self.jobs = {}
+
+    def refresh(self, jobs: List[Job]) -> None:
+        """Show the current state of jobs; items of jobs no longer listed are removed"""
+        current = {str(job.id): job for job in jobs}
+        for iid in self.job_tree.get_children(""):
+            if iid not in current:
+                self.job_tree.delete(iid)
+        for iid, job in current.items():
+            if job.fraction is not None:
+                progress = f"{100 * job.fraction:.0f}%"
+                progress = f"{progress} {job.message}" if job.message else progress
+            else:
+                progress = job.message
+            values = (job.status, progress, f"{job.elapsed:.1f}s")
+            if self.job_tree.exists(iid):
+                self.job_tree.item(iid, values=values)
+            else:
+                self.job_tree.insert("", 0, iid=iid, text=job.name, values=values)
+        self.jobs = current
+
+    def cancel_selected(self) -> None:
+        for iid in self.job_tree.selection():
+            job = self.jobs.get(iid)
+            if job is not None:
+                job.cancel()
@@ -0,0 +1,99 @@
+import tkinter as tk
+from tkinter import ttk
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import numpy as np
+from labquake_explorer.utils.instrumentation import instrumentation
+
+
+class PerformanceView(tk.Toplevel):
+    """Timing statistics of the instrumented operations, and the duration histogram of one"""
+
+    columns = ("count", "mean", "median", "p95", "max", "total", "bytes")
+
+    def __init__(self, parent):
+        self.parent = parent
+        super().__init__(self.parent.root)
+        self.title("Performance")
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_rowconfigure(2, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        # [0, 0::]
+        button_frame = ttk.Frame(self)
+        button_frame.grid(row=0, column=0, padx=5, pady=5, sticky="ew")
+        tk.Button(button_frame, text="Refresh", command=self.refresh).pack(side="left", padx=2)
+        tk.Button(button_frame, text="Reset", command=self.reset).pack(side="left", padx=2)
+        self.auto_refresh = tk.BooleanVar(value=True)
+        ttk.Checkbutton(button_frame, text="Auto refresh", variable=self.auto_refresh).pack(side="left", padx=8)
+        profile_dir = instrumentation.profile_dir
+        ttk.Label(button_frame, text=f"Profiles: {profile_dir}" if profile_dir else "Profiling off").pack(side="right")
+
+        # [1, 0]
+        self.tree = ttk.Treeview(self, columns=self.columns, height=8)
+        self.tree.heading("#0", text="Operation", anchor="w")
+        self.tree.column("#0", width=260, stretch=True)
+        for column in self.columns:
+            self.tree.heading(column, text=column if column in ("count", "bytes") else f"{column} (ms)", anchor="e")
+            self.tree.column(column, width=80, stretch=False, anchor="e")
+        self.tree.grid(row=1, column=0, padx=5, pady=5, sticky="nsew")
+        self.tree.bind("<<TreeviewSelect>>", lambda event: self.plot_histogram())
+
+        # [2, 0]
+        self.figure = Figure(figsize=(6, 3), dpi=100, constrained_layout=True)
+        self.ax = self.figure.add_subplot(111)
+        self.canvas = FigureCanvasTkAgg(self.figure, master=self)
+        self.canvas.get_tk_widget().grid(row=2, column=0, padx=5, pady=5, sticky="nsew")
+
+        self.refresh()
+        self.poll()
+
+    @staticmethod
+    def format_bytes(n_bytes: int) -> str:
+        for unit in ("B", "kB", "MB", "GB"):
+            if abs(n_bytes) < 1024 or unit == "GB":
+                return f"{n_bytes:.0f} {unit}" if unit == "B" else f"{n_bytes:.1f} {unit}"
+            n_bytes /= 1024
+
+    def refresh(self):
+        summary = instrumentation.summary()
+        for iid in self.tree.get_children(""):
+            if iid not in summary:
+                self.tree.delete(iid)
+        for name, stats in summary.items():
+            values = [str(stats['count'])]
+            values += ["" if np.isnan(stats[key]) else f"{1e3 * stats[key]:.1f}"
+                       for key in ("mean", "median", "p95", "max")]
+            values += [f"{1e3 * stats['total']:.0f}", self.format_bytes(stats['bytes']) if stats['bytes'] else ""]
+            if self.tree.exists(name):
+                self.tree.item(name, values=values)
+            else:
+                self.tree.insert("", "end", iid=name, text=name, values=values)
+        self.plot_histogram()
+
+    def plot_histogram(self):
+        selection = self.tree.selection()
+        self.ax.clear()
+        if selection:
+            name = selection[0]
+            counts, edges = instrumentation.histogram(name)
+            if len(counts):
+                self.ax.stairs(counts, edges * 1e3, fill=True)
+                self.ax.set_xscale("log")
+            self.ax.set_title(name)
+            self.ax.set_xlabel("duration (ms)")
+            self.ax.set_ylabel("runs")
+        else:
+            self.ax.set_title("Select an operation")
+        self.canvas.draw_idle()
+
+    def reset(self):
+        instrumentation.reset()
+        self.refresh()
+
+    def poll(self):
+        if not self.winfo_exists():
+            return
+        if self.auto_refresh.get():
+            self.refresh()
+        self.after(1000, self.poll)
@@ -0,0 +1,41 @@
+import tkinter as tk
+from tkinter import ttk
+from typing import Callable, Optional
+
+
+class ProgressView(tk.Toplevel):
+    """Small window with a progress bar, a status line and a Cancel button"""
+
+    def __init__(self, parent, title: str, on_cancel: Optional[Callable[[], None]] = None):
+        self.parent = parent
+        super().__init__(self.parent.root)
+        self.title(title)
+        self.resizable(False, False)
+        self.transient(self.parent.root)
+        self.on_cancel = on_cancel
+
+        self.label = ttk.Label(self, text="Starting...", width=50)
+        self.label.grid(row=0, column=0, columnspan=2, padx=10, pady=(10, 5), sticky="w")
+        self.progressbar = ttk.Progressbar(self, orient="horizontal", length=320, mode="determinate", maximum=1.0)
+        self.progressbar.grid(row=1, column=0, padx=10, pady=5, sticky="ew")
+        self.cancel_button = tk.Button(self, text="Cancel", command=self.cancel)
+        self.cancel_button.grid(row=1, column=1, padx=10, pady=5)
+        self.protocol("WM_DELETE_WINDOW", self.cancel)
+
+    def update_progress(self, fraction: Optional[float], text: str) -> None:
+        """Show progress; an unknown fraction (None) animates the bar instead"""
+        if fraction is None:
+            if str(self.progressbar["mode"]) != "indeterminate":
+                self.progressbar.configure(mode="indeterminate")
+                self.progressbar.start(50)
+        else:
+            if str(self.progressbar["mode"]) != "determinate":
+                self.progressbar.stop()
+                self.progressbar.configure(mode="determinate")
+            self.progressbar["value"] = min(max(fraction, 0.0), 1.0)
+        self.label.configure(text=text)
+
+    def cancel(self) -> None:
+        self.cancel_button.configure(state="disabled", text="Cancelling")
+        if self.on_cancel:
+            self.on_cancel()
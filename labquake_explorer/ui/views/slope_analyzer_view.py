@@ -8,6 +8,7 @@ import numpy as np
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 from typing import Optional
 import os
+from labquake_explorer.utils.range_regression import RangeRegression
 
 
 class SlopeAnalyzerView(tk.Toplevel):
@@ -36,6 +37,7 @@ class SlopeAnalyzerView(tk.Toplevel):
         tk.Label(self, text="X Data").grid(row=0, column=1, padx=5, pady=0)
         tk.Label(self, text="Y Data").grid(row=0, column=2, padx=5, pady=0)
         tk.Label(self, text="Slope").grid(row=0, column=4, padx=5, pady=0)
+        tk.Label(self, text="Method").grid(row=0, column=5, padx=5, pady=0)
 
         # Row 1
         self.data_x_combo = ttk.Combobox(self, state="readonly")
@@ -44,18 +46,21 @@ class SlopeAnalyzerView(tk.Toplevel):
         self.data_y_combo.grid(row=1, column=2, padx=5, pady=0)
         self.slope_textbox = tk.Entry(self, state="readonly")
         self.slope_textbox.grid(row=1, column=4, padx=5, pady=0)
+        self.method_combo = ttk.Combobox(self, values=["Two-point", "Least squares"], state="readonly", width=12)
+        self.method_combo.current(0)
+        self.method_combo.grid(row=1, column=5, padx=5, pady=0)
 
         # Row 2 - Matplotlib Figure and Tkinter Canvas
         self.figure = Figure()
         self.ax = self.ax = self.figure.add_subplot(111)
         self.canvas = FigureCanvasTkAgg(self.figure, master=self)
         self.canvas_widget = self.canvas.get_tk_widget()
-        self.canvas_widget.grid(row=2, column=1, columnspan=4, padx=5, pady=5, sticky="nsew")
+        self.canvas_widget.grid(row=2, column=1, columnspan=5, padx=5, pady=5, sticky="nsew")
 
         
         # Row 3 - Navigation toolbar for zooming and panning
         toolbar_frame = ttk.Frame(self)
-        toolbar_frame.grid(row=3, column=1, columnspan=4, padx=0, pady=0, sticky="ew")
+        toolbar_frame.grid(row=3, column=1, columnspan=5, padx=0, pady=0, sticky="ew")
         toolbar = NavigationToolbar2Tk(self.canvas, toolbar_frame)
         toolbar.update()
 
@@ -66,6 +71,7 @@ class SlopeAnalyzerView(tk.Toplevel):
         self.data_y = []
         self.markers = []
         self.slope_line = None
+        self.regression = None
         self.offset = [0, 0]
         self.mouse_button_pressed = None
         self.current_artist = None
@@ -86,6 +92,7 @@ class SlopeAnalyzerView(tk.Toplevel):
         self.figure.canvas.mpl_connect('scroll_event', self.on_resize)
         self.data_y_combo.bind("<<ComboboxSelected>>", self.data_y_selected)
         self.data_x_combo.bind("<<ComboboxSelected>>", self.data_x_selected)
+        self.method_combo.bind("<<ComboboxSelected>>", self.method_selected)
 
     def data_y_selected(self, event):
         self.item_y = self.data_y_combo.get()
@@ -97,6 +104,11 @@ class SlopeAnalyzerView(tk.Toplevel):
         self.plot_data()
         self.plot_picked_points()
 
+    def method_selected(self, event):
+        self.update_slope_line()
+        self.canvas.draw()
+        self.update_slope()
+
     def plot_data(self):
         if self.item_y is None:
             return
@@ -118,6 +130,7 @@ class SlopeAnalyzerView(tk.Toplevel):
             self.ax.plot(self.data_x, self.data_y, zorder=-100)
             self.ax.set_ylabel(self.item_y)
             self.ax.set_xlabel(self.item_x)
+        self.regression = RangeRegression(self.data_x, self.data_y)
         self.canvas.draw()
 
     def plot_picked_points(self):
@@ -144,12 +157,24 @@ class SlopeAnalyzerView(tk.Toplevel):
             self.markers.append(marker)
 
 
-        x = self.data_x[self.picked_idx] if len(self.data_x) >= np.max(self.picked_idx) else self.picked_idx
-        self.slope_line, = self.ax.plot(x, self.data_y[self.picked_idx], '--', color='gray', zorder=-50)
+        self.slope_line, = self.ax.plot([], [], '--', color='gray', zorder=-50)
+        self.update_slope_line()
 
         self.canvas.draw()
         self.update_slope()
 
+    def least_squares(self) -> bool:
+        return self.method_combo.get() == "Least squares"
+
+    def update_slope_line(self):
+        """Line through the two markers, or the least-squares line over the range between them"""
+        x = self.data_x[self.picked_idx] if len(self.data_x) >= np.max(self.picked_idx) else self.picked_idx
+        if self.least_squares():
+            slope, intercept, _, _ = self.regression.fit(self.picked_idx[0], self.picked_idx[1])
+            self.slope_line.set_data(x, slope * np.asarray(x, dtype=float) + intercept)
+        else:
+            self.slope_line.set_data(x, self.data_y[self.picked_idx])
+
     def on_pick(self, event):
         if self.current_artist is None:
             self.current_artist = event.artist
@@ -191,11 +216,10 @@ class SlopeAnalyzerView(tk.Toplevel):
 
                 self.current_artist.set_center((x_coord, self.data_y[idx]))
 
-                x = self.data_x[self.picked_idx] if len(self.data_x) >= np.max(self.picked_idx) else self.picked_idx
-                self.slope_line.set_data(x, self.data_y[self.picked_idx])
+                self.picked_idx[int(self.current_artist.get_label())] = idx
+                self.update_slope_line()
 
                 self.canvas.draw()
-                self.picked_idx[int(self.current_artist.get_label())] = idx
                 self.update_slope()
             except Exception as e:
                 print(f"Error in on_motion: {e}")  # Optional debugging
@@ -300,6 +324,10 @@ class SlopeAnalyzerView(tk.Toplevel):
 
     
     def update_slope(self):
+        if self.least_squares():
+            slope = self.regression.fit(self.picked_idx[0], self.picked_idx[1])[0]
+            self.set_slope_textbox(str(slope))
+            return
         x0 = self.data_x[self.picked_idx[0]] if len(self.data_x) >= self.picked_idx[0] else self.picked_idx[0]
         y0 = self.data_y[self.picked_idx[0]]
         x1 = self.data_x[self.picked_idx[1]] if len(self.data_x) >= self.picked_idx[1] else self.picked_idx[1]
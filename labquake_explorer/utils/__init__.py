@@ -1,8 +1,17 @@
 """Utilities package for Labquake Explorer"""
 from labquake_explorer.utils.config import LabquakeExplorerConfig
 from labquake_explorer.utils.cohesive_crack import CohesiveCrack
+from labquake_explorer.utils.range_regression import RangeRegression
+from labquake_explorer.utils.job_runner import JobRunner, Job, JobCancelled
+from labquake_explorer.utils.instrumentation import Instrumentation, instrumentation
 
 __all__ = [
     'LabquakeExplorerConfig',
-    'CohesiveCrack'
+    'CohesiveCrack',
+    'RangeRegression',
+    'JobRunner',
+    'Job',
+    'JobCancelled',
+    'Instrumentation',
+    'instrumentation'
 ]
\ No newline at end of file
@@ -1,4 +1,7 @@
 """Cohesive crack analytical calculations module."""
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -15,16 +18,109 @@ class CohesiveCrack:
         'X_c': 13.8e-3   # Cohesive zone size (m)
     }
 
+    # Results of stress_field(..., use_cache=True), most recently used last
+    stress_field_cache_size = 4
+    _stress_field_cache = OrderedDict()
+
     @classmethod
     def delta_sigmas(cls, x, y, X_c, C_f, C_s, C_d, nu, Gamma, E):
         """Calculate stress fluctuations with explicit parameters."""
+        constants = cls._field_constants(X_c, C_f, C_s, C_d, nu, Gamma, E)
+        return cls._evaluate_stresses(x, y, X_c, *constants)
+
+    @classmethod
+    def stress_field(cls, x, y, X_c=None, C_f=None, C_s=None, C_d=None, nu=None, Gamma=None, E=None,
+                     chunk_size=2 ** 18, n_workers=1, use_cache=False, dtype=np.float64):
+        """Evaluate Sxx, Sxy and Syy over a 2-D (x, y) grid in memory-bounded chunks.
+
+        Args:
+            x: x coordinates (m). If both x and y are 1-D they are treated as the
+                axes of a meshgrid, otherwise they are broadcast against each other.
+            y: y coordinates (m), distance from the fault plane.
+            X_c, C_f, C_s, C_d, nu, Gamma, E: Model parameters; None uses default_params.
+            chunk_size: Maximum number of grid points evaluated at once.
+            n_workers: Number of threads evaluating chunks concurrently.
+            use_cache: Reuse the result of a previous call with identical parameters and grid.
+            dtype: Floating point type of the returned arrays.
+
+        Returns:
+            tuple: (Sxx, Sxy, Syy), each shaped (len(y), len(x)) for 1-D axes. Cached
+                results are returned read-only.
+        """
+        params = dict(X_c=X_c, C_f=C_f, C_s=C_s, C_d=C_d, nu=nu, Gamma=Gamma, E=E)
+        params = {k: float(cls.default_params[k] if v is None else v) for k, v in params.items()}
+
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if x.ndim == 1 and y.ndim == 1:
+            x, y = x[np.newaxis, :], y[:, np.newaxis]
+        shape = np.broadcast_shapes(x.shape, y.shape)
+        dtype = np.dtype(dtype)
+
+        key = None
+        if use_cache:
+            key = cls._stress_field_key(x, y, params, dtype)
+            if key in cls._stress_field_cache:
+                cls._stress_field_cache.move_to_end(key)
+                return cls._stress_field_cache[key]
+
+        constants = cls._field_constants(**params)
+        Sxx, Sxy, Syy = (np.empty(shape, dtype=dtype) for _ in range(3))
+        if len(shape) == 0:
+            Sxx[()], Sxy[()], Syy[()] = cls._evaluate_stresses(x, y, params['X_c'], *constants)
+            return Sxx, Sxy, Syy
+
+        # Chunk along the leading axis; slicing broadcast views does not copy
+        xb = np.broadcast_to(x, shape)
+        yb = np.broadcast_to(y, shape)
+        row_size = int(np.prod(shape[1:], dtype=np.int64))
+        rows_per_chunk = max(1, int(chunk_size) // max(row_size, 1))
+        chunks = [slice(i, min(i + rows_per_chunk, shape[0])) for i in range(0, shape[0], rows_per_chunk)]
+
+        def evaluate_chunk(rows):
+            Sxx[rows], Sxy[rows], Syy[rows] = cls._evaluate_stresses(xb[rows], yb[rows], params['X_c'], *constants)
+
+        if n_workers > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                list(executor.map(evaluate_chunk, chunks))
+        else:
+            for rows in chunks:
+                evaluate_chunk(rows)
+
+        if key is not None:
+            for S in (Sxx, Sxy, Syy):
+                S.setflags(write=False)
+            cls._stress_field_cache[key] = (Sxx, Sxy, Syy)
+            while len(cls._stress_field_cache) > cls.stress_field_cache_size:
+                cls._stress_field_cache.popitem(last=False)
+        return Sxx, Sxy, Syy
+
+    @classmethod
+    def clear_stress_field_cache(cls):
+        """Drop all cached stress_field results."""
+        cls._stress_field_cache.clear()
+
+    @staticmethod
+    def _stress_field_key(x, y, params, dtype):
+        digest = hashlib.blake2b(digest_size=16)
+        for array in (x, y):
+            digest.update(str(array.shape).encode())
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return tuple(sorted(params.items())) + (dtype.str, digest.hexdigest())
+
+    @classmethod
+    def _field_constants(cls, X_c, C_f, C_s, C_d, nu, Gamma, E):
+        """Parameter-only terms shared by every evaluated point."""
         alpha_s_value = cls.alpha_s(C_f, C_s)
         alpha_d_value = cls.alpha_d(C_f, C_d)
         D_value = cls.D(alpha_s_value, alpha_d_value)
         A2 = cls.compute_A2(C_f, C_s, nu, D_value)
         K2 = cls.compute_K2(Gamma, E, nu, A2)
         tau_p = cls.compute_tau_p(K2, X_c)
-        
+        return alpha_s_value, alpha_d_value, D_value, tau_p
+
+    @classmethod
+    def _evaluate_stresses(cls, x, y, X_c, alpha_s_value, alpha_d_value, D_value, tau_p):
         z_d_value = x + 1j * alpha_d_value * y
         z_s_value = x + 1j * alpha_s_value * y
         
@@ -68,17 +164,11 @@ class CohesiveCrack:
         y_values = [1e-8, 0.1e-3, 0.5e-3, 1.0e-3, 2.0e-3, 5e-3, 10e-3, 15e-3]
         x = np.linspace(-50e-3, 50e-3, 8192)
 
+        _, Sxy, _ = cls.stress_field(x, np.asarray(y_values))
+
         plt.figure(figsize=(8, 6))
         for i, y in enumerate(y_values):
-            Sxy, _ = cls.delta_sigmas(x, y, 
-                                    cls.default_params['X_c'],
-                                    cls.default_params['C_f'],
-                                    cls.default_params['C_s'],
-                                    cls.default_params['C_d'],
-                                    cls.default_params['nu'],
-                                    cls.default_params['Gamma'],
-                                    cls.default_params['E'])
-            plt.plot(x * 1000, Sxy / 1e5 + i * 5, '-.', label=f'y = {y * 1e3:.1f} mm')
+            plt.plot(x * 1000, Sxy[i] / 1e5 + i * 5, '-.', label=f'y = {y * 1e3:.1f} mm')
 
         plt.xlabel('Rupture tip position x (mm)')
         plt.ylabel('Stress fluctuation (MPa)')
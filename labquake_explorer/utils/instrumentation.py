@@ -0,0 +1,130 @@
+"""Timing and byte counters for the hot paths of Labquake Explorer"""
+import cProfile
+import re
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+
+
+class Instrumentation:
+    """Collects the duration and the bytes handled by every run of named operations.
+
+    Operations are timed with the timed() context manager or decorator, which costs
+    about a microsecond per call. With profiling enabled, every timed run is also
+    profiled with cProfile and followed by a tracemalloc snapshot, both written to
+    the profile directory as <operation>-<run>.prof and <operation>-<run>.tracemalloc
+    (read them with pstats and tracemalloc.Snapshot.load). Only the outermost timed
+    operation of a thread is profiled.
+    """
+
+    def __init__(self):
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+        self.byte_counts: Dict[str, int] = defaultdict(int)
+        self.profile_dir: Optional[Path] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._runs: Dict[str, int] = defaultdict(int)
+
+    def enable_profiling(self, profile_dir: Path) -> None:
+        """Dump cProfile statistics and tracemalloc snapshots of every timed operation to profile_dir."""
+        self.profile_dir = Path(profile_dir)
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        print(f"Profiling operations to {self.profile_dir.resolve()}")
+
+    def record(self, name: str, seconds: float, n_bytes: int = 0) -> None:
+        """Add one run of an operation measured elsewhere."""
+        with self._lock:
+            self.durations[name].append(seconds)
+            self.byte_counts[name] += int(n_bytes)
+
+    def count_bytes(self, name: str, n_bytes: int) -> None:
+        """Add bytes read, written or produced by an operation."""
+        with self._lock:
+            self.byte_counts[name] += int(n_bytes)
+
+    @contextmanager
+    def timed(self, name: str):
+        """Time a block, or a function when used as a decorator, as one run of operation name."""
+        profiler = None
+        depth = getattr(self._local, 'depth', 0)
+        if self.profile_dir is not None and depth == 0:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:  # another profiler is active in this thread
+                profiler = None
+        self._local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._local.depth = depth
+            with self._lock:
+                self.durations[name].append(elapsed)
+                self._runs[name] += 1
+                run = self._runs[name]
+            if profiler is not None:
+                profiler.disable()
+                self._dump(name, run, profiler)
+
+    def _dump(self, name: str, run: int, profiler: cProfile.Profile) -> None:
+        stem = self.profile_dir / f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', name)}-{run:04d}"
+        try:
+            profiler.dump_stats(f"{stem}.prof")
+            if tracemalloc.is_tracing():
+                tracemalloc.take_snapshot().dump(f"{stem}.tracemalloc")
+        except OSError as e:
+            print(f"Could not write profile of {name}: {e}")
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Statistics of every operation: count, total, mean, median, p95 and max (s), and bytes."""
+        with self._lock:
+            names = sorted(set(self.durations) | set(self.byte_counts))
+            durations = {name: np.asarray(self.durations.get(name, []), dtype=float) for name in names}
+            byte_counts = dict(self.byte_counts)
+        result = {}
+        for name in names:
+            d = durations[name]
+            result[name] = {
+                'count': len(d),
+                'total': float(d.sum()),
+                'mean': float(d.mean()) if len(d) else np.nan,
+                'median': float(np.median(d)) if len(d) else np.nan,
+                'p95': float(np.percentile(d, 95)) if len(d) else np.nan,
+                'max': float(d.max()) if len(d) else np.nan,
+                'bytes': byte_counts.get(name, 0),
+            }
+        return result
+
+    def histogram(self, name: str, bins: int = 20) -> tuple:
+        """Histogram of the durations of an operation on logarithmic bins.
+
+        Returns:
+            tuple: (counts, bin edges in seconds)
+        """
+        with self._lock:
+            d = np.asarray(self.durations.get(name, []), dtype=float)
+        d = d[d > 0]
+        if len(d) == 0:
+            return np.array([], dtype=int), np.array([])
+        lo, hi = np.log10(d.min()), np.log10(d.max())
+        edges = np.logspace(lo - 0.05, hi + 0.05, bins + 1)
+        return np.histogram(d, edges)
+
+    def reset(self) -> None:
+        """Forget all recorded runs; profile files keep being numbered on"""
+        with self._lock:
+            self.durations.clear()
+            self.byte_counts.clear()
+
+
+# Shared by the whole application
+instrumentation = Instrumentation()
@@ -0,0 +1,182 @@
+"""Background jobs for long-running operations of Labquake Explorer"""
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+from labquake_explorer.utils.instrumentation import instrumentation
+
+
+class JobCancelled(Exception):
+    """Raised inside a thread job that noticed it was cancelled"""
+
+
+class Job:
+    """Handle of a submitted job, shared by the worker and the UI.
+
+    Thread jobs receive their Job as first argument and may call report() and
+    check_cancelled(). Process jobs run a picklable function in another process; they
+    can only be cancelled before they start.
+    """
+
+    def __init__(self, job_id: int, name: str, use_process: bool):
+        self.id = job_id
+        self.name = name
+        self.use_process = use_process
+        self.future: Optional[Future] = None
+        self.fraction: Optional[float] = None   # Progress in [0, 1]; None if unknown
+        self.message = ""
+        self.submitted = time.monotonic()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._cancel = threading.Event()
+
+    def report(self, fraction: Optional[float] = None, message: Optional[str] = None) -> None:
+        """Progress of a thread job; safe to call from the worker."""
+        self.check_cancelled()
+        self.fraction = fraction
+        if message is not None:
+            self.message = message
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def check_cancelled(self) -> None:
+        if self._cancel.is_set():
+            raise JobCancelled(f"{self.name} was cancelled")
+
+    def cancel(self) -> None:
+        """Ask the job to stop; a queued job never starts, a running thread job stops at its next report."""
+        self._cancel.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    @property
+    def status(self) -> str:
+        if self.future is None or not self.future.done():
+            if self.future is not None and self.future.running():
+                return "cancelling" if self.cancelled else "running"
+            return "queued"
+        if self.future.cancelled() or isinstance(self.future.exception(), JobCancelled):
+            return "cancelled"
+        return "failed" if self.future.exception() is not None else "done"
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished if self.finished is not None else time.monotonic()) - self.submitted
+
+
+class JobRunner:
+    """Runs jobs on a thread pool (I/O) or a process pool (CPU-bound fits).
+
+    Completion callbacks are not run on the worker: they are queued and run by
+    dispatch(), which the UI calls from the Tk thread, e.g. from an after() loop.
+    Tk widgets must therefore only be touched in callbacks, never in the job itself.
+    """
+
+    def __init__(self, n_threads: int = 4, n_processes: Optional[int] = None, keep_finished: int = 20):
+        self.n_threads = n_threads
+        self.n_processes = n_processes if n_processes is not None else max(1, (os.cpu_count() or 2) - 1)
+        self.keep_finished = keep_finished      # Finished jobs kept in the job list
+        self.jobs: List[Job] = []
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._done: "queue.Queue[tuple]" = queue.Queue()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, name: str, fn: Callable[..., Any], *args, use_process: bool = False,
+               on_done: Optional[Callable[[Any], None]] = None,
+               on_error: Optional[Callable[[BaseException], None]] = None,
+               operation: Optional[str] = None, **kwargs) -> Job:
+        """Start a job.
+
+        Args:
+            name: Shown in the job status panel
+            fn: Called as fn(job, *args, **kwargs) on a worker thread, or as
+                fn(*args, **kwargs) in a worker process if use_process is set (fn and its
+                arguments must then be picklable)
+            use_process: Run on the process pool
+            on_done: Called with the result, on the thread calling dispatch
+            on_error: Called with the exception, on the thread calling dispatch; the
+                error is printed if None. Not called for cancelled jobs.
+            operation: Record the run time of the job under this operation name in
+                the instrumentation; for process jobs the time includes waiting for a
+                free worker, since the start in the other process is not observed
+
+        Returns:
+            The Job; job.future is the underlying concurrent.futures.Future
+        """
+        job = Job(next(self._ids), name, use_process)
+        if use_process:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.n_processes)
+            job.future = self._processes.submit(fn, *args, **kwargs)
+        else:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.n_threads, thread_name_prefix="job")
+            job.future = self._threads.submit(self._run_thread_job, fn, job, *args, **kwargs)
+        with self._lock:
+            self.jobs.append(job)
+
+        def finished(future):
+            job.finished = time.monotonic()
+            if operation is not None and not future.cancelled() and future.exception() is None:
+                instrumentation.record(operation, job.finished - (job.started or job.submitted))
+            self._done.put((job, on_done, on_error))
+        job.future.add_done_callback(finished)
+        return job
+
+    @staticmethod
+    def _run_thread_job(fn, job, *args, **kwargs):
+        job.started = time.monotonic()
+        return fn(job, *args, **kwargs)
+
+    def dispatch(self) -> int:
+        """Run the callbacks of finished jobs; call from the Tk thread. Returns their number."""
+        n = 0
+        while True:
+            try:
+                job, on_done, on_error = self._done.get_nowait()
+            except queue.Empty:
+                break
+            n += 1
+            if job.status == "cancelled":
+                print(f"{job.name} cancelled.")
+                continue
+            error = job.future.exception()
+            try:
+                if error is None:
+                    if on_done is not None:
+                        on_done(job.future.result())
+                elif on_error is not None:
+                    on_error(error)
+                else:
+                    print(f"{job.name} failed: {error}")
+            except Exception as e:
+                print(f"Error handling the result of {job.name}: {e}")
+        if n:
+            self._prune()
+        return n
+
+    def _prune(self) -> None:
+        with self._lock:
+            finished = [job for job in self.jobs if job.finished is not None]
+            for job in finished[:max(len(finished) - self.keep_finished, 0)]:
+                self.jobs.remove(job)
+
+    def active(self) -> List[Job]:
+        with self._lock:
+            return [job for job in self.jobs if job.finished is None]
+
+    def shutdown(self) -> None:
+        """Cancel all jobs and stop the pools without waiting for running jobs."""
+        for job in self.active():
+            job.cancel()
+        for pool in (self._threads, self._processes):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._threads = self._processes = None
@@ -0,0 +1,99 @@
+"""Constant-time linear regression over index ranges of a series"""
+import numpy as np
+from typing import Optional
+
+
+class RangeRegression:
+    """Least-squares line fits over any index range of a fixed (x, y) series.
+
+    Cumulative sums of x, y, x^2, xy and y^2 are computed once, so the fit over a
+    range costs a handful of operations regardless of its length. The sums are taken
+    about the series means to limit cancellation. Short ranges, where that
+    cancellation would cost the most digits, are fitted directly from the data at a
+    bounded cost. Results match scipy.stats.linregress, except that the standard
+    error of a nearly perfect fit over a long range keeps only a few digits.
+    """
+
+    direct_below = 4096  # Ranges shorter than this are fitted directly
+
+    def __init__(self, x: Optional[np.ndarray], y: np.ndarray):
+        """
+        Args:
+            x: x values; the sample index is used if None or empty
+            y: y values
+        """
+        y = np.asarray(y, dtype=float)
+        x = np.arange(len(y), dtype=float) if x is None or len(x) == 0 else np.asarray(x, dtype=float)
+        if len(x) != len(y):
+            raise ValueError("x and y must have the same length")
+        self.x = x - x.mean() if len(x) else x
+        self.y = y - y.mean() if len(y) else y
+        self.x_mean = x.mean() if len(x) else 0.0
+        self.y_mean = y.mean() if len(y) else 0.0
+
+        def prefix(values):
+            return np.concatenate([[0.0], np.cumsum(values)])
+        self._sx = prefix(self.x)
+        self._sy = prefix(self.y)
+        self._sxx = prefix(self.x * self.x)
+        self._sxy = prefix(self.x * self.y)
+        self._syy = prefix(self.y * self.y)
+
+    def __len__(self) -> int:
+        return len(self.y)
+
+    def sums(self, start, end) -> tuple:
+        """Number of points and centered sums (Sxx, Sxy, Syy, mean x, mean y) over start..end inclusive."""
+        lo = np.minimum(start, end)
+        hi = np.maximum(start, end) + 1
+        n = hi - lo
+        sx = self._sx[hi] - self._sx[lo]
+        sy = self._sy[hi] - self._sy[lo]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mx = sx / n
+            my = sy / n
+        sxx = self._sxx[hi] - self._sxx[lo] - sx * mx
+        sxy = self._sxy[hi] - self._sxy[lo] - sx * my
+        syy = self._syy[hi] - self._syy[lo] - sy * my
+        return n, sxx, sxy, syy, mx, my
+
+    def sse(self, start, end) -> np.ndarray:
+        """Sum of squared residuals of the least-squares line over start..end inclusive."""
+        n, sxx, sxy, syy, _, _ = self.sums(np.asarray(start), np.asarray(end))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.maximum(np.where(sxx > 0, syy - sxy ** 2 / sxx, syy), 0.0)
+
+    def fit(self, start, end) -> tuple:
+        """Fit y = slope * x + intercept over indices start..end, both included.
+
+        start and end may be given in either order, and may be arrays to fit many
+        ranges at once.
+
+        Returns:
+            tuple: (slope, intercept, r, stderr) as in scipy.stats.linregress; NaN for
+                ranges of fewer than two points or constant x
+        """
+        if np.ndim(start) == 0 and np.ndim(end) == 0 and abs(int(end) - int(start)) + 1 < self.direct_below:
+            lo, hi = min(start, end), max(start, end) + 1
+            x = self.x[lo:hi]
+            y = self.y[lo:hi]
+            n = len(x)
+            mx, my = (x.mean(), y.mean()) if n else (np.nan, np.nan)
+            dx, dy = x - mx, y - my
+            sxx, sxy, syy = dx @ dx, dx @ dy, dy @ dy
+        else:
+            start, end = np.asarray(start), np.asarray(end)
+            n, sxx, sxy, syy, mx, my = self.sums(start, end)
+            sxx = np.maximum(sxx, 0.0)
+            syy = np.maximum(syy, 0.0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.where((n >= 2) & (sxx > 0), sxy / sxx, np.nan)
+            r = np.where((sxx > 0) & (syy > 0), sxy / np.sqrt(sxx * syy), 0.0)
+            r = np.clip(r, -1.0, 1.0)
+            stderr = np.where(n > 2, np.sqrt(np.maximum((1 - r ** 2) * syy / sxx, 0.0) / (n - 2)), 0.0)
+        intercept = (my + self.y_mean) - slope * (mx + self.x_mean)
+        result = (slope, intercept, np.where(np.isfinite(slope), r, np.nan), np.where(np.isfinite(slope), stderr, np.nan))
+        if np.ndim(slope) == 0:
+            return tuple(float(v) for v in result)
+        return result
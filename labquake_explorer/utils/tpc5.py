@@ -2,6 +2,10 @@
 ''' Python TPC5 Helper Modules for reading HDF5 generated by TranAX Application Software         '''
 ''' Copyright 2017 Elsys AG      '''
 ''' ******************************************************************************************** '''
+from datetime import datetime
+import os
+import h5py
+import numpy as np
 
 
 ''' Get Raw Dataset Block'''
@@ -86,4 +90,261 @@ def getNChannels(fileRef, block = 1):
     return len(fileRef['/measurements/00000001/channels'])
 
 def getNSamples(fileRef, channel, block = 1):
-    return len(fileRef[getBlockName(channel,block)+'raw'])
\ No newline at end of file
+    return len(fileRef[getBlockName(channel,block)+'raw'])
+
+def getVoltageSlice(fileRef, channel, start, stop, block = 1):
+    channel_group           = fileRef[getChannelGroupName(channel)]
+    dataset_name            = getDataSetName(channel,block)
+
+    ''' Get Scaling Parameters '''
+    binToVoltageFactor      = channel_group.attrs['binToVoltFactor']
+    binToVoltageConstant    = channel_group.attrs['binToVoltConstant']
+    analogMask              = channel_group.attrs['analogMask']
+
+    ''' Read only the requested samples '''
+    analogData              = fileRef[dataset_name][start:stop] & analogMask
+    return analogData * binToVoltageFactor + binToVoltageConstant
+
+def getBlockNumbers(fileRef, channel = 1):
+    return sorted(int(name) for name in fileRef[getChannelGroupName(channel) + 'blocks'])
+
+def getNBlocks(fileRef, channel = 1):
+    return len(fileRef[getChannelGroupName(channel) + 'blocks'])
+
+''' Time of the first sample of a block: from its trigger time and trigger sample, else its start time '''
+def getBlockStartTime(fileRef, channel, block = 1):
+    block_attrs = fileRef[getBlockName(channel, block)].attrs
+    if 'triggerTimeSeconds' in block_attrs:
+        return float(block_attrs['triggerTimeSeconds']) - float(block_attrs.get('triggerSample', 0)) / float(block_attrs['sampleRateHertz'])
+    if 'startTime' in block_attrs:
+        try:
+            return float(block_attrs['startTime'])
+        except (TypeError, ValueError):
+            pass
+    return 0.0
+
+''' Global sample index of all blocks of a channel, in time order. Sample i of a block is sample
+    startSamples[k] + i of the recording, counted from the first sample of the earliest block,
+    so windows can be read across block boundaries with getVoltageWindow. All blocks must share
+    the sample rate of the first one. '''
+def getBlockIndex(fileRef, channel = 1):
+    blocks      = getBlockNumbers(fileRef, channel)
+    sampleRate  = float(getSampleRate(fileRef, channel, blocks[0]))
+    startTimes  = np.array([getBlockStartTime(fileRef, channel, block) for block in blocks])
+    nSamples    = np.array([getNSamples(fileRef, channel, block) for block in blocks], dtype = np.int64)
+    order       = np.argsort(startTimes, kind = 'stable')
+    startTimes  = startTimes[order] - startTimes[order[0]]
+    return {
+        'blocks':       np.array(blocks, dtype = np.int64)[order],
+        'startTimes':   startTimes,
+        'startSamples': np.round(startTimes * sampleRate).astype(np.int64),
+        'nSamples':     nSamples[order],
+        'sampleRate':   sampleRate,
+    }
+
+''' Number of samples from the first sample of the earliest block to the end of the last block '''
+def getNSamplesTotal(blockIndex):
+    return int((blockIndex['startSamples'] + blockIndex['nSamples']).max())
+
+''' Boolean array of global samples [start, stop), True where a block holds the sample and
+    False in gaps between blocks and outside the recording '''
+def getSampleCoverage(blockIndex, start, stop):
+    covered = np.zeros(max(stop - start, 0), dtype = bool)
+    for blockStart, n in zip(blockIndex['startSamples'], blockIndex['nSamples']):
+        a, b = max(start, blockStart), min(stop, blockStart + n)
+        if b > a:
+            covered[a - start:b - start] = True
+    return covered
+
+''' Voltage of global samples [start, stop) of a channel, read from every block they overlap.
+    Samples outside all blocks (gaps between segments, before or after the recording) are set
+    to fill. '''
+def getVoltageWindow(fileRef, channel, start, stop, blockIndex = None, fill = np.nan):
+    if blockIndex is None:
+        blockIndex = getBlockIndex(fileRef, channel)
+    out         = np.full(max(stop - start, 0), fill, dtype = float)
+    for block, blockStart, n in zip(blockIndex['blocks'], blockIndex['startSamples'], blockIndex['nSamples']):
+        a, b = max(start, blockStart), min(stop, blockStart + n)
+        if b > a:
+            out[a - start:b - start] = getVoltageSlice(fileRef, channel, int(a - blockStart), int(b - blockStart), int(block))
+    return out
+
+''' Voltage of global samples [start, stop) of several channels, read into one buffer of shape
+    (len(channels), stop - start). Raw samples are read with read_direct straight into the rows
+    of out, converted to dtype by HDF5, then masked and scaled in place, so no temporary copy
+    of the channel is made (except an int16 copy of a block piece when its analogMask clears
+    bits). out may be any array whose rows are contiguous, e.g. a slice of a larger buffer.
+    Samples outside all blocks are set to fill. '''
+def readChannels(fileRef, channels, start, stop, out = None, dtype = np.float32, blockIndex = None, fill = np.nan):
+    channels    = list(channels)
+    if blockIndex is None:
+        blockIndex = getBlockIndex(fileRef, channels[0])
+    if out is None:
+        out = np.empty((len(channels), max(stop - start, 0)), dtype = dtype)
+    elif out.shape != (len(channels), max(stop - start, 0)):
+        raise ValueError("out must have shape (%d, %d)" % (len(channels), max(stop - start, 0)))
+    out[...]    = fill
+
+    for i, channel in enumerate(channels):
+        channel_group           = fileRef[getChannelGroupName(channel)]
+        binToVoltageFactor      = channel_group.attrs['binToVoltFactor']
+        binToVoltageConstant    = channel_group.attrs['binToVoltConstant']
+        analogMask              = int(channel_group.attrs['analogMask'])
+        for block, blockStart, n in zip(blockIndex['blocks'], blockIndex['startSamples'], blockIndex['nSamples']):
+            a, b = max(start, blockStart), min(stop, blockStart + n)
+            if b <= a:
+                continue
+            dataset = fileRef[getDataSetName(channel, int(block))]
+            row     = out[i, a - start:b - start]
+            source  = np.s_[a - blockStart:b - blockStart]
+            if analogMask & 0xFFFF == 0xFFFF:
+                dataset.read_direct(row, source)
+            else:
+                counts = np.empty(b - a, dtype = dataset.dtype)
+                dataset.read_direct(counts, source)
+                counts &= np.array(analogMask).astype(dataset.dtype)
+                row[...] = counts
+            row *= binToVoltageFactor
+            row += binToVoltageConstant
+    return out
+
+''' Raw counts of global samples [start, stop) of several channels, read like readChannels into
+    an int16 buffer of shape (len(channels), stop - start) and masked in place. Samples outside
+    all blocks are set to fill, which integer counts cannot mark as missing; see getSampleCoverage.
+    Returns (counts, binToVoltFactor, binToVoltConstant), with the scaling of every channel, so
+    that voltage = counts * factor + constant row by row. '''
+def readChannelCounts(fileRef, channels, start, stop, out = None, blockIndex = None, fill = 0):
+    channels    = list(channels)
+    if blockIndex is None:
+        blockIndex = getBlockIndex(fileRef, channels[0])
+    if out is None:
+        out = np.empty((len(channels), max(stop - start, 0)), dtype = np.int16)
+    out[...]    = fill
+    factors     = np.empty(len(channels))
+    constants   = np.empty(len(channels))
+
+    for i, channel in enumerate(channels):
+        channel_group   = fileRef[getChannelGroupName(channel)]
+        factors[i]      = channel_group.attrs['binToVoltFactor']
+        constants[i]    = channel_group.attrs['binToVoltConstant']
+        analogMask      = np.array(int(channel_group.attrs['analogMask'])).astype(out.dtype)
+        for block, blockStart, n in zip(blockIndex['blocks'], blockIndex['startSamples'], blockIndex['nSamples']):
+            a, b = max(start, blockStart), min(stop, blockStart + n)
+            if b <= a:
+                continue
+            row = out[i, a - start:b - start]
+            fileRef[getDataSetName(channel, int(block))].read_direct(row, np.s_[a - blockStart:b - blockStart])
+            row &= analogMask
+    return out, factors, constants
+
+''' ******************************************************************************************** '''
+''' Writing                                                                                      '''
+''' ******************************************************************************************** '''
+
+''' Create a channel group with its scaling attributes '''
+def createChannel(fileRef, channel, binToVoltFactor, binToVoltConstant = 0.0, name = None, physicalUnit = 'V',
+                  voltToPhysicalFactor = 1.0, voltToPhysicalConstant = 0.0, analogMask = -1, markerMask = 0):
+    channel_group                                   = fileRef.require_group(getChannelGroupName(channel))
+    channel_group.attrs['name']                     = name if name is not None else "Channel %d" % channel
+    channel_group.attrs['physicalUnit']             = physicalUnit
+    channel_group.attrs['binToVoltFactor']          = float(binToVoltFactor)
+    channel_group.attrs['binToVoltConstant']        = float(binToVoltConstant)
+    channel_group.attrs['voltToPhysicalFactor']     = float(voltToPhysicalFactor)
+    channel_group.attrs['voltToPhysicalConstant']   = float(voltToPhysicalConstant)
+    channel_group.attrs['analogMask']               = np.int16(analogMask)
+    channel_group.attrs['markerMask']               = np.int16(markerMask)
+    return channel_group
+
+''' Create an empty raw block of int16 counts, chunked and compressed, filled by the write functions.
+    startTime is the date string TranAX stores, the current time if None; the time of the
+    block's samples is given by triggerSample and triggerTime. '''
+def createBlock(fileRef, channel, nSamples, sampleRate, block = 1, triggerSample = 0, triggerTime = 0.0,
+                startTime = None, chunkSize = 2 ** 16, compression = 'gzip', compressionLevel = 4):
+    block_group                                 = fileRef.require_group(getBlockName(channel, block))
+    block_group.attrs['sampleRateHertz']        = float(sampleRate)
+    block_group.attrs['triggerSample']          = int(triggerSample)
+    block_group.attrs['triggerTimeSeconds']     = float(triggerTime)
+    block_group.attrs['startTime']              = startTime if startTime is not None else datetime.now().isoformat()
+
+    ''' Shuffling the bytes of the int16 samples lets gzip compress noisy records much better '''
+    options = {'compression': compression, 'shuffle': compression is not None}
+    if compression == 'gzip':
+        options['compression_opts'] = compressionLevel
+    return block_group.create_dataset('raw', shape = (nSamples,), dtype = np.int16,
+                                      chunks = (max(1, min(chunkSize, nSamples)),), **options)
+
+''' Quantize voltage to raw counts with the scaling of a channel, clipping at the int16 range '''
+def voltageToBin(fileRef, channel, voltage):
+    channel_group           = fileRef[getChannelGroupName(channel)]
+    binToVoltageFactor      = channel_group.attrs['binToVoltFactor']
+    binToVoltageConstant    = channel_group.attrs['binToVoltConstant']
+    counts                  = np.rint((np.asarray(voltage) - binToVoltageConstant) / binToVoltageFactor)
+    return np.clip(counts, -32768, 32767).astype(np.int16)
+
+def writeRawSlice(fileRef, channel, start, data, block = 1):
+    fileRef[getDataSetName(channel, block)][start:start + len(data)] = data
+
+def writeVoltageSlice(fileRef, channel, start, voltage, block = 1):
+    writeRawSlice(fileRef, channel, start, voltageToBin(fileRef, channel, voltage), block)
+
+''' Sorted, disjoint sample windows covering the union of windows, clipped to the recording '''
+def mergeWindows(windows, nSamples):
+    windows = sorted((max(int(start), 0), min(int(stop), nSamples)) for start, stop in windows)
+    merged  = []
+    for start, stop in windows:
+        if stop <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return [tuple(window) for window in merged]
+
+''' Copy the samples of a recording inside windows to a new file, one block per merged window.
+    Raw counts are copied chunk by chunk without requantization. The triggerSample of every
+    block is shifted so that sample times relative to the trigger are kept. A numeric
+    startTime is shifted by the samples removed before the block; the date string written
+    by TranAX is copied unchanged. Returns the merged (start, stop) windows. A partly
+    written dstPath is removed if copying fails. '''
+def trimToWindows(srcPath, dstPath, windows, block = 1, chunkSize = 2 ** 20, compression = 'gzip', compressionLevel = 4):
+    try:
+        return _trimToWindows(srcPath, dstPath, windows, block, chunkSize, compression, compressionLevel)
+    except BaseException:
+        if os.path.exists(dstPath):
+            os.remove(dstPath)
+        raise
+
+def _trimToWindows(srcPath, dstPath, windows, block, chunkSize, compression, compressionLevel):
+    with h5py.File(srcPath, 'r') as src, h5py.File(dstPath, 'w') as dst:
+        ranges = mergeWindows(windows, getNSamples(src, 1, block))
+        for key, value in src.attrs.items():
+            dst.attrs[key] = value
+        measurement = dst.require_group('/measurements/00000001')
+        for key, value in src['/measurements/00000001'].attrs.items():
+            measurement.attrs[key] = value
+
+        for channel in range(1, getNChannels(src) + 1):
+            src_channel = src[getChannelGroupName(channel)]
+            dst_channel = dst.require_group(getChannelGroupName(channel))
+            for key, value in src_channel.attrs.items():
+                dst_channel.attrs[key] = value
+
+            src_block   = src[getBlockName(channel, block)]
+            src_raw     = src_block['raw']
+            sampleRate  = src_block.attrs['sampleRateHertz']
+            for k, (start, stop) in enumerate(ranges, start = 1):
+                raw         = createBlock(dst, channel, stop - start, sampleRate, block = k,
+                                          compression = compression, compressionLevel = compressionLevel)
+                dst_block   = dst[getBlockName(channel, k)]
+                for key, value in src_block.attrs.items():
+                    dst_block.attrs[key] = value
+                dst_block.attrs['triggerSample'] = int(src_block.attrs.get('triggerSample', 0)) - start
+                if 'startTime' in src_block.attrs:
+                    try:
+                        dst_block.attrs['startTime'] = float(src_block.attrs['startTime']) + start / sampleRate
+                    except (TypeError, ValueError):
+                        pass
+                for a in range(start, stop, chunkSize):
+                    b = min(a + chunkSize, stop)
+                    raw[a - start:b - start] = src_raw[a:b]
+    return ranges
\ No newline at end of file
@@ -0,0 +1,46 @@
+"""Synthetic experiments shared by the tests and benchmarks"""
+import numpy as np
+import pytest
+
+from labquake_explorer.data.data_manager import DataManager
+from tests.synthetic_experiment import SyntheticExperiment
+
+
+@pytest.fixture(scope="session")
+def generator():
+    return SyntheticExperiment(n_runs=2, n_events=10, duration=1.0, strain_sample_rate=5e5)
+
+
+@pytest.fixture(scope="session")
+def experiment_dir(tmp_path_factory, generator):
+    """A two-run experiment with 16 gauges at 500 kHz, saved as NPZ and HDF5"""
+    path = tmp_path_factory.mktemp("synthetic")
+    experiment = generator.write(path / "experiment.npz")
+    data_manager = DataManager()
+    data_manager.data = experiment
+    data_manager.save_file(path / "experiment.h5")
+    return path
+
+
+@pytest.fixture
+def data_manager(experiment_dir):
+    data_manager = DataManager()
+    data_manager.load_file(experiment_dir / "experiment.npz")
+    return data_manager
+
+
+@pytest.fixture
+def run(data_manager):
+    return data_manager.data['runs'][0]
+
+
+@pytest.fixture
+def events(data_manager, run):
+    """Full-rate strain windows of +-1 ms around every event of the first run"""
+    return data_manager.event_processor.extract_events(run, run['event_indices'], 1e-3)
+
+
+@pytest.fixture
+def locations(generator):
+    """Gauge locations (mm), decreasing along the rupture so that speeds come out positive"""
+    return -np.arange(generator.n_channels) * generator.gauge_spacing * 1e3
@@ -0,0 +1,162 @@
+"""Synthetic labquake experiments for tests and benchmarks of Labquake Explorer"""
+import h5py
+import numpy as np
+from pathlib import Path
+from typing import Dict, Any, List
+from labquake_explorer.data.czm_fitter import CZMFitter
+from labquake_explorer.data.data_manager import DataManager
+from labquake_explorer.utils import tpc5
+
+
+class SyntheticExperiment:
+    """Writes experiments shaped like the recorded ones, at a configurable scale.
+
+    Every run is a stick-slip sequence: the shear stress rises at a constant loading
+    rate and drops at each event, the slip jumps by a proportional amount, and the
+    normal stress stays near a constant level. At each event a rupture crosses the
+    strain gauge array from the first gauge at a random speed; every gauge records the
+    shear strain of the cohesive zone model (CZMFitter.model_strain) plus a static
+    drop and white noise, converted to the bridge voltage that
+    DataProcessor.voltage_to_strain expects. The strain of every run is written to a
+    TPC5 file next to the experiment file, as int16 counts in the layout read by
+    utils.tpc5, and its block-averaged copy is stored in the run like the downsampled
+    strain of a recording.
+
+    Example:
+        experiment = SyntheticExperiment(n_runs=2, n_events=50, duration=10.0).write(Path("synthetic.h5"))
+    """
+
+    # Bridge constants of DataProcessor.voltage_to_strain
+    volts_per_strain = 4.98 * 1000 * 2.12 / 2
+
+    def __init__(self, n_runs: int = 1, n_events: int = 20, duration: float = 4.0, n_channels: int = 16,
+                 sample_rate: float = 1e3, strain_sample_rate: float = 1e6, strain_time_offset: float = 0.05,
+                 gauge_spacing: float = 0.01, gauge_distance: float = 3.5e-3, noise: float = 1e-3,
+                 voltage_range: float = 2.0, seed: int = 0):
+        self.n_runs = n_runs
+        self.n_events = n_events                        # Events per run
+        self.duration = duration                        # Length of every run (s)
+        self.n_channels = n_channels                    # Strain gauges
+        self.sample_rate = sample_rate                  # Mechanical data (Hz)
+        self.strain_sample_rate = strain_sample_rate    # Full-rate strain (Hz)
+        self.strain_time_offset = strain_time_offset    # Start of the strain recording in the run (s)
+        self.gauge_spacing = gauge_spacing              # Distance between gauges along the fault (m)
+        self.gauge_distance = gauge_distance            # Distance of the gauges from the fault (m)
+        self.noise = noise                              # Standard deviation of the strain noise (V)
+        self.voltage_range = voltage_range              # Full scale of the int16 strain counts (V)
+        self.seed = seed
+        self.fitter = CZMFitter()
+
+    def make_run(self, run_idx: int) -> Dict[str, Any]:
+        """Mechanical data, event indices and true rupture parameters of one run, without strain"""
+        rng = np.random.default_rng([self.seed, run_idx])
+        n = int(round(self.duration * self.sample_rate))
+        time = np.arange(n) / self.sample_rate
+
+        # Evenly spread events, jittered by up to a quarter of their spacing
+        spacing = 0.9 * self.duration / self.n_events
+        event_times = 0.05 * self.duration + spacing * (np.arange(self.n_events) + 0.5)
+        event_times += rng.uniform(-0.25, 0.25, self.n_events) * spacing
+        event_indices = np.round(event_times * self.sample_rate).astype(np.int64)
+
+        stress_drop = rng.uniform(0.05, 0.2, self.n_events)     # MPa
+        rupture_speed = rng.uniform(1600, 2450, self.n_events)  # m/s, below the Rayleigh wave speed
+        loading_rate = stress_drop.mean() / spacing             # MPa/s
+        after_event = np.searchsorted(event_indices, np.arange(n), side='right')
+        dropped = np.concatenate([[0.0], np.cumsum(stress_drop)])[after_event]
+
+        normal_stress = 4.0 + 0.01 * rng.standard_normal(n)
+        shear_stress = 2.0 + loading_rate * time - dropped + 0.002 * rng.standard_normal(n)
+        lp_velocity = np.full(n, 1e-2)                          # mm/s
+        return {
+            'name': f"run{run_idx:02d}",
+            'time': time,
+            'normal_stress': normal_stress,
+            'shear_stress': shear_stress,
+            'friction': shear_stress / normal_stress,
+            'LP_velocity': lp_velocity,
+            'LP_displacement': np.cumsum(lp_velocity) / self.sample_rate,
+            'displacement': 0.5 * dropped + 1e-3 * time,         # mm
+            'event_indices': event_indices,
+            'true_rupture_speed': rupture_speed,
+            'true_stress_drop': stress_drop,
+        }
+
+    def event_waveforms(self, run: Dict[str, Any], k: int, window: float = 1e-3) -> tuple:
+        """Noise-free strain voltage of every gauge around event k of a run
+
+        Returns:
+            tuple: (first strain sample of the window, waveforms of shape (n_channels, m))
+        """
+        fs = self.strain_sample_rate
+        t_event = run['time'][run['event_indices'][k]] - self.strain_time_offset
+        start = int(round((t_event - window) * fs))
+        t = (start + np.arange(int(round(2 * window * fs)))) / fs - t_event
+        speed = run['true_rupture_speed'][k]
+        t_tips = np.arange(self.n_channels) * self.gauge_spacing / speed
+        exy = self.fitter.model_strain(t[np.newaxis, :], t_tips[:, np.newaxis], self.gauge_distance,
+                                       speed, 13.8e-3, 0.21)
+        exy = np.nan_to_num(exy)
+        # Static strain drop behind the rupture front, proportional to the stress drop
+        G = self.fitter.E / (2 * (1 + self.fitter.nu))
+        drop = run['true_stress_drop'][k] * 1e6 / G
+        exy = exy - drop * (t[np.newaxis, :] > t_tips[:, np.newaxis])
+        return start, exy * self.volts_per_strain
+
+    def write_strain(self, path: Path, run: Dict[str, Any], run_idx: int = 0, chunk_size: int = 2 ** 20) -> Dict[str, Any]:
+        """Write the full-rate strain of a run to a TPC5 file, chunk by chunk
+
+        Returns:
+            The 'strain' entry of the run, with the block-averaged strain
+        """
+        rng = np.random.default_rng([self.seed, run_idx, 1])
+        fs = self.strain_sample_rate
+        n_samples = int(round((self.duration - self.strain_time_offset) * fs))
+        factor = self.voltage_range / 32767
+        q = max(int(round(fs / self.sample_rate)), 1)
+        events = [self.event_waveforms(run, k) for k in range(len(run['event_indices']))]
+
+        downsampled = np.zeros((self.n_channels, n_samples // q))
+        with h5py.File(path, 'w') as f:
+            for j in range(self.n_channels):
+                tpc5.createChannel(f, j + 1, factor, name=f"strain {j + 1}")
+                tpc5.createBlock(f, j + 1, n_samples, fs)
+                for lo in range(0, n_samples, chunk_size):
+                    hi = min(lo + chunk_size, n_samples)
+                    v = self.noise * rng.standard_normal(hi - lo)
+                    for start, waves in events:
+                        a, b = max(start, lo), min(start + waves.shape[1], hi)
+                        if b > a:
+                            v[a - lo:b - lo] += waves[j, a - start:b - start]
+                        # Static drop persists until the end of the recording
+                        if start + waves.shape[1] < hi:
+                            v[max(start + waves.shape[1], lo) - lo:] += waves[j, -1]
+                    tpc5.writeVoltageSlice(f, j + 1, lo, v)
+                    a, b = -(-lo // q), hi // q
+                    downsampled[j, a:b] = v[a * q - lo:b * q - lo].reshape(-1, q).mean(axis=1)
+
+        return {
+            'filename': path.name,
+            'filename_downsampled': '',
+            'time_offset': self.strain_time_offset,
+            'time': np.arange(downsampled.shape[1]) * q / fs,
+            'raw': downsampled,
+        }
+
+    def write(self, path: Path) -> Dict[str, Any]:
+        """Write the experiment to an NPZ or HDF5 file and the strain of its runs next to it
+
+        Returns:
+            The experiment data, as DataManager.load_file gives it for an NPZ file
+        """
+        path = Path(path)
+        runs: List[Dict[str, Any]] = []
+        for i in range(self.n_runs):
+            run = self.make_run(i)
+            if self.n_channels > 0:
+                run['strain'] = self.write_strain(path.parent / f"{path.stem}_run{i:02d}.tpc5", run, i)
+            runs.append(run)
+        data_manager = DataManager()
+        data_manager.data = {'name': path.stem, 'runs': runs}
+        data_manager.save_file(path)
+        return data_manager.data
@@ -0,0 +1,195 @@
+"""Analysis engines checked against the known events of synthetic experiments"""
+import numpy as np
+import pytest
+from scipy import signal, stats
+
+from labquake_explorer.data.arrival_picker import ArrivalPicker
+from labquake_explorer.data.data_processor import FilterPipeline
+from labquake_explorer.data.event_analyzer import EventAnalyzer
+from labquake_explorer.data.event_detector import EventDetector
+from labquake_explorer.data.event_similarity import EventSimilarity
+from labquake_explorer.data.event_stacker import EventStacker
+from labquake_explorer.data.rupture_speed import RuptureSpeedEstimator
+from labquake_explorer.data.stream_detector import StreamingDetector
+from labquake_explorer.data.template_matcher import TemplateMatcher
+from labquake_explorer.data.time_delay import TimeDelayEstimator
+from labquake_explorer.utils.cohesive_crack import CohesiveCrack
+from labquake_explorer.utils.range_regression import RangeRegression
+
+SEARCH_WINDOW = (-2e-4, 8e-4)
+
+
+@pytest.mark.parametrize("method", ["peak", "aic"])
+def test_picked_rupture_speeds(run, events, locations, method):
+    fitting = [True] * len(locations)
+    speeds = ArrivalPicker(method=method).pick_run(events, fitting_channels=fitting, locations=locations,
+                                                   search_window=SEARCH_WINDOW)
+    np.testing.assert_allclose(speeds, run['true_rupture_speed'], rtol=0.05)
+    assert all(event['rupture_speed'] == pytest.approx(speed) for event, speed in zip(events, speeds))
+
+
+def test_cross_correlation_rupture_speeds(generator, run, events, locations):
+    pipeline = FilterPipeline(fs=generator.strain_sample_rate).highpass(2000)
+    speeds = TimeDelayEstimator().estimate_run(events, range(len(locations)), locations,
+                                               search_window=SEARCH_WINDOW, pipeline=pipeline)
+    np.testing.assert_allclose(speeds, run['true_rupture_speed'], rtol=0.05)
+
+
+def test_theil_sen_ignores_an_outlier():
+    locations = -np.arange(8) * 10.0                       # mm
+    speeds = np.array([1500.0, 2500.0])                    # m/s
+    arrivals = -1e-3 * locations[np.newaxis, :] / speeds[:, np.newaxis] + 0.01
+    arrivals[0, 3] += 1e-3
+    estimated, uncertainty, fit = RuptureSpeedEstimator().speeds(arrivals, locations)
+    np.testing.assert_allclose(estimated, speeds)
+    np.testing.assert_array_equal(fit['n'], [8, 8])
+    assert uncertainty[1] == pytest.approx(0.0, abs=1e-6)
+
+    # A masked channel is left out, and fewer than two channels give no speed
+    masked, _, fit = RuptureSpeedEstimator().speeds(arrivals, locations, mask=np.arange(8) != 3)
+    assert masked[0] == pytest.approx(speeds[0])
+    assert fit['n'][0] == 7
+    single, _, _ = RuptureSpeedEstimator().speeds(arrivals, locations, mask=np.arange(8) == 0)
+    assert np.isnan(single).all()
+
+
+def test_theil_sen_has_no_uncertainty_from_two_gauges():
+    locations = np.array([0.0, -10.0, -20.0])
+    arrivals = np.array([[0.0, 5e-6, 10e-6]])
+    speed, uncertainty, _ = RuptureSpeedEstimator().speeds(arrivals[:, :2], locations[:2])
+    assert speed[0] == pytest.approx(2000.0)
+    assert np.isnan(uncertainty[0])
+    _, uncertainty, _ = RuptureSpeedEstimator().speeds(arrivals, locations)
+    assert np.isfinite(uncertainty[0])
+
+
+def test_event_detector_finds_every_slip(run):
+    peaks = EventDetector(min_drop=0.03, max_duration=5).drops(run['shear_stress'])['peak']
+    assert len(peaks) == len(run['event_indices'])
+    # The stress peaks a few samples before the slip
+    lead = np.asarray(run['event_indices']) - peaks
+    assert ((lead >= 0) & (lead <= 3)).all()
+
+
+def test_streaming_detector_triggers_at_events(data_manager, run, generator):
+    catalog = data_manager.event_processor.scan_strain_triggers(run, StreamingDetector(n_sta=50, n_lta=5000))
+    event_times = np.asarray(run['time'])[run['event_indices']]
+    for j in range(generator.n_channels):
+        times = catalog['time'][catalog['channel'] == j]
+        nearest = np.min(np.abs(times[:, np.newaxis] - event_times), axis=0)
+        assert (nearest < 2e-3).all()
+
+
+def test_template_matching_finds_every_event(data_manager, run, events):
+    templates, offsets = TemplateMatcher.templates_from_events(events, [0], SEARCH_WINDOW)
+    detections = data_manager.event_processor.match_strain_templates(run, templates, offsets,
+                                                                      TemplateMatcher(threshold=0.7))
+    assert set(run['event_indices']) <= set(detections['event_index'].tolist())
+
+
+def test_similarity_and_stack_skip_disabled_channels(data_manager, run):
+    mask = [True] * len(run['strain']['raw'])
+    mask[5] = False
+    run['strain']['enabled_channels'] = mask
+    events = data_manager.event_processor.extract_events(run, run['event_indices'], 1e-3)
+
+    result = EventSimilarity().cluster_run(events, SEARCH_WINDOW)
+    assert np.isfinite(result['cc']).all()
+    np.testing.assert_allclose(np.diag(result['cc']), 1.0)
+    assert all('family' in event for event in events)
+
+    stack = EventStacker(alignment='event').stack_events(events)
+    assert 5 not in stack['channels'].tolist()
+    assert np.isfinite(stack['mean']).all()
+
+
+def sawtooth(n_cycles=3, n_loading=200, n_drop=20):
+    """Stress rising linearly with displacement, then dropping while the fault slips"""
+    loading = np.linspace(0.0, 1.0, n_loading, endpoint=False)
+    drop = np.linspace(1.0, 0.0, n_drop, endpoint=False)
+    y = np.concatenate([np.concatenate([loading, drop]) for _ in range(n_cycles)])
+    x = np.concatenate([np.concatenate([np.linspace(0, 1e-3, n_loading, endpoint=False),
+                                        np.linspace(1e-3, 5e-3, n_drop, endpoint=False)]) + k * 5e-3
+                        for k in range(n_cycles)])
+    return x, y
+
+
+def test_event_analyzer_on_sawtooth():
+    x, y = sawtooth()
+    analyzer = EventAnalyzer()
+    start, end, unloading_start, unloading_end, peak, trough = analyzer.find_points(x, y, center=420)
+    assert peak == 420
+    assert trough == 440
+    assert start == 220
+    assert start < end <= peak
+    assert peak < unloading_start < unloading_end <= trough
+    result = analyzer.results(x, y, [start, end, unloading_start, unloading_end, peak, trough])
+    assert result['loading_stiffness'] == pytest.approx(1.0 / 200 / (1e-3 / 200))
+    assert result['stress_drop'] == pytest.approx(y[420] - y[440])
+
+
+def test_event_analyzer_rejects_short_ranges():
+    x, y = sawtooth()
+    analyzer = EventAnalyzer()
+    # The first slip has no loading minimum inside the record
+    with pytest.raises(ValueError, match="before the record"):
+        analyzer.find_points(x[2:], y[2:], center=197)
+    # A drop from one sample to the next is too short to fit
+    x, y = sawtooth(n_drop=1)
+    with pytest.raises(ValueError, match="only 2 points"):
+        analyzer.find_points(x, y, center=401)
+
+
+def test_range_regression_matches_linregress():
+    rng = np.random.default_rng(3)
+    x = np.cumsum(rng.random(10000))
+    y = 3.0 * x + rng.standard_normal(len(x)) * 50
+    regression = RangeRegression(x, y)
+    for start, end in [(0, 9999), (10, 20), (5000, 9000), (7, 8)]:
+        expected = stats.linregress(x[start:end + 1], y[start:end + 1])
+        fit = regression.fit(start, end)
+        np.testing.assert_allclose(fit[:2], [expected.slope, expected.intercept], rtol=1e-9)
+        assert fit[2] == pytest.approx(expected.rvalue, rel=1e-9)
+    slopes = regression.fit(np.array([0, 100]), np.array([5000, 9999]))[0]
+    np.testing.assert_allclose(slopes, [stats.linregress(x[0:5001], y[0:5001]).slope,
+                                        stats.linregress(x[100:], y[100:]).slope], rtol=1e-9)
+    assert np.isnan(regression.fit(3, 3)[0])
+
+
+def test_filter_pipeline_matches_scipy():
+    fs = 1e5
+    rng = np.random.default_rng(4)
+    data = rng.standard_normal((3, 5000)) + np.linspace(0, 5, 5000)
+    sos = signal.butter(4, 1000, btype='highpass', fs=fs, output='sos')
+    np.testing.assert_allclose(FilterPipeline(fs).highpass(1000).apply(data), signal.sosfiltfilt(sos, data, axis=-1),
+                               atol=1e-10)
+    np.testing.assert_allclose(FilterPipeline(fs).savgol(51).apply(data), signal.savgol_filter(data, 51, 2, axis=-1),
+                               atol=1e-10)
+    detrended = FilterPipeline(fs).detrend().apply(data)
+    np.testing.assert_allclose(detrended, signal.detrend(data, axis=-1), atol=1e-10)
+    assert FilterPipeline(fs).highpass(1000) == FilterPipeline(fs).highpass(1000.0)
+    assert not FilterPipeline(fs)
+
+
+def test_stress_field_matches_pointwise_stresses():
+    params = CohesiveCrack.default_params
+    x = np.linspace(-0.05, 0.05, 301)
+    y = np.array([0.5e-3, 3.5e-3, 10e-3])
+    fields = CohesiveCrack.stress_field(x, y, chunk_size=100, n_workers=2)
+    for row, y_row in enumerate(y):
+        pointwise = CohesiveCrack.delta_sigmas(x, y_row, params['X_c'], params['C_f'], params['C_s'], params['C_d'],
+                                               params['nu'], params['Gamma'], params['E'])
+        for field, expected in zip(fields, pointwise):
+            assert field.shape == (len(y), len(x))
+            np.testing.assert_allclose(field[row], expected, rtol=1e-12, atol=0)
+
+
+def test_catalog_lists_picked_events(data_manager, run, events, locations):
+    ArrivalPicker(method='peak').pick_run(events, fitting_channels=[True] * len(locations), locations=locations,
+                                          search_window=SEARCH_WINDOW)
+    run['events'] = events
+    data_manager.catalog.set_data(data_manager.data)
+    frame = data_manager.catalog.frame
+    assert len(data_manager.catalog) == len(events)
+    np.testing.assert_array_equal(frame['run'], 0)
+    np.testing.assert_allclose(frame['rupture_speed'], run['true_rupture_speed'], rtol=0.05)
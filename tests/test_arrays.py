@@ -0,0 +1,81 @@
+"""RawStrainArray and UniformTimeAxis, and saving them in experiment files"""
+import numpy as np
+import pytest
+
+from labquake_explorer.data.data_manager import DataManager
+from labquake_explorer.data.raw_strain_array import RawStrainArray
+from labquake_explorer.data.uniform_time_axis import UniformTimeAxis
+
+
+@pytest.fixture
+def raw():
+    rng = np.random.default_rng(2)
+    counts = rng.integers(-32768, 32767, size=(4, 500), dtype=np.int16)
+    return RawStrainArray(counts, [1e-4, 2e-4, 3e-4, 4e-4], [0.0, 0.1, -0.1, 0.5])
+
+
+def test_raw_strain_array_scales_like_voltage(raw):
+    voltage = raw.counts * raw.factor[:, np.newaxis] + raw.constant[:, np.newaxis]
+    np.testing.assert_allclose(np.asarray(raw), voltage)
+    np.testing.assert_allclose(raw[2], voltage[2])
+    np.testing.assert_allclose(raw[:, 10:20], voltage[:, 10:20])
+    np.testing.assert_allclose(raw[[0, 3], ::7], voltage[[0, 3], ::7])
+    np.testing.assert_allclose(raw[1, 5], voltage[1, 5])
+    np.testing.assert_allclose(raw * 2 - 1, voltage * 2 - 1)
+    np.testing.assert_allclose(raw.mean(axis=1), voltage.mean(axis=1))
+    np.testing.assert_allclose(np.asarray(raw.scaled(3.0, 1.0)), voltage * 3 + 1)
+
+
+def test_raw_strain_array_missing_samples(raw):
+    missing = np.zeros(raw.shape[1], dtype=bool)
+    missing[100:200] = True
+    gaps = RawStrainArray(raw.counts, [1e-4, np.nan, 3e-4, 4e-4], raw.constant, missing=missing)
+    voltage = np.asarray(gaps)
+    assert np.isnan(voltage[1]).all()
+    assert np.isnan(voltage[:, 100:200]).all()
+    assert np.isfinite(voltage[[0, 2, 3]][:, missing == False]).all()  # noqa: E712
+    np.testing.assert_array_equal(np.isnan(gaps[:, 50:150]), np.isnan(voltage[:, 50:150]))
+
+    quantized = RawStrainArray.from_voltage(voltage, 1e-4)
+    np.testing.assert_array_equal(np.isnan(np.asarray(quantized)), np.isnan(voltage))
+
+
+def test_uniform_time_axis_matches_array():
+    axis = UniformTimeAxis(0.05, 2e-6, 1000)
+    values = axis.values()
+    np.testing.assert_allclose(np.asarray(axis[10:500:3]), values[10:500:3], rtol=0, atol=1e-12)
+    np.testing.assert_allclose(np.asarray(axis - 0.05), values - 0.05, rtol=0, atol=1e-12)
+    assert axis[-1] == values[-1]
+
+    v = np.concatenate([values[::37], values[::53] + 1e-6, [0.0, 1.0]])
+    for side in ('left', 'right'):
+        np.testing.assert_array_equal(axis.searchsorted(v, side), np.searchsorted(values, v, side))
+    np.testing.assert_array_equal(axis.index(values[::41] + 0.4e-6), np.arange(1000)[::41])
+
+    assert UniformTimeAxis.from_array(values).n == 1000
+    assert UniformTimeAxis.from_array(np.r_[values, values[-1] + 1.0]) is None
+
+
+@pytest.mark.parametrize("suffix", [".h5", ".npz"])
+def test_compact_arrays_survive_saving(tmp_path, data_manager, run, suffix):
+    mask = [True] * len(run['strain']['raw'])
+    mask[3] = False
+    run['strain']['enabled_channels'] = mask
+    events = data_manager.event_processor.extract_events(run, run['event_indices'][:2], 1e-3, keep_counts=True)
+    run['events'] = events
+    data_manager.save_file(tmp_path / f"saved{suffix}")
+
+    loaded = DataManager()
+    loaded.load_file(tmp_path / f"saved{suffix}")
+    saved = loaded.data['runs'][0]['events']
+    assert len(saved) == len(events)
+    for before, after in zip(events, saved):
+        assert isinstance(after['time'], UniformTimeAxis)
+        np.testing.assert_array_equal(np.asarray(after['time']), np.asarray(before['time']))
+        original = after['strain']['original']
+        assert isinstance(original['time'], UniformTimeAxis)
+        assert isinstance(original['raw'], RawStrainArray)
+        assert original['raw'].counts.dtype == np.int16
+        np.testing.assert_array_equal(np.asarray(original['raw']), np.asarray(before['strain']['original']['raw']))
+        assert np.isnan(original['raw'][3]).all()
+        assert list(after['strain']['enabled_channels']) == mask
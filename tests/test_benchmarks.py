@@ -0,0 +1,57 @@
+"""Benchmarks of the data pipeline on synthetic experiments
+
+Needs pytest-benchmark. Store a baseline, then compare later runs against it:
+
+    pytest tests/test_benchmarks.py --benchmark-autosave
+    pytest tests/test_benchmarks.py --benchmark-compare --benchmark-compare-fail=median:10%
+
+Baselines are saved under .benchmarks/ and are machine specific.
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from labquake_explorer.data.czm_fitter import CZMFitter
+from labquake_explorer.data.data_manager import DataManager
+from labquake_explorer.utils.cohesive_crack import CohesiveCrack
+
+
+@pytest.mark.parametrize("suffix", [".npz", ".h5"])
+def test_load_file(benchmark, experiment_dir, suffix):
+    data_manager = DataManager()
+    benchmark(data_manager.load_file, experiment_dir / f"experiment{suffix}")
+    assert len(data_manager.data['runs']) == 2
+
+
+@pytest.mark.parametrize("suffix", [".npz", ".h5"])
+def test_save_file(benchmark, data_manager, tmp_path, suffix):
+    path = tmp_path / f"saved{suffix}"
+    benchmark(data_manager.save_file, path)
+    assert path.stat().st_size > 0
+
+
+@pytest.mark.parametrize("fixed_length", [False, True])
+def test_extract_events(benchmark, data_manager, fixed_length):
+    run = data_manager.data['runs'][0]
+    events = benchmark(data_manager.event_processor.extract_events, run, run['event_indices'], 1e-3,
+                       fixed_length=fixed_length)
+    assert len(events) == 10
+    assert events[0]['strain']['original']['raw'].shape[0] == 16
+
+
+def test_delta_sigmas(benchmark):
+    params = CohesiveCrack.default_params
+    x = np.linspace(-0.05, 0.05, 200_000)
+    sxx, sxy, syy = benchmark(CohesiveCrack.delta_sigmas, x, 3.5e-3, params['X_c'], params['C_f'], params['C_s'],
+                              params['C_d'], params['nu'], params['Gamma'], params['E'])
+    assert np.isfinite(sxy).all()
+
+
+def test_czm_fit(benchmark):
+    fitter = CZMFitter()
+    t = np.arange(-50e-6, 100e-6, 1e-6)
+    exy = fitter.model_strain(t, 0.0, 3.5e-3, 2400.0, 10e-3, 0.3)
+    exy = exy + 1e-8 * np.random.default_rng(0).standard_normal(len(t))
+    result = benchmark(fitter.fit_single, t, exy, 0.0, 50e-6, 2400.0, 3.5e-3, 0.2, 13.8e-3)
+    assert result['Gc'] == pytest.approx(0.3, rel=0.2)
@@ -0,0 +1,82 @@
+"""Extracting the strain windows of events from TPC5 recordings"""
+import numpy as np
+import pytest
+
+from labquake_explorer.data.raw_strain_array import RawStrainArray
+from labquake_explorer.data.uniform_time_axis import UniformTimeAxis
+
+WINDOW = 1e-3
+
+
+def raw_windows(events):
+    return [np.asarray(event['strain']['original']['raw'], dtype=float) for event in events]
+
+
+def assert_same_windows(a, b, atol):
+    assert len(a) == len(b)
+    for x, y in zip(a, b):
+        assert x.shape == y.shape
+        np.testing.assert_array_equal(np.isnan(x), np.isnan(y))
+        np.testing.assert_allclose(x, y, rtol=0, atol=atol, equal_nan=True)
+
+
+@pytest.fixture
+def atol(events):
+    """Float32 rounding and int16 quantization of the strain windows"""
+    return 1e-3 * max(np.nanmax(np.abs(x)) for x in raw_windows(events))
+
+
+def test_windows_are_centered_on_events(generator, run, events):
+    fs = generator.strain_sample_rate
+    for event in events:
+        original = event['strain']['original']
+        assert isinstance(original['time'], UniformTimeAxis)
+        assert original['raw'].shape == (generator.n_channels, round(2 * WINDOW * fs))
+        assert original['time'][0] == pytest.approx(event['event_time'] - WINDOW, abs=1 / fs)
+        # The downsampled strain spans the same 2 * window
+        assert event['strain']['time'][0] == pytest.approx(event['event_time'] - WINDOW)
+        assert event['strain']['time'][-1] == pytest.approx(event['event_time'] + WINDOW)
+        assert event['strain']['raw'].shape[1] == len(event['strain']['time'])
+
+
+def test_fixed_length_and_raw_counts_match_float_windows(data_manager, run, events, atol):
+    processor = data_manager.event_processor
+    fixed = processor.extract_events(run, run['event_indices'], WINDOW, fixed_length=True)
+    assert all(event['strain']['original']['raw'].dtype == np.float32 for event in fixed + events)
+    assert_same_windows(raw_windows(fixed), raw_windows(events), atol)
+
+    counts = processor.extract_events(run, run['event_indices'], WINDOW, keep_counts=True)
+    assert all(isinstance(event['strain']['original']['raw'], RawStrainArray) for event in counts)
+    assert_same_windows(raw_windows(counts), raw_windows(events), atol)
+
+
+def test_disabled_channels_are_nan_in_every_path(data_manager, run, events, atol):
+    processor = data_manager.event_processor
+    mask = [True] * len(run['strain']['raw'])
+    mask[0] = mask[7] = False
+    run['strain']['enabled_channels'] = mask
+    variants = [processor.extract_events(run, run['event_indices'], WINDOW, **kwargs)
+                for kwargs in ({}, {'fixed_length': True}, {'keep_counts': True})]
+    for extracted in variants:
+        for x, y in zip(raw_windows(extracted), raw_windows(events)):
+            assert np.isnan(x[[0, 7]]).all()
+            np.testing.assert_allclose(x[mask], y[mask], rtol=0, atol=atol)
+        assert processor.enabled_channels(extracted).tolist() == [j for j in range(len(mask)) if mask[j]]
+
+    tensor = processor.extract_event_tensor(run, run['event_indices'], WINDOW)
+    assert tensor.valid.all()
+
+
+def test_trimmed_recording_gives_the_same_windows(tmp_path, data_manager, run, events, atol):
+    processor = data_manager.event_processor
+    run['strain'] = processor.trim_strain_file(run, run['event_indices'], WINDOW, tmp_path / "trimmed.tpc5")
+    for kwargs in ({}, {'fixed_length': True}, {'keep_counts': True}):
+        trimmed = processor.extract_events(run, run['event_indices'], WINDOW, **kwargs)
+        assert_same_windows(raw_windows(trimmed), raw_windows(events), atol)
+
+
+def test_windows_before_the_recording_are_invalid(data_manager, run):
+    # The strain recording starts time_offset after the first mechanical sample
+    tensor = data_manager.event_processor.extract_event_tensor(run, [0, run['event_indices'][0]], WINDOW)
+    np.testing.assert_array_equal(tensor.valid, [False, True])
+    assert np.isnan(tensor.data[0]).all()
@@ -0,0 +1,85 @@
+"""TPC5 writer, trimming and multi-block reading"""
+import h5py
+import numpy as np
+import pytest
+
+from labquake_explorer.utils import tpc5
+
+FACTOR = 2.0 / 32767
+
+
+def write_recording(path, voltage, fs=1e5, start_time=None):
+    """A single-block TPC5 file with one channel per row of voltage"""
+    with h5py.File(path, 'w') as f:
+        for j, v in enumerate(np.atleast_2d(voltage), start=1):
+            tpc5.createChannel(f, j, FACTOR)
+            tpc5.createBlock(f, j, len(v), fs, startTime=start_time, chunkSize=1000)
+            tpc5.writeVoltageSlice(f, j, 0, v)
+    return path
+
+
+@pytest.fixture
+def voltage():
+    rng = np.random.default_rng(1)
+    return np.cumsum(rng.standard_normal((3, 20000)), axis=1) * 1e-3
+
+
+def test_write_and_read_voltage(tmp_path, voltage):
+    path = write_recording(tmp_path / "rec.tpc5", voltage)
+    with h5py.File(path, 'r') as f:
+        assert tpc5.getNChannels(f) == 3
+        assert tpc5.getNSamples(f, 1) == voltage.shape[1]
+        for j in range(3):
+            np.testing.assert_allclose(tpc5.getVoltageData(f, j + 1), voltage[j], atol=FACTOR / 2 + 1e-12)
+
+
+def test_merge_windows():
+    assert tpc5.mergeWindows([(50, 80), (-10, 20), (70, 90), (200, 300)], 250) == [(0, 20), (50, 90), (200, 250)]
+    assert tpc5.mergeWindows([(10, 10), (300, 400)], 250) == []
+
+
+def test_trim_keeps_sample_times_and_values(tmp_path, voltage):
+    source = write_recording(tmp_path / "rec.tpc5", voltage, start_time='2024-05-01T12:00:00.000000')
+    windows = [(1000, 3000), (2500, 4000), (9000, 9500)]
+    ranges = tpc5.trimToWindows(source, tmp_path / "trim.tpc5", windows)
+    assert ranges == [(1000, 4000), (9000, 9500)]
+
+    with h5py.File(source, 'r') as src, h5py.File(tmp_path / "trim.tpc5", 'r') as dst:
+        assert tpc5.getNBlocks(dst) == 2
+        assert tpc5.getStartTime(dst, 1, 2) == '2024-05-01T12:00:00.000000'
+        index = tpc5.getBlockIndex(dst)
+        # Global sample 0 of the trimmed file is sample 1000 of the source
+        np.testing.assert_array_equal(index['startSamples'], [0, 8000])
+        np.testing.assert_array_equal(index['nSamples'], [3000, 500])
+        for j in (1, 3):
+            original = tpc5.getVoltageData(src, j)
+            trimmed = tpc5.getVoltageWindow(dst, j, 0, 8500, index)
+            np.testing.assert_array_equal(trimmed[:3000], original[1000:4000])
+            np.testing.assert_array_equal(trimmed[8000:], original[9000:9500])
+            assert np.isnan(trimmed[3000:8000]).all()
+
+
+def test_trim_failure_removes_output(tmp_path, voltage):
+    source = write_recording(tmp_path / "rec.tpc5", voltage)
+    with pytest.raises(KeyError):
+        tpc5.trimToWindows(source, tmp_path / "trim.tpc5", [(0, 100)], block=2)
+    assert not (tmp_path / "trim.tpc5").exists()
+
+
+def test_batched_reads_match_window_reads(tmp_path, voltage):
+    source = write_recording(tmp_path / "rec.tpc5", voltage)
+    tpc5.trimToWindows(source, tmp_path / "trim.tpc5", [(0, 5000), (7000, 12000)])
+    with h5py.File(tmp_path / "trim.tpc5", 'r') as f:
+        index = tpc5.getBlockIndex(f)
+        start, stop = 4000, 9000  # across the gap between the blocks
+        expected = np.stack([tpc5.getVoltageWindow(f, j, start, stop, index) for j in (1, 2, 3)])
+
+        out = np.empty((4, stop - start))
+        tpc5.readChannels(f, [1, 2, 3], start, stop, out=out[1:], blockIndex=index)
+        np.testing.assert_array_equal(out[1:], expected)
+
+        counts, factors, constants = tpc5.readChannelCounts(f, [1, 2, 3], start, stop, blockIndex=index)
+        covered = tpc5.getSampleCoverage(index, start, stop)
+        np.testing.assert_array_equal(covered, np.isfinite(expected[0]))
+        voltage = counts * factors[:, np.newaxis] + constants[:, np.newaxis]
+        np.testing.assert_allclose(voltage[:, covered], expected[:, covered])